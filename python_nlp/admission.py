@@ -0,0 +1,113 @@
+# admission.py - Bounded concurrency with a queue-time deadline for model calls
+
+import asyncio
+from collections import deque
+
+
+class Overloaded(Exception):
+    """A request could not start within the queue deadline"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AdmissionController:
+    """Let at most `max_concurrency` model calls run at once.
+
+    Callers beyond that wait in FIFO order for up to `queue_timeout` seconds;
+    if no slot frees up in time, or `max_queue` callers are already waiting,
+    `admit()` raises Overloaded right away instead of letting the request
+    queue without limit. Runs on the event loop, so needs no locking.
+    """
+
+    def __init__(self, max_concurrency: int, queue_timeout: float = 0.1, max_queue: int = 256):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.active = 0
+        self.peak_active = 0
+        self.peak_queued = 0
+        self.admitted = 0
+        self.waited = 0
+        self.shed = {"queue_timeout": 0, "queue_full": 0}
+        self._waiters = deque()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrency > 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def admit(self):
+        """Take a slot, waiting at most `queue_timeout`; pair with release()"""
+        if not self.enabled:
+            return
+        if self.active < self.max_concurrency and not self._waiters:
+            self._take()
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed["queue_full"] += 1
+            raise Overloaded("queue_full")
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.waited += 1
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        deadline = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            admitted = await waiter
+        except asyncio.CancelledError:
+            # The client went away while waiting. A slot handed over just
+            # before that is passed on to the next waiter
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        finally:
+            deadline.cancel()
+        if not admitted:
+            self.shed["queue_timeout"] += 1
+            raise Overloaded("queue_timeout")
+
+    def release(self):
+        if not self.enabled:
+            return
+        # Hand the slot straight to the oldest waiter, so that newcomers
+        # can't overtake the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.admitted += 1
+                waiter.set_result(True)
+                return
+        self.active -= 1
+
+    def _take(self):
+        self.active += 1
+        self.admitted += 1
+        self.peak_active = max(self.peak_active, self.active)
+
+    def _expire(self, waiter: asyncio.Future):
+        if not waiter.done():
+            self._waiters.remove(waiter)
+            waiter.set_result(False)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_concurrency": self.max_concurrency,
+            "queue_timeout_ms": round(self.queue_timeout * 1000.0, 1),
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "peak_active": self.peak_active,
+            "peak_queued": self.peak_queued,
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "shed": dict(self.shed, total=sum(self.shed.values())),
+        }
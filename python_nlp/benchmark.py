@@ -0,0 +1,323 @@
+# benchmark.py - Latency/throughput benchmark suite for the NLP service
+#
+# Drives the FastAPI app in-process through httpx's ASGI transport (no
+# network) and measures, for each model:
+#   * startup: main.py import, training data + model load and warm-up time
+#   * /chatbot single-message latency percentiles
+#   * /chatbot throughput at several concurrent client counts
+#   * nlp.pipe throughput at several batch sizes
+#
+# Every model is benchmarked in a fresh subprocess, so import and load times
+# are cold and models don't share caches. Results are written as JSON; pass
+# --baseline to compare against a stored run and exit 1 on regressions. A
+# model that fails to run is listed under "failed" and also exits 1.
+#
+# Usage:
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --baseline baseline.json --output latest.json
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import List
+
+# Models trained by config.cfg and improved_config.cfg (see README)
+DEFAULT_MODELS = ["./output/model-best", "./enhanced_output/model-last"]
+
+# Metrics checked against the baseline: (path in the model result, higher is better)
+REGRESSION_METRICS = [
+    (("latency_ms", "p50"), False),
+    (("latency_ms", "p95"), False),
+    (("latency_ms", "p99"), False),
+    (("throughput", "*", "requests_per_second"), True),
+    (("pipe", "*", "messages_per_second"), True),
+    (("startup", "model_load_seconds"), False),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the NutriSaas NLP service in-process")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_MODELS,
+                        help="Model directories (or bow_engine exports) to compare")
+    parser.add_argument("--requests", type=int, default=500,
+                        help="Requests per latency and throughput measurement")
+    parser.add_argument("--warmup", type=int, default=50, help="Untimed requests sent first")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--repeat", type=int, default=3, help="nlp.pipe passes per batch size")
+    parser.add_argument("--data", default="./data/training_data.json",
+                        help="Intents JSON whose patterns are used as benchmark messages")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-caches", action="store_true",
+                        help="Keep the result cache and exact-match fast path on (default: every request hits the model)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against this results JSON and exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative slowdown before a metric counts as a regression (default 0.25)")
+    parser.add_argument("--run-model", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def load_messages(path: str, count: int, seed: int) -> List[str]:
+    """Sample `count` benchmark messages from the training patterns, reproducibly"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    patterns = [pattern for intent in data["intents"] for pattern in intent.get("patterns", [])]
+    rng = random.Random(seed)
+    return [rng.choice(patterns) for _ in range(count)]
+
+
+def percentiles(samples_ms: List[float]) -> dict:
+    ordered = sorted(samples_ms)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 3),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+def describe_model(service) -> dict:
+    """Textcat architecture of the loaded model, read from its own config"""
+    model = service.nlp
+    bow = getattr(model, "meta", {}).get("bow")
+    if bow:
+        return {"architecture": "bow_engine (NumPy)", "ngram_size": bow["ngram_size"]}
+    for name in model.pipe_names:
+        if "textcat" in name:
+            config = model.config["components"][name]["model"]
+            return {"architecture": config.get("@architectures"), "ngram_size": config.get("ngram_size")}
+    return {"architecture": None}
+
+
+async def post_chatbot(client, message: str) -> float:
+    started = time.perf_counter()
+    response = await client.post("/chatbot", json={"message": message})
+    elapsed = (time.perf_counter() - started) * 1000.0
+    response.raise_for_status()
+    return elapsed
+
+
+async def measure_http(service, messages: List[str], args) -> dict:
+    import httpx
+
+    transport = httpx.ASGITransport(app=service.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        for message in messages[:args.warmup]:
+            await post_chatbot(client, message)
+
+        # One request at a time
+        latencies = [await post_chatbot(client, message) for message in messages]
+
+        # N clients sending back to back until the messages run out
+        throughput = {}
+        for clients in args.concurrency:
+            pending = iter(messages)
+            samples = []
+
+            async def client_loop():
+                for message in pending:
+                    samples.append(await post_chatbot(client, message))
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop() for _ in range(clients)))
+            elapsed = time.perf_counter() - started
+            throughput[str(clients)] = {
+                "requests_per_second": round(len(samples) / elapsed, 1),
+                "latency_ms": percentiles(samples),
+            }
+
+    return {"latency_ms": percentiles(latencies), "throughput": throughput}
+
+
+def measure_pipe(service, messages: List[str], args) -> dict:
+    results = {}
+    for batch_size in args.batch_sizes:
+        best = None
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            service.score_messages(messages, batch_size)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        results[str(batch_size)] = {
+            "messages_per_second": round(len(messages) / best, 1),
+            "seconds": round(best, 4),
+        }
+    return results
+
+
+def run_model(args) -> dict:
+    """Benchmark one model; runs in its own interpreter (see main())"""
+    started = time.perf_counter()
+    import main as service
+    import_seconds = time.perf_counter() - started
+
+    # Per-request logging would dominate the timings
+    import logging
+    logging.getLogger("main").setLevel(logging.WARNING)
+    service.request_log.logger.setLevel(logging.WARNING)
+
+    # Same startup the lifespan runs: training data, model, warm-up
+    started = time.perf_counter()
+    if not service.load_service():
+        raise RuntimeError(f"Service failed to start: {service.startup_state['error']}")
+    load_seconds = time.perf_counter() - started
+    startup = {key: value for key, value in service.startup_info().items() if key.endswith("_seconds")}
+    startup.update(import_seconds=round(import_seconds, 3), startup_seconds=round(load_seconds, 3))
+
+    messages = load_messages(args.data, args.requests, args.seed)
+    result = {
+        "model": {"path": service.model_path, "version": service.model_info.get("version"), **describe_model(service)},
+        "startup": startup,
+    }
+    result.update(asyncio.run(measure_http(service, messages, args)))
+    result["pipe"] = measure_pipe(service, messages, args)
+    return result
+
+
+def benchmark_model(path: str, args) -> dict:
+    """Run the benchmark for one model in a fresh interpreter"""
+    env = dict(os.environ, NLP_MODEL_PATH=path, NLP_ENGINE="spacy", NLP_CATALOG_WATCH_SECONDS="0")
+    if not args.keep_caches:
+        env.update(NLP_CACHE_SIZE="0", NLP_FAST_PATH="0")
+    command = [sys.executable, os.path.abspath(__file__), "--run-model", path] + sys.argv[1:]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    if completed.returncode != 0:
+        raise RuntimeError(f"Benchmark of {path} failed:\n{completed.stderr[-2000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def environment_info(args) -> dict:
+    info = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "batch_sizes": args.batch_sizes,
+            "keep_caches": args.keep_caches,
+            "seed": args.seed,
+        },
+    }
+    try:
+        import spacy
+        info["spacy"] = spacy.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def metric_values(result: dict, path: tuple) -> dict:
+    """Flatten one metric path (with '*' for every key) to {label: value}"""
+    values = {"": result}
+    for key in path:
+        expanded = {}
+        for label, node in values.items():
+            if not isinstance(node, dict):
+                continue
+            keys = node.keys() if key == "*" else [key] if key in node else []
+            for child in keys:
+                expanded[f"{label}.{child}".lstrip(".")] = node[child]
+        values = expanded
+    return {label: value for label, value in values.items() if isinstance(value, (int, float))}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of `results` against `baseline`, as printable lines"""
+    regressions = []
+    # A model that failed to run has no numbers to compare, which is not a pass
+    for model, error in results.get("failed", {}).items():
+        if model in baseline.get("models", {}):
+            regressions.append(f"{model}: no result ({error})")
+    for model, result in results["models"].items():
+        previous = baseline.get("models", {}).get(model)
+        if previous is None:
+            print(f"⚠️  {model} is not in the baseline, skipping comparison")
+            continue
+        for path, higher_is_better in REGRESSION_METRICS:
+            current_values = metric_values(result, path)
+            for label, old in metric_values(previous, path).items():
+                new = current_values.get(label)
+                if new is None or old <= 0:
+                    continue
+                change = (new - old) / old
+                worse = -change if higher_is_better else change
+                if worse > tolerance:
+                    regressions.append(f"{model} {label}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def print_summary(results: dict):
+    for model, result in results["models"].items():
+        info = result["model"]
+        print(f"\n📦 {model} ({info.get('architecture')}, ngram_size={info.get('ngram_size')})")
+        startup = result["startup"]
+        print(f"   Startup: import {startup['import_seconds']}s, model load {startup.get('model_load_seconds')}s, "
+              f"warm-up {startup.get('warm_up_seconds')}s")
+        latency = result["latency_ms"]
+        print(f"   /chatbot latency (ms): p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+        for clients, stats in result["throughput"].items():
+            print(f"   {clients:>3} clients: {stats['requests_per_second']:>8} req/s  p99 {stats['latency_ms']['p99']} ms")
+        for batch_size, stats in result["pipe"].items():
+            print(f"   nlp.pipe batch {batch_size:>4}: {stats['messages_per_second']:>9} msg/s")
+
+
+def main():
+    args = parse_args()
+
+    if args.run_model:
+        print(json.dumps(run_model(args)))
+        return 0
+
+    results = {"environment": environment_info(args), "models": {}, "failed": {}}
+    for path in args.models:
+        print(f"⏱️  Benchmarking {path}...")
+        try:
+            results["models"][path] = benchmark_model(path, args)
+        except (RuntimeError, ValueError) as e:
+            print(f"❌ {e}")
+            results["failed"][path] = str(e).strip().splitlines()[-1]
+
+    print_summary(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%} of {args.baseline}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"\n✅ No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+    if results["failed"]:
+        print(f"\n❌ {len(results['failed'])} model(s) failed: {', '.join(results['failed'])}")
+        return 1
+    return 0 if results["models"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,655 @@
+# bow_engine.py - spaCy-free NumPy scorer for TextCatBOW textcat models
+#
+# `config.cfg` trains a spacy.TextCatBOW.v3 textcat: the ORTH hash of every
+# token (plus n-grams of them) is hashed twice into a 2**18 bucket sparse
+# linear layer followed by a softmax. Both the weights and the hashing scheme
+# are small and simple, so they can be exported once and scored with a
+# handful of vectorized NumPy calls, without importing spaCy or thinc.
+#
+# Export:  python bow_engine.py export ./output/model-best ./bow_export [--dtype float16]
+# Check:   python bow_engine.py check ./output/model-best ./bow_export
+#
+# The check scores the full training set with both the spaCy model and the
+# exported engine and fails if any score or ORTH id differs. The service only
+# serves an export whose latest check passed.
+
+import argparse
+import json
+import os
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 2
+ORTH = 65  # spacy.attrs.ORTH
+
+# Always part of the parity check: tokens that are spaCy symbols ("meta" is
+# a dependency label) have fixed ORTH ids instead of hashes
+PARITY_MESSAGES = ["meta", "mi meta de peso", "obj", "number mark", "NOUN VERB ADJ"]
+
+_M64 = np.uint64(0xC6A4A7935BD1E995)
+_R64 = np.uint64(47)
+_MASK64 = 0xFFFFFFFFFFFFFFFF
+_SPANS = re.compile(r"\S+|\s+")
+TOKENIZER_CACHE_SIZE = 100000
+
+
+def murmurhash64a(data: bytes, seed: int) -> int:
+    """MurmurHash64A, the hash spaCy uses for strings (seed 1) and n-grams (seed 0)"""
+    m = 0xC6A4A7935BD1E995
+    length = len(data)
+    h = (seed ^ (length * m)) & _MASK64
+
+    n_blocks = length // 8
+    for i in range(n_blocks):
+        k = int.from_bytes(data[i * 8:i * 8 + 8], "little")
+        k = (k * m) & _MASK64
+        k ^= k >> 47
+        k = (k * m) & _MASK64
+        h ^= k
+        h = (h * m) & _MASK64
+
+    tail = data[n_blocks * 8:]
+    if tail:
+        h ^= int.from_bytes(tail, "little")
+        h = (h * m) & _MASK64
+
+    h ^= h >> 47
+    h = (h * m) & _MASK64
+    h ^= h >> 47
+    return h
+
+
+def murmurhash64a_rows(keys: np.ndarray, seed: int = 0) -> np.ndarray:
+    """Vectorized MurmurHash64A of each row of a (n, k) uint64 array (thinc's ops.ngrams)"""
+    with np.errstate(over="ignore"):
+        h = np.full(keys.shape[0], (seed ^ (keys.shape[1] * 8 * 0xC6A4A7935BD1E995)) & _MASK64, dtype=np.uint64)
+        for column in range(keys.shape[1]):
+            k = keys[:, column] * _M64
+            k ^= k >> _R64
+            k *= _M64
+            h ^= k
+            h *= _M64
+        h ^= h >> _R64
+        h *= _M64
+        h ^= h >> _R64
+    return h
+
+
+def murmurhash3_32_uint64(keys: np.ndarray, seed: int) -> np.ndarray:
+    """Vectorized MurmurHash3_x86_32 of uint64 keys, as in thinc's SparseLinear"""
+    c1 = np.uint32(0xCC9E2D51)
+    c2 = np.uint32(0x1B873593)
+
+    def rotl(x, r):
+        return (x << np.uint32(r)) | (x >> np.uint32(32 - r))
+
+    with np.errstate(over="ignore"):
+        h = np.full(keys.shape[0], seed, dtype=np.uint32)
+        for half in ((keys & np.uint64(0xFFFFFFFF)).astype(np.uint32), (keys >> np.uint64(32)).astype(np.uint32)):
+            k = half * c1
+            k = rotl(k, 15)
+            k *= c2
+            h ^= k
+            h = rotl(h, 13)
+            h = h * np.uint32(5) + np.uint32(0xE6546B64)
+        h ^= np.uint32(8)
+        h ^= h >> np.uint32(16)
+        h *= np.uint32(0x85EBCA6B)
+        h ^= h >> np.uint32(13)
+        h *= np.uint32(0xC2B2AE35)
+        h ^= h >> np.uint32(16)
+    return h
+
+
+@lru_cache(maxsize=100000)
+def orth_hash(token: str) -> int:
+    """spaCy's StringStore hash of a token text, for strings that are not
+    symbols (see BowEngine.orth)"""
+    return murmurhash64a(token.encode("utf-8"), 1)
+
+
+class BowTokenizer:
+    """Port of spaCy's rule-based tokenizer, driven by the exported rules.
+
+    The prefix/suffix/infix/URL regexes and special cases of the trained
+    pipeline's tokenizer are exported as plain `re` patterns, and this class
+    replays the same splitting algorithm (spacy/tokenizer.pyx) on them, so
+    the ORTH features match spaCy's without importing it.
+    """
+
+    def __init__(self, spec: Optional[dict] = None):
+        spec = spec or {}
+        flags = spec.get("flags", 0)
+        self.specials: Dict[str, List[str]] = spec.get("rules", {})
+        self.prefix_search = self._compile(spec.get("prefix"), flags, "search")
+        self.suffix_search = self._compile(spec.get("suffix"), flags, "search")
+        self.infix_finditer = self._compile(spec.get("infix"), flags, "finditer")
+        self.token_match = self._compile(spec.get("token_match"), flags, "match")
+        self.url_match = self._compile(spec.get("url_match"), flags, "match")
+        self._cache: Dict[str, Tuple[str, ...]] = {}
+
+        # Special cases that affix splitting would break up are re-merged
+        # after tokenization (Tokenizer._apply_special_cases)
+        self.special_phrases: Dict[str, List[Tuple[str, ...]]] = {}
+        faster_heuristics = spec.get("faster_heuristics", True)
+        for string in self.specials:
+            if (not faster_heuristics or self._find_prefix(string) or self._find_suffix(string)
+                    or self._has_infix(string) or " " in string):
+                phrase = tuple(token for token, _ in self._tokenize_affixes(string, False))
+                if phrase:
+                    self.special_phrases.setdefault(phrase[0], []).append(phrase)
+
+    @staticmethod
+    def _compile(pattern: Optional[str], flags: int, method: str):
+        return getattr(re.compile(pattern, flags), method) if pattern else None
+
+    def __call__(self, text: str) -> List[str]:
+        tokens = self._tokenize_affixes(text, True)
+        if self.special_phrases:
+            tokens = self._apply_special_cases(tokens)
+        return [token for token, _ in tokens]
+
+    def _tokenize_affixes(self, text: str, with_special_cases: bool) -> List[Tuple[str, bool]]:
+        """(token, followed by a space) pairs, like Tokenizer._tokenize_affixes"""
+        tokens = []
+        for match in _SPANS.finditer(text):
+            span = match.group()
+            # A single space after a token is trailing whitespace; anything
+            # beyond it becomes a whitespace token of its own
+            if span[0] == " " and tokens:
+                tokens[-1] = (tokens[-1][0], True)
+                span = span[1:]
+            if not span:
+                continue
+            if with_special_cases:
+                # Spans repeat a lot across messages; cache them like spaCy does
+                pieces = self._cache.get(span)
+                if pieces is None:
+                    if len(self._cache) >= TOKENIZER_CACHE_SIZE:
+                        self._cache.clear()
+                    pieces = self._cache[span] = tuple(self._tokenize(span))
+            else:
+                pieces = self._tokenize(span, False)
+            tokens.extend((token, False) for token in pieces)
+        return tokens
+
+    def _apply_special_cases(self, tokens: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+        words = [token for token, _ in tokens]
+        matches = []
+        for start, word in enumerate(words):
+            for phrase in self.special_phrases.get(word, ()):
+                end = start + len(phrase)
+                if tuple(words[start:end]) == phrase:
+                    matches.append((start, end))
+        if not matches:
+            return tokens
+
+        # Longest first, then leftmost; drop matches overlapping a better one
+        matches.sort(key=lambda span: (span[1] - span[0], -span[0]))
+        seen, filtered = set(), []
+        for start, end in reversed(matches):
+            if start not in seen and end - 1 not in seen:
+                filtered.append((start, end))
+            seen.update(range(start, end))
+
+        result, i = [], 0
+        for start, end in sorted(filtered):
+            result.extend(tokens[i:start])
+            text = "".join(token + (" " if space else "") for token, space in tokens[start:end - 1]) + tokens[end - 1][0]
+            if text in self.specials:
+                pieces = self.specials[text]
+                result.extend((piece, False) for piece in pieces[:-1])
+                result.append((pieces[-1], tokens[end - 1][1]))
+            else:
+                result.extend(tokens[start:end])
+            i = end
+        result.extend(tokens[i:])
+        return result
+
+    def _has_infix(self, string: str) -> bool:
+        return bool(self.infix_finditer and next(self.infix_finditer(string), None))
+
+    def _find_prefix(self, string: str) -> int:
+        match = self.prefix_search(string) if self.prefix_search else None
+        return match.end() - match.start() if match is not None else 0
+
+    def _find_suffix(self, string: str) -> int:
+        match = self.suffix_search(string) if self.suffix_search else None
+        return match.end() - match.start() if match is not None else 0
+
+    def _tokenize(self, string: str, with_special_cases: bool = True) -> List[str]:
+        specials = self.specials if with_special_cases else {}
+        if string in specials:
+            return list(specials[string])
+
+        # Tokenizer._split_affixes
+        prefixes, suffixes = [], []
+        last_size = 0
+        while string and len(string) != last_size:
+            if self.token_match and self.token_match(string):
+                break
+            if string in specials:
+                break
+            last_size = len(string)
+            pre_len = self._find_prefix(string)
+            if pre_len:
+                prefix, minus_pre = string[:pre_len], string[pre_len:]
+                if minus_pre and minus_pre in specials:
+                    string = minus_pre
+                    prefixes.append(prefix)
+                    break
+            suf_len = self._find_suffix(string[pre_len:])
+            if suf_len:
+                suffix, minus_suf = string[-suf_len:], string[:-suf_len]
+                if minus_suf and minus_suf in specials:
+                    string = minus_suf
+                    suffixes.append(suffix)
+                    break
+            if pre_len and suf_len and (pre_len + suf_len) <= len(string):
+                string = string[pre_len:-suf_len]
+                prefixes.append(prefix)
+                suffixes.append(suffix)
+            elif pre_len:
+                string = minus_pre
+                prefixes.append(prefix)
+            elif suf_len:
+                string = minus_suf
+                suffixes.append(suffix)
+
+        # Tokenizer._attach_tokens
+        tokens = prefixes
+        if string:
+            if string in specials:
+                tokens.extend(specials[string])
+            elif (self.token_match and self.token_match(string)) or (self.url_match and self.url_match(string)):
+                tokens.append(string)
+            else:
+                start = 0
+                for match in (self.infix_finditer(string) if self.infix_finditer else ()):
+                    infix_start, infix_end = match.start(), match.end()
+                    if infix_start == 0:
+                        continue
+                    if infix_start != start:
+                        tokens.append(string[start:infix_start])
+                    if infix_start != infix_end:
+                        tokens.append(string[infix_start:infix_end])
+                    start = infix_end
+                if string[start:]:
+                    tokens.append(string[start:])
+        tokens.extend(reversed(suffixes))
+        return tokens
+
+
+class BowCats:
+    """Minimal stand-in for a Doc: `text`, its tokens and, once scored, `cats`"""
+
+    __slots__ = ("text", "tokens", "cats")
+
+    def __init__(self, text: str, cats: Optional[dict] = None, tokens: Optional[List[str]] = None):
+        self.text = text
+        self.tokens = tokens
+        self.cats = cats
+
+
+class BowTextcat:
+    """The textcat step on its own, for callers that time tokenization separately"""
+
+    def __init__(self, engine: "BowEngine"):
+        self.engine = engine
+
+    def __call__(self, doc: BowCats) -> BowCats:
+        return next(iter(self.pipe([doc])))
+
+    def pipe(self, docs: Iterable[BowCats], batch_size: int = 1000) -> Iterable[BowCats]:
+        docs = list(docs)
+        for start in range(0, len(docs), batch_size):
+            batch = docs[start:start + batch_size]
+            scores = self.engine.score_tokens([doc.tokens for doc in batch])
+            for doc, row in zip(batch, scores):
+                doc.cats = dict(zip(self.engine.labels, row.tolist()))
+                yield doc
+
+
+class BowEngine:
+    """Score messages with exported TextCatBOW weights using NumPy only.
+
+    Exposes the small part of the spaCy `Language` API main.py relies on
+    (`__call__`, `pipe`, `make_doc`, `pipeline`, `pipe_labels`, `meta`,
+    `lang`), so it can be served in place of a spaCy pipeline.
+    """
+
+    def __init__(self, path: str, mmap: bool = True, require_parity: bool = False):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        bow = self.meta["bow"]
+        if bow.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported BOW export format: {bow.get('format_version')} "
+                             f"(re-export with `python bow_engine.py export`)")
+        if require_parity and not bow.get("parity_checked"):
+            raise ValueError("BOW export has not passed `python bow_engine.py check`")
+
+        self.path = path
+        self.lang = self.meta.get("lang", "es")
+        self.labels = list(bow["labels"])
+        self.ngram_size = int(bow["ngram_size"])
+        self.length = int(bow["length"])
+        self.activation = bow["activation"]
+        # (nO, length), memory-mapped so workers share the pages
+        self.W = np.load(os.path.join(path, "weights.npy"), mmap_mode="r" if mmap else None)
+        self.b = np.load(os.path.join(path, "bias.npy")).astype(np.float32)
+        self._weights_cache: Dict[int, np.ndarray] = {}
+
+        with open(os.path.join(path, "tokenizer.json"), "r", encoding="utf-8") as f:
+            self.tokenizer = BowTokenizer(json.load(f))
+        # Strings the StringStore maps to their symbol id rather than a hash
+        with open(os.path.join(path, "symbols.json"), "r", encoding="utf-8") as f:
+            self.symbols: Dict[str, int] = json.load(f)
+        self.pipeline = [("textcat", BowTextcat(self))]
+
+    @property
+    def pipe_labels(self) -> dict:
+        return {"textcat": list(self.labels)}
+
+    def make_doc(self, text: str) -> BowCats:
+        return BowCats(text, tokens=self.tokenizer(text))
+
+    def orth(self, token: str) -> int:
+        """ORTH id of a token text, as in doc.to_array(ORTH)"""
+        symbol = self.symbols.get(token)
+        return symbol if symbol is not None else orth_hash(token)
+
+    def features(self, token_lists: List[List[str]]):
+        """Feature keys of a batch: (doc index per key, ORTH/n-gram hash keys)"""
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(token_lists))
+        unigrams = np.fromiter(
+            (self.orth(token) for tokens in token_lists for token in tokens),
+            dtype=np.uint64, count=int(lengths.sum()),
+        )
+        doc_ids = np.repeat(np.arange(len(token_lists), dtype=np.int64), lengths)
+
+        all_ids, all_keys = [doc_ids], [unigrams]
+        for n in range(2, self.ngram_size + 1):
+            if len(unigrams) < n:
+                continue
+            # n-grams of the whole batch, minus the ones spanning two docs
+            windows = np.lib.stride_tricks.sliding_window_view(unigrams, n)
+            inside = doc_ids[:len(windows)] == doc_ids[n - 1:]
+            all_keys.append(murmurhash64a_rows(np.ascontiguousarray(windows[inside]), 0))
+            all_ids.append(doc_ids[:len(windows)][inside])
+        return np.concatenate(all_ids), np.concatenate(all_keys)
+
+    def _key_weights(self, key: int) -> np.ndarray:
+        """Summed weight columns of both buckets of one feature key (cached)"""
+        weights = self._weights_cache.get(key)
+        if weights is None:
+            keys = np.array([key], dtype=np.uint64)
+            idx1 = int(murmurhash3_32_uint64(keys, 0)[0]) % self.length
+            idx2 = int(murmurhash3_32_uint64(keys, 1)[0]) % self.length
+            weights = self.W[:, idx1].astype(np.float32) + self.W[:, idx2].astype(np.float32)
+            if len(self._weights_cache) >= TOKENIZER_CACHE_SIZE:
+                self._weights_cache.clear()
+            self._weights_cache[key] = weights
+        return weights
+
+    def _score_one(self, tokens: List[str]) -> np.ndarray:
+        """Single-message path: a few cached column sums beat batch set-up costs"""
+        unigrams = [self.orth(token) for token in tokens]
+        keys = list(unigrams)
+        for n in range(2, self.ngram_size + 1):
+            for i in range(len(unigrams) - n + 1):
+                window = b"".join(key.to_bytes(8, "little") for key in unigrams[i:i + n])
+                keys.append(murmurhash64a(window, 0))
+
+        scores = self.b.copy()
+        for key, count in Counter(keys).items():
+            scores += self._key_weights(key) * np.float32(count)
+        return scores[None, :]
+
+    def score_batch(self, texts: List[str]) -> np.ndarray:
+        """Return a (len(texts), n_labels) float32 score matrix"""
+        return self.score_tokens([self.tokenizer(text) for text in texts])
+
+    def score_tokens(self, token_lists: List[List[str]]) -> np.ndarray:
+        """Score already tokenized messages, see score_batch"""
+        if len(token_lists) == 1:
+            return self._activate(self._score_one(token_lists[0]))
+
+        scores = np.tile(self.b, (len(token_lists), 1))
+        doc_ids, keys = self.features(token_lists)
+
+        if len(keys):
+            # Count each distinct key once per doc, like extract_ngrams
+            order = np.lexsort((keys, doc_ids))
+            doc_ids, keys = doc_ids[order], keys[order]
+            first = np.ones(len(keys), dtype=bool)
+            first[1:] = (keys[1:] != keys[:-1]) | (doc_ids[1:] != doc_ids[:-1])
+            starts = np.flatnonzero(first)
+            counts = np.diff(np.append(starts, len(keys))).astype(np.float32)
+            doc_ids, keys = doc_ids[starts], keys[starts]
+
+            # Two hashed buckets per key, as in thinc's SparseLinear.v2
+            idx1 = murmurhash3_32_uint64(keys, 0) % np.uint32(self.length)
+            idx2 = murmurhash3_32_uint64(keys, 1) % np.uint32(self.length)
+            contributions = (self.W[:, idx1].astype(np.float32) + self.W[:, idx2].astype(np.float32)).T
+            contributions *= counts[:, None]
+            np.add.at(scores, doc_ids, contributions)
+
+        return self._activate(scores)
+
+    def _activate(self, scores: np.ndarray) -> np.ndarray:
+        if self.activation == "softmax":
+            scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+        elif self.activation == "logistic":
+            scores = 1.0 / (1.0 + np.exp(-scores))
+        return scores.astype(np.float32)
+
+    def cats_batch(self, texts: List[str]) -> List[dict]:
+        scores = self.score_batch(texts)
+        return [dict(zip(self.labels, row.tolist())) for row in scores]
+
+    def __call__(self, text: str) -> BowCats:
+        return BowCats(text, self.cats_batch([text])[0])
+
+    def pipe(self, texts: Iterable[str], batch_size: int = 1000, **kwargs) -> Iterable[BowCats]:
+        batch = []
+        for text in texts:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                yield from (BowCats(t, cats) for t, cats in zip(batch, self.cats_batch(batch)))
+                batch = []
+        if batch:
+            yield from (BowCats(t, cats) for t, cats in zip(batch, self.cats_batch(batch)))
+
+
+def is_bow_export(path: Optional[str]) -> bool:
+    return bool(path) and os.path.exists(os.path.join(path, "weights.npy"))
+
+
+def export_tokenizer(tokenizer) -> dict:
+    """Plain-data copy of a spaCy tokenizer's special cases and affix regexes"""
+    def pattern(func):
+        return func.__self__.pattern if func is not None else None
+
+    patterns = [tokenizer.prefix_search, tokenizer.suffix_search, tokenizer.infix_finditer,
+                tokenizer.token_match, tokenizer.url_match]
+    flags = {func.__self__.flags for func in patterns if func is not None}
+    if len(flags) > 1:
+        raise ValueError("Tokenizer regexes use different flags")
+    return {
+        "rules": {text: [piece[ORTH] for piece in pieces] for text, pieces in tokenizer.rules.items()},
+        "prefix": pattern(tokenizer.prefix_search),
+        "suffix": pattern(tokenizer.suffix_search),
+        "infix": pattern(tokenizer.infix_finditer),
+        "token_match": pattern(tokenizer.token_match),
+        "url_match": pattern(tokenizer.url_match),
+        "flags": flags.pop() if flags else 0,
+        "faster_heuristics": bool(getattr(tokenizer, "faster_heuristics", True)),
+    }
+
+
+def export_symbols(strings) -> Dict[str, int]:
+    """spaCy symbols whose ORTH id in `strings` is not the string's hash"""
+    from spacy.symbols import IDS
+
+    symbols = {}
+    for string in IDS:
+        if string and strings[string] != orth_hash(string):
+            symbols[string] = int(strings[string])
+    return symbols
+
+
+def export_model(model_path: str, output_dir: str, dtype: str = "float32", component: str = "textcat"):
+    """Write the textcat BOW weights and hashing scheme of a spaCy model to `output_dir`"""
+    import spacy
+
+    nlp = spacy.load(model_path)
+    textcat = nlp.get_pipe(component)
+    model = textcat.model
+
+    ngram_layer = next((node for node in model.walk() if node.name == "extract_ngrams"), None)
+    sparse_linear = next((node for node in model.walk() if node.name == "sparse_linear"), None)
+    if ngram_layer is None or sparse_linear is None:
+        raise ValueError("Only spacy.TextCatBOW textcat models can be exported")
+    if any(node.name in ("tok2vec", "hashembed", "concatenate") for node in model.walk()):
+        raise ValueError("Ensemble textcat models can't be exported, use a TextCatBOW model")
+    if ngram_layer.attrs["attr"] != ORTH:
+        raise ValueError("Only ORTH features are supported")
+    if sparse_linear.attrs.get("v1_indexing"):
+        raise ValueError("SparseLinear.v1 (TextCatBOW.v1/v2) indexing is not supported, retrain with v3")
+
+    names = [node.name for node in model.walk()]
+    if "softmax_activation" in names or "softmax" in names:
+        activation = "softmax"
+    elif "logistic" in names:
+        activation = "logistic"
+    else:
+        activation = "none"
+
+    n_labels = sparse_linear.get_dim("nO")
+    length = sparse_linear.get_dim("length")
+    W = sparse_linear.get_param("W").reshape(n_labels, length).astype(dtype)
+    b = sparse_linear.get_param("b").astype(np.float32)
+
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, "weights.npy"), W)
+    np.save(os.path.join(output_dir, "bias.npy"), b)
+
+    with open(os.path.join(output_dir, "tokenizer.json"), "w", encoding="utf-8") as f:
+        json.dump(export_tokenizer(nlp.tokenizer), f, ensure_ascii=False)
+    with open(os.path.join(output_dir, "symbols.json"), "w", encoding="utf-8") as f:
+        json.dump(export_symbols(nlp.vocab.strings), f, ensure_ascii=False)
+
+    meta = {key: nlp.meta.get(key) for key in ("lang", "name", "version", "description")}
+    meta["bow"] = {
+        "format_version": FORMAT_VERSION,
+        "source": os.path.abspath(model_path),
+        "labels": list(textcat.labels),
+        "ngram_size": int(ngram_layer.attrs["ngram_size"]),
+        "length": int(length),
+        "activation": activation,
+        "dtype": dtype,
+    }
+    with open(os.path.join(output_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Exported {n_labels} labels x {length} buckets ({dtype}) to {output_dir}")
+    print(f"   Run `python bow_engine.py check {model_path} {output_dir}` before serving it")
+
+
+def load_messages(data_path: str) -> List[str]:
+    with open(data_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [pattern for intent in data["intents"] for pattern in intent["patterns"]]
+
+
+def check_parity(model_path: str, export_dir: str, data_path: str, tolerance: float) -> bool:
+    """Compare the engine against the spaCy model on every training pattern
+    and PARITY_MESSAGES, and record the outcome in the export's meta.json"""
+    import spacy
+
+    nlp = spacy.load(model_path)
+    engine = BowEngine(export_dir)
+    messages = load_messages(data_path) + PARITY_MESSAGES
+
+    expected = np.array([[doc.cats[label] for label in engine.labels] for doc in nlp.pipe(messages)], dtype=np.float32)
+    actual = engine.score_batch(messages)
+
+    # The single-message path is separate code, check it as well
+    single = np.vstack([engine.score_batch([message]) for message in messages])
+    diff = np.maximum(np.abs(expected - actual), np.abs(expected - single)).max(axis=1)
+    same_top = expected.argmax(axis=1) == actual.argmax(axis=1)
+    token_mismatches = [
+        message for message in messages
+        if [t.text for t in nlp.tokenizer(message)] != engine.tokenizer(message)
+    ]
+    # Wrong ORTH ids only show in the scores when the weights they hit differ
+    orth_mismatches = [
+        message for message in messages
+        if nlp.make_doc(message).to_array(ORTH).tolist() != [engine.orth(t.text) for t in nlp.make_doc(message)]
+    ]
+
+    print(f"Messages checked:      {len(messages)}")
+    print(f"Max abs score diff:    {diff.max():.2e} (tolerance {tolerance:.0e})")
+    print(f"Top intent agreement:  {same_top.mean():.2%}")
+    print(f"Tokenizer mismatches:  {len(token_mismatches)}")
+    for message in token_mismatches[:10]:
+        print(f"  '{message}'")
+    print(f"ORTH id mismatches:    {len(orth_mismatches)}")
+    for message in orth_mismatches[:10]:
+        print(f"  '{message}'")
+
+    failures = [messages[i] for i in np.flatnonzero(diff > tolerance)]
+    passed = not failures and not orth_mismatches
+    meta_path = os.path.join(export_dir, "meta.json")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["bow"]["parity_checked"] = passed
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    if failures:
+        print(f"\n❌ {len(failures)} messages outside tolerance:")
+        for message in failures[:10]:
+            print(f"  '{message}'")
+    if not passed:
+        return False
+    print("\n✅ NumPy engine matches the spaCy model")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and check the spaCy-free BOW scoring engine")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export textcat BOW weights from a trained model")
+    export_parser.add_argument("model", help="Trained spaCy model directory, e.g. ./output/model-best")
+    export_parser.add_argument("output", help="Directory to write the export to, e.g. ./bow_export")
+    export_parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+
+    check_parser = subparsers.add_parser("check", help="Check the export against the spaCy model")
+    check_parser.add_argument("model")
+    check_parser.add_argument("export")
+    check_parser.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "training_data.json"))
+    check_parser.add_argument("--tolerance", type=float, default=None,
+                              help="Max abs score difference (default 1e-5, or 1e-2 for float16 exports)")
+
+    args = parser.parse_args()
+    if args.command == "export":
+        export_model(args.model, args.output, args.dtype)
+        return 0
+
+    tolerance = args.tolerance
+    if tolerance is None:
+        with open(os.path.join(args.export, "meta.json"), "r", encoding="utf-8") as f:
+            tolerance = 1e-2 if json.load(f)["bow"]["dtype"] == "float16" else 1e-5
+    return 0 if check_parity(args.model, args.export, args.data, tolerance) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
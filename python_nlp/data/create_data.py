@@ -1,116 +1,387 @@
-import spacy
+# create_data.py - Build the sharded train/dev corpora for spacy train
+#
+# Streams labeled messages from intents JSON and/or JSONL files, assigns each
+# one to train or dev by a hash of its text (so the split is reproducible and
+# duplicates never straddle it), tokenizes them with nlp.pipe and writes
+# DocBin shards of at most --shard-size docs to data/train/ and data/dev/.
+# spacy.Corpus reads a directory of shards like a single .spacy file, and
+# memory use stays flat however large the input is: at most --max-buffered
+# docs wait across all shard writers, past that the fullest one is written
+# early as a smaller shard.
+#
+# spacy.Corpus streams shards in file order when training without a fixed
+# epoch count, so every shard mixes intents: examples are spread over
+# --buckets shard groups by a hash of their text, and the docs of each shard
+# are shuffled before it is written. Input grouped by intent (as intents
+# JSON is) is only mixed within a shard; beyond --buckets x --shard-size
+# examples, raise --buckets or shuffle the JSONL input.
+#
+# Builds are incremental: a manifest (data/corpus_manifest.json) records a
+# content hash of every bucket. Only the shards of buckets whose examples
+# changed are rewritten, and when the input files themselves are unchanged
+# nothing is read at all.
+#
+# Usage:
+#   python data/create_data.py
+#   python data/create_data.py chat_logs.jsonl --n-process 4 --shard-size 50000
+#   python data/create_data.py --force    # rebuild every shard
+
+import argparse
+import glob
+import hashlib
 import json
+import os
 import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+
+import spacy
 from spacy.tokens import DocBin
-import os
 
 # Get the absolute path of the directory where the script is located
 script_dir = os.path.dirname(os.path.abspath(__file__))
 data_dir = script_dir
 
-# Try to load enhanced training data first, fall back to original
-try:
-    with open(os.path.join(data_dir, 'enhanced_training_data.json'), 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    print("✅ Using enhanced training data")
-except FileNotFoundError:
-    with open(os.path.join(data_dir, 'training_data.json'), 'r', encoding='utf-8') as f:
-        data = json.load(f)
+MANIFEST_NAME = "corpus_manifest.json"
+MANIFEST_VERSION = 2
+SPLITS = ("train", "dev")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build sharded train/dev DocBin corpora")
+    parser.add_argument("inputs", nargs="*",
+                        help="Intents JSON or JSONL files ({\"text\": ..., \"label\": ...} per line). "
+                             "Default: enhanced_training_data.json, else training_data.json")
+    parser.add_argument("--output-dir", default=data_dir,
+                        help="Shards go to OUTPUT_DIR/train and OUTPUT_DIR/dev")
+    parser.add_argument("--dev-ratio", type=float, default=0.2)
+    parser.add_argument("--shard-size", type=int, default=10000, help="Maximum docs per shard")
+    parser.add_argument("--buckets", type=int, default=16,
+                        help="Shard groups the examples are spread over by a hash of their text")
+    parser.add_argument("--max-buffered", type=int, default=100000,
+                        help="Docs held in memory across all shard groups before the fullest is written")
+    parser.add_argument("--n-process", type=int, default=1, help="Processes for nlp.pipe")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", default="0", help="Salt for the train/dev hash split")
+    parser.add_argument("--labels", help="Comma-separated label set; examples with other labels are skipped")
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and rebuild every shard")
+    return parser.parse_args()
+
+
+def default_inputs() -> List[str]:
+    # Try to load enhanced training data first, fall back to original
+    enhanced = os.path.join(data_dir, 'enhanced_training_data.json')
+    if os.path.exists(enhanced):
+        print("✅ Using enhanced training data")
+        return [enhanced]
     print("⚠️  Using original training data (consider running model_diagnosis.py first)")
+    return [os.path.join(data_dir, 'training_data.json')]
+
+
+def read_intents_json(path: str) -> Iterator[Tuple[str, str]]:
+    with open(path, 'rb') as f:
+        try:
+            import ijson
+            intents = ijson.items(f, "intents.item")
+        except ImportError:
+            # Without ijson the intents file is parsed in one go; use JSONL for big corpora
+            intents = json.load(f)["intents"]
+        for intent in intents:
+            for pattern in intent.get("patterns", []):
+                yield pattern, intent["tag"]
+
+
+def read_jsonl(path: str) -> Iterator[Tuple[str, str]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            label = record.get("label") or record.get("intent") or record.get("tag")
+            if label is None and record.get("cats"):
+                label = max(record["cats"], key=record["cats"].get)
+            text = record.get("text")
+            if text and label:
+                yield text, label
+
+
+def read_examples(paths: List[str]) -> Iterator[Tuple[str, str]]:
+    for path in paths:
+        reader = read_jsonl if path.endswith(".jsonl") else read_intents_json
+        yield from reader(path)
+
+
+def split_of(text: str, salt: str, dev_ratio: float) -> str:
+    """'train' or 'dev', decided by a hash of the text: stable across runs and
+    machines, and identical messages always end up in the same split"""
+    digest = hashlib.blake2b(text.strip().lower().encode('utf-8'), digest_size=8,
+                             key=salt.encode('utf-8')[:64]).digest()
+    return "dev" if int.from_bytes(digest, "big") / 2 ** 64 < dev_ratio else "train"
+
+
+def bucket_of(text: str, salt: str, buckets: int) -> str:
+    """Shard group of an example, by a hash of its text independent of the split"""
+    digest = hashlib.blake2b(text.strip().lower().encode('utf-8'), digest_size=8,
+                             key=salt.encode('utf-8')[:64], person=b"bucket").digest()
+    return f"{int.from_bytes(digest, 'big') % max(1, buckets):03d}"
+
+
+class ShardWriter:
+    """Write docs to numbered DocBin shards of at most `shard_size` docs, each
+    shuffled (reproducibly for a given seed and name)"""
+
+    def __init__(self, directory: str, name: str, shard_size: int, vocab, seed: str):
+        self.directory = directory
+        self.name = name
+        self.shard_size = max(1, shard_size)
+        self.vocab = vocab
+        self.random = random.Random(f"{seed}:{name}")
+        self.files = []
+        self.docs = 0
+        self._bin = DocBin(store_user_data=False)
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def pending(self) -> int:
+        return len(self._bin)
+
+    def add(self, doc) -> int:
+        """Buffer a doc; returns the number of docs written out (0 or a full shard)"""
+        self._bin.add(doc)
+        self.docs += 1
+        if len(self._bin) >= self.shard_size:
+            return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        """Write the buffered docs as a shard; returns how many there were"""
+        written = len(self._bin)
+        if written:
+            filename = f"{self.name}-{len(self.files):05d}.spacy"
+            docs = list(self._bin.get_docs(self.vocab))
+            self.random.shuffle(docs)
+            DocBin(docs=docs, store_user_data=False).to_disk(os.path.join(self.directory, filename))
+            self.files.append(filename)
+            self._bin = DocBin(store_user_data=False)
+        return written
+
+
+def shard_name(split: str, bucket: str) -> str:
+    return f"{split}-{bucket}"
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan(inputs: List[str], label_filter, args) -> Tuple[Dict[str, dict], Dict[str, dict]]:
+    """First streaming pass: the train/dev counts of every intent, and for
+    every bucket a hash of its examples (in input order) and its counts"""
+    intent_counts, hashes, bucket_counts = {}, {}, {}
+    for text, label in read_examples(inputs):
+        if label_filter is not None and label not in label_filter:
+            continue
+        split = split_of(text, args.seed, args.dev_ratio)
+        bucket = bucket_of(text, args.seed, args.buckets)
+        if bucket not in hashes:
+            hashes[bucket] = hashlib.blake2b(digest_size=16)
+            bucket_counts[bucket] = Counter()
+        encoded_label, encoded = label.encode('utf-8'), text.encode('utf-8')
+        hashes[bucket].update(b"%d:%d:" % (len(encoded_label), len(encoded)) + encoded_label + encoded)
+        bucket_counts[bucket][split] += 1
+        intent_counts.setdefault(label, Counter())[split] += 1
+    intents = {tag: {"train": intent_counts[tag]["train"], "dev": intent_counts[tag]["dev"]}
+               for tag in sorted(intent_counts)}
+    buckets = {
+        bucket: {"digest": hashes[bucket].hexdigest(), "train": bucket_counts[bucket]["train"],
+                 "dev": bucket_counts[bucket]["dev"]}
+        for bucket in sorted(hashes)
+    }
+    return intents, buckets
+
+
+def load_manifest(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️  Ignoring unreadable manifest {path}: {e}")
+        return None
+    return manifest if manifest.get("version") == MANIFEST_VERSION else None
+
+
+def save_manifest(path: str, manifest: dict):
+    # Written last and atomically: an interrupted build leaves the old
+    # manifest, whose hashes no longer match, so the next run redoes the work
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def shards_exist(output_dir: str, shards: Dict[str, List[str]]) -> bool:
+    return all(os.path.exists(os.path.join(output_dir, split, name))
+               for split in SPLITS for name in shards.get(split, []))
+
+
+def remove_stale_shards(output_dir: str, kept: Dict[str, dict]):
+    """Delete every shard not owned by a kept bucket: shards of changed or
+    removed buckets, of interrupted builds and of older versions of this
+    script (spacy.Corpus would read them all)"""
+    keep = {os.path.join(output_dir, split, name)
+            for info in kept.values() for split in SPLITS for name in info["shards"][split]}
+    for split in SPLITS:
+        for path in glob.glob(os.path.join(output_dir, split, "*.spacy")):
+            if path not in keep:
+                os.remove(path)
+
+
+def build(args, inputs: List[str], labels: List[str], changed: set) -> Dict[str, Dict[str, List[str]]]:
+    """Second streaming pass: tokenize the examples of the `changed` buckets
+    and write their shards; returns the shard files per bucket and split"""
+    # A blank Spanish pipeline: only the tokenizer runs
+    nlp = spacy.blank("es")
+
+    # One cats dict per label, with every label present
+    cats_by_label = {label: {other: float(other == label) for other in labels} for label in labels}
+    writers = {}
+    buffered = 0
+
+    def stream():
+        for text, label in read_examples(inputs):
+            if label not in cats_by_label:
+                continue
+            bucket = bucket_of(text, args.seed, args.buckets)
+            if bucket in changed:
+                yield text, (label, bucket, split_of(text, args.seed, args.dev_ratio))
+
+    kwargs = {"n_process": args.n_process} if args.n_process > 1 else {}
+    for doc, (label, bucket, split) in nlp.pipe(stream(), as_tuples=True, batch_size=args.batch_size, **kwargs):
+        doc.cats = dict(cats_by_label[label])
+        writer = writers.get((bucket, split))
+        if writer is None:
+            writer = writers[(bucket, split)] = ShardWriter(
+                os.path.join(args.output_dir, split), shard_name(split, bucket), args.shard_size,
+                nlp.vocab, args.seed)
+        buffered += 1 - writer.add(doc)
+        if buffered >= args.max_buffered:
+            buffered -= max(writers.values(), key=lambda w: w.pending).flush()
+
+    shards = {bucket: {split: [] for split in SPLITS} for bucket in changed}
+    for (bucket, split), writer in writers.items():
+        writer.flush()
+        shards[bucket][split] = writer.files
+    return shards
+
+
+def print_summary(manifest: dict):
+    labels = manifest["labels"]
+    intents = manifest["intents"]
+    totals = {split: sum(info[split] for info in intents.values()) for split in SPLITS}
+    shard_counts = {split: sum(len(info["shards"][split]) for info in manifest["buckets"].values())
+                    for split in SPLITS}
+
+    print(f"Total examples: {totals['train'] + totals['dev']}")
+    print(f"Train set: {totals['train']} examples")
+    print(f"Dev set: {totals['dev']} examples")
+
+    # Ensure we have at least some examples in dev set
+    if totals["dev"] < 5:
+        print("⚠️  Warning: Very small dev set. Consider adding more training data.")
+
+    for split in SPLITS:
+        print(f"✅ {manifest['output_dir']}/{split} holds {totals[split]} examples in {shard_counts[split]} shard(s).")
+    print(f"Labels: {labels}")
+
+    # Show distribution per intent
+    print("\nIntent distribution:")
+    counts = []
+    for tag in labels:
+        info = intents.get(tag, {})
+        count = info.get("train", 0) + info.get("dev", 0)
+        counts.append(count)
+        print(f"  {tag:15} → {count:2} examples")
+
+    # Check for potential issues
+    min_examples = min(counts) if counts else 0
+    max_examples = max(counts) if counts else 0
+
+    if min_examples < 5:
+        print(f"\n⚠️  Warning: Some intents have very few examples (minimum: {min_examples})")
+        print("   Consider adding more examples for better performance")
+
+    if min_examples and max_examples / min_examples > 3:
+        print(f"\n⚠️  Warning: Unbalanced dataset (ratio: {max_examples/min_examples:.1f}:1)")
+        print("   Consider balancing the number of examples per intent")
+
+    print(f"\nReady for training! Use:")
+    print("python -m spacy train config.cfg --output ./output --paths.train ./data/train --paths.dev ./data/dev")
+    print("\nOr with improved config:")
+    print("python -m spacy train improved_config.cfg --output ./output --paths.train ./data/train --paths.dev ./data/dev")
+
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    inputs = args.inputs or default_inputs()
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    previous = None if args.force else load_manifest(manifest_path)
+
+    # Anything that changes every doc or every split assignment
+    options = {"seed": args.seed, "dev_ratio": args.dev_ratio, "shard_size": args.shard_size,
+               "buckets": args.buckets, "labels": args.labels}
+    input_digests = {os.path.abspath(path): file_digest(path) for path in inputs}
+
+    if (previous and previous["options"] == options and previous["inputs"] == input_digests
+            and all(shards_exist(args.output_dir, info["shards"]) for info in previous["buckets"].values())):
+        print(f"✅ Inputs unchanged since {previous['built_at']}, nothing to rebuild")
+        print_summary(previous)
+        return 0
+
+    label_filter = [label.strip() for label in args.labels.split(",")] if args.labels else None
+    intents, buckets = scan(inputs, set(label_filter) if label_filter else None, args)
+    labels = label_filter or list(intents)
+    print(f"Found labels: {labels}")
+
+    if previous is None or previous["options"] != options or previous["labels"] != labels:
+        # Every doc's cats or split may differ: start over
+        kept = {}
+    else:
+        kept = {bucket: info for bucket, info in previous["buckets"].items()
+                if bucket in buckets and info["digest"] == buckets[bucket]["digest"]
+                and shards_exist(args.output_dir, info["shards"])}
+    remove_stale_shards(args.output_dir, kept)
+
+    changed = set(buckets) - set(kept)
+    shards = build(args, inputs, labels, changed) if changed else {}
+    print(f"🔄 Rebuilt {len(changed)} of {len(buckets)} bucket(s), kept {len(kept)} unchanged "
+          f"in {time.perf_counter() - started:.2f}s")
+
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "output_dir": args.output_dir,
+        "inputs": input_digests,
+        "options": options,
+        "labels": labels,
+        "intents": intents,
+        "buckets": {
+            bucket: dict(info, shards=kept[bucket]["shards"] if bucket in kept else shards[bucket])
+            for bucket, info in buckets.items()
+        },
+    }
+    save_manifest(manifest_path, manifest)
+    print_summary(manifest)
+    return 0
+
 
-# Create a blank Spanish model
-nlp = spacy.blank("es")
-
-# Collect all unique labels first
-all_labels = set()
-training_data = []
-
-for intent in data["intents"]:
-    tag = intent["tag"]
-    all_labels.add(tag)
-    for pattern in intent["patterns"]:
-        # Create a dictionary with all labels set to 0.0, then set the correct one to 1.0
-        cats = {label: 0.0 for label in all_labels}
-        cats[tag] = 1.0
-        training_data.append((pattern, {"cats": cats}))
-
-# Now that we have all labels, we need to update all training examples to include all labels
-all_labels = list(all_labels)
-print(f"Found labels: {all_labels}")
-
-# Recreate training data with complete label sets
-training_data = []
-for intent in data["intents"]:
-    tag = intent["tag"]
-    for pattern in intent["patterns"]:
-        cats = {label: 0.0 for label in all_labels}
-        cats[tag] = 1.0
-        training_data.append((pattern, {"cats": cats}))
-
-# Add the textcat component and add labels
-textcat = nlp.add_pipe("textcat")
-for label in all_labels:
-    textcat.add_label(label)
-
-# Shuffle and split the data (80% train, 20% dev)
-random.shuffle(training_data)
-split_index = int(len(training_data) * 0.8)
-train_set = training_data[:split_index]
-dev_set = training_data[split_index:]
-
-print(f"Total examples: {len(training_data)}")
-print(f"Train set: {len(train_set)} examples")
-print(f"Dev set: {len(dev_set)} examples")
-
-# Ensure we have at least some examples in dev set
-if len(dev_set) < 5:
-    print("⚠️  Warning: Very small dev set. Consider adding more training data.")
-
-# Create DocBin objects
-db_train = DocBin()
-db_dev = DocBin()
-
-# Process training set
-for text, annotations in train_set:
-    doc = nlp.make_doc(text)
-    doc.cats = annotations["cats"]
-    db_train.add(doc)
-
-# Process dev set
-for text, annotations in dev_set:
-    doc = nlp.make_doc(text)
-    doc.cats = annotations["cats"]
-    db_dev.add(doc)
-
-# Save the DocBin objects to disk
-db_train.to_disk(os.path.join(data_dir, "train.spacy"))
-db_dev.to_disk(os.path.join(data_dir, "dev.spacy"))
-
-print(f"✅ Created train.spacy with {len(train_set)} examples.")
-print(f"✅ Created dev.spacy with {len(dev_set)} examples.")
-print(f"Labels: {all_labels}")
-
-# Show distribution per intent
-print("\nIntent distribution:")
-intent_counts = {}
-for intent in data["intents"]:
-    count = len(intent["patterns"])
-    intent_counts[intent["tag"]] = count
-    print(f"  {intent['tag']:15} → {count:2} examples")
-
-# Check for potential issues
-min_examples = min(intent_counts.values())
-max_examples = max(intent_counts.values())
-
-if min_examples < 5:
-    print(f"\n⚠️  Warning: Some intents have very few examples (minimum: {min_examples})")
-    print("   Consider adding more examples for better performance")
-
-if max_examples / min_examples > 3:
-    print(f"\n⚠️  Warning: Unbalanced dataset (ratio: {max_examples/min_examples:.1f}:1)")
-    print("   Consider balancing the number of examples per intent")
-
-print(f"\nReady for training! Use:")
-print("python -m spacy train config.cfg --output ./output --paths.train ./data/train.spacy --paths.dev ./data/dev.spacy")
-print("\nOr with improved config:")
-print("python -m spacy train improved_config.cfg --output ./output --paths.train ./data/train.spacy --paths.dev ./data/dev.spacy")
\ No newline at end of file
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+# distill.py - Distill a slow textcat teacher into a fast TextCatBOW student
+#
+# The teacher (default ./enhanced_output/model-last) scores the labeled
+# training data plus an optional pool of unlabeled messages, e.g. exported
+# chat logs. Its soft scores, blended with the gold label where there is one
+# (--gold-weight), are the student's targets. The student pipeline comes
+# from the BOW config.cfg and is trained on those targets with the same
+# squared-error loss spaCy's textcat uses; `spacy train` itself only accepts
+# 0/1 cats. Messages held out by a hash of their text then measure
+# teacher/student agreement, and per-message latency and model size measure
+# the speed-up. The student can be served as is (NLP_MODEL_PATH) or exported
+# with bow_engine.py.
+#
+# Unlabeled pools are JSONL files ({"text": ...} or {"message": ...} per
+# line) or plain text files with one message per line.
+#
+# Usage:
+#   python distill.py --unlabeled chat_logs.jsonl --output ./distilled_output
+#   NLP_MODEL_PATH=./distilled_output/model-best uvicorn main:app
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from evaluate import read_examples, score_texts, textcat_labels
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distill a textcat teacher into a TextCatBOW student")
+    default_data = "./data/enhanced_training_data.json"
+    if not os.path.exists(default_data):
+        default_data = "./data/training_data.json"
+    parser.add_argument("--teacher", default="./enhanced_output/model-last", help="Teacher spaCy model")
+    parser.add_argument("--data", default=default_data,
+                        help="Labeled data: intents JSON, .spacy DocBin (file or directory) or JSONL")
+    parser.add_argument("--unlabeled", nargs="*", default=[],
+                        help="Unlabeled messages: JSONL or one message per line")
+    parser.add_argument("--config", default="./config.cfg", help="Student pipeline config (TextCatBOW)")
+    parser.add_argument("--output", default="./distilled_output",
+                        help="Student output directory (model-best and model-last)")
+    parser.add_argument("--gold-weight", type=float, default=0.5,
+                        help="Weight of the gold label against the teacher's scores for labeled messages")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--train-batch-size", type=int, default=32)
+    parser.add_argument("--dropout", type=float, default=0.1)
+    parser.add_argument("--dev-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", default="0", help="Salt for the train/dev hash split")
+    parser.add_argument("--batch-size", type=int, default=256, help="nlp.pipe batch size for scoring")
+    parser.add_argument("--latency-samples", type=int, default=500,
+                        help="Held-out messages timed one at a time per model")
+    parser.add_argument("--report", help="Write the report here (default: OUTPUT/distillation.json)")
+    return parser.parse_args()
+
+
+def read_messages(path: str) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                record = json.loads(line)
+                line = (record.get("text") or record.get("message") or "").strip()
+            if line:
+                yield line
+
+
+def iter_corpus(args) -> Iterator[Tuple[str, Optional[str]]]:
+    """(text, gold label or None) for the labeled data, then the unlabeled
+    pool, without duplicate texts"""
+    seen = set()
+    for text, label in read_examples(args.data):
+        if text not in seen:
+            seen.add(text)
+            yield text, label
+    for path in args.unlabeled:
+        for text in read_messages(path):
+            if text not in seen:
+                seen.add(text)
+                yield text, None
+
+
+def is_dev(text: str, salt: str, dev_ratio: float) -> bool:
+    # Same hash split as data/create_data.py
+    digest = hashlib.blake2b(text.strip().lower().encode("utf-8"), digest_size=8,
+                             key=salt.encode("utf-8")[:64]).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 < dev_ratio
+
+
+def soft_label(teacher, labels: List[str], args) -> dict:
+    """Teacher scores, student targets, gold labels and the dev mask for
+    every message of the corpus"""
+    texts, gold, rows = [], [], []
+    for doc, label in teacher.pipe(iter_corpus(args), as_tuples=True, batch_size=args.batch_size):
+        texts.append(doc.text)
+        gold.append(labels.index(label) if label in labels else -1)
+        rows.append([doc.cats.get(name, 0.0) for name in labels])
+
+    teacher_scores = np.array(rows, dtype=np.float32).reshape(len(texts), len(labels))
+    gold = np.array(gold, dtype=np.int64)
+    gold_weight = min(1.0, max(0.0, args.gold_weight))
+    targets = teacher_scores.copy()
+    labeled = gold >= 0
+    targets[labeled] *= 1.0 - gold_weight
+    targets[labeled, gold[labeled]] += gold_weight
+
+    return {
+        "texts": texts,
+        "gold": gold,
+        "teacher_scores": teacher_scores,
+        "targets": targets,
+        "dev": np.array([is_dev(text, args.seed, args.dev_ratio) for text in texts], dtype=bool),
+    }
+
+
+def train_student(corpus: dict, labels: List[str], args) -> str:
+    """Train the config.cfg textcat on the soft targets; saves model-last and
+    the model-best with the lowest held-out loss, and returns model-best"""
+    from spacy.training import Example
+    from spacy.util import fix_random_seed, load_config, load_model_from_config, minibatch
+    from thinc.api import set_dropout_rate
+
+    config = load_config(args.config)
+    fix_random_seed(config["system"].get("seed") or 0)
+    nlp = load_model_from_config(config, auto_fill=True)
+    textcat_name = next(name for name in nlp.pipe_names if "textcat" in name)
+    textcat = nlp.get_pipe(textcat_name)
+
+    train_rows = np.flatnonzero(~corpus["dev"])
+    dev_rows = np.flatnonzero(corpus["dev"])
+    docs = [nlp.make_doc(text) for text in corpus["texts"]]
+    targets = corpus["targets"]
+
+    # spaCy validates labels on 0/1 cats, so initialize with the argmax
+    def hard_examples():
+        for row in train_rows:
+            reference = docs[row].copy()
+            top = targets[row].argmax()
+            reference.cats = {label: float(i == top) for i, label in enumerate(labels)}
+            yield Example(docs[row], reference)
+
+    optimizer = nlp.initialize(hard_examples)
+    ops = textcat.model.ops
+    rng = random.Random(0)
+    best_loss = None
+    best_path = os.path.join(args.output, "model-best")
+
+    print(f"{'epoch':>5} {'train loss':>10} {'dev loss':>9} {'agreement':>9}")
+    for epoch in range(args.epochs):
+        order = list(train_rows)
+        rng.shuffle(order)
+        train_loss = 0.0
+        set_dropout_rate(textcat.model, args.dropout)
+        for batch in minibatch(order, size=args.train_batch_size):
+            scores, backprop = textcat.model.begin_update([docs[row] for row in batch])
+            # Same loss as TextCategorizer.get_loss, on soft targets
+            d_scores = scores - ops.asarray2f(targets[batch])
+            train_loss += float((d_scores ** 2).sum())
+            backprop(d_scores)
+            textcat.finish_update(optimizer)
+
+        set_dropout_rate(textcat.model, 0.0)
+        dev_scores = ops.to_numpy(textcat.model.predict([docs[row] for row in dev_rows]))
+        dev_loss = float(((dev_scores - targets[dev_rows]) ** 2).sum())
+        agreement = float((dev_scores.argmax(axis=1) == corpus["teacher_scores"][dev_rows].argmax(axis=1)).mean())
+        print(f"{epoch:>5} {train_loss:>10.3f} {dev_loss:>9.3f} {agreement:>9.1%}")
+
+        if best_loss is None or dev_loss < best_loss:
+            best_loss = dev_loss
+            with nlp.use_params(optimizer.averages):
+                nlp.to_disk(best_path)
+
+    nlp.to_disk(os.path.join(args.output, "model-last"))
+    return best_path
+
+
+def latency_ms(nlp, texts: List[str]) -> dict:
+    """Per-message latency, the way the service calls the model"""
+    for text in texts[:20]:
+        nlp(text)
+    timings = []
+    for text in texts:
+        started = time.perf_counter()
+        nlp(text)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+    return {
+        "mean": round(sum(timings) / len(timings), 4),
+        "p50": round(timings[len(timings) // 2], 4),
+        "p95": round(timings[min(len(timings) - 1, int(0.95 * len(timings)))], 4),
+    }
+
+
+def directory_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return round(total / 1e6, 2)
+
+
+def compare(teacher, student, student_path: str, labels: List[str], corpus: dict, args) -> dict:
+    """Agreement, accuracy, latency and size of teacher and student on the
+    held-out messages"""
+    dev = corpus["dev"]
+    texts = [text for text, held_out in zip(corpus["texts"], dev) if held_out]
+    teacher_scores = corpus["teacher_scores"][dev]
+    # Scored through the saved model, exactly as it will be served
+    student_scores = score_texts(student, texts, labels, args.batch_size)
+    teacher_top = teacher_scores.argmax(axis=1)
+    student_top = student_scores.argmax(axis=1)
+
+    report = {
+        "held_out": len(texts),
+        "agreement": round(float((teacher_top == student_top).mean()), 4),
+        "mean_abs_score_diff": round(float(np.abs(teacher_scores - student_scores).mean()), 4),
+    }
+
+    gold = corpus["gold"][dev]
+    labeled = gold >= 0
+    if labeled.any():
+        report["labeled_held_out"] = int(labeled.sum())
+        report["teacher_accuracy"] = round(float((teacher_top[labeled] == gold[labeled]).mean()), 4)
+        report["student_accuracy"] = round(float((student_top[labeled] == gold[labeled]).mean()), 4)
+
+    sample = texts[:args.latency_samples]
+    report["teacher_latency_ms"] = latency_ms(teacher, sample)
+    report["student_latency_ms"] = latency_ms(student, sample)
+    report["speedup"] = round(report["teacher_latency_ms"]["p50"] / max(report["student_latency_ms"]["p50"], 1e-9), 2)
+    report["teacher_size_mb"] = directory_mb(args.teacher)
+    report["student_size_mb"] = directory_mb(student_path)
+    return report
+
+
+def main():
+    args = parse_args()
+    import spacy
+
+    started = time.perf_counter()
+    print(f"🎓 Loading teacher {args.teacher}...")
+    teacher = spacy.load(args.teacher)
+    labels = textcat_labels(teacher)
+    if not labels:
+        print(f"❌ {args.teacher} has no textcat component")
+        return 1
+
+    print("🏷️  Soft-labeling the training data and unlabeled pool...")
+    corpus = soft_label(teacher, labels, args)
+    counts = {
+        "labeled": int((corpus["gold"] >= 0).sum()),
+        "unlabeled": int((corpus["gold"] < 0).sum()),
+        "train": int((~corpus["dev"]).sum()),
+        "dev": int(corpus["dev"].sum()),
+    }
+    print(f"   {counts['labeled']} labeled + {counts['unlabeled']} unlabeled messages: "
+          f"{counts['train']} train, {counts['dev']} held out")
+    if not counts["train"] or not counts["dev"]:
+        print("❌ Need both training and held-out messages: add data or change --dev-ratio")
+        return 1
+
+    print(f"🏋️  Training the student from {args.config}...")
+    os.makedirs(args.output, exist_ok=True)
+    student_path = train_student(corpus, labels, args)
+
+    student = spacy.load(student_path)
+    report = compare(teacher, student, student_path, labels, corpus, args)
+    report.update(
+        teacher=args.teacher,
+        student=student_path,
+        config=args.config,
+        gold_weight=args.gold_weight,
+        data=args.data,
+        unlabeled=args.unlabeled,
+        corpus=counts,
+        seconds=round(time.perf_counter() - started, 1),
+        created_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+
+    print("\n📊 Teacher vs student on held-out messages:")
+    print(f"   Agreement (same top intent): {report['agreement']:.1%} of {report['held_out']}")
+    if "student_accuracy" in report:
+        print(f"   Accuracy on {report['labeled_held_out']} labeled: teacher {report['teacher_accuracy']:.1%}, "
+              f"student {report['student_accuracy']:.1%}")
+    print(f"   Latency p50: teacher {report['teacher_latency_ms']['p50']} ms, "
+          f"student {report['student_latency_ms']['p50']} ms ({report['speedup']}x faster)")
+    print(f"   Size: teacher {report['teacher_size_mb']} MB, student {report['student_size_mb']} MB")
+
+    report_path = args.report or os.path.join(args.output, "distillation.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n💾 Report written to {report_path}")
+    print(f"✅ Serve the student with NLP_MODEL_PATH={student_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+# evaluate.py - Offline evaluation of the intent classifier with threshold sweeps
+#
+# Streams a labeled set through nlp.pipe, keeps the textcat scores as one
+# NumPy matrix and computes accuracy, the confusion matrix and per-intent
+# precision/recall. It then sweeps confidence thresholds (one global value
+# and one per intent) over that matrix and writes the chosen ones to a file
+# main.py loads at startup (NLP_THRESHOLDS, default ./thresholds.json).
+#
+# Labeled sets can be:
+#   * an intents JSON file (data/training_data.json): patterns labeled by tag
+#   * a .spacy DocBin, or a directory of them: label = the gold cat set to 1
+#   * a JSONL file: {"text": ..., "label": ...} per line ("intent", "tag"
+#     or a "cats" dict also work)
+#
+# Usage:
+#   python evaluate.py data/dev --n-process 4
+#   python evaluate.py data/enhanced_training_data.json --thresholds-out thresholds.json
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FALLBACK = "fallback"
+# Messages per chunk handed to nlp.pipe (and to each worker process)
+CHUNK_ROWS = 8192
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Evaluate the NutriSaas intent classifier")
+    parser.add_argument("data", help="Intents JSON, .spacy DocBin (file or directory) or JSONL file")
+    parser.add_argument("--model", default="./enhanced_output/model-last",
+                        help="spaCy model directory or bow_engine export")
+    parser.add_argument("--n-process", type=int, default=1, help="Worker processes running nlp.pipe")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--grid", type=int, default=2000,
+                        help="Evenly spaced thresholds to try, plus as many score quantiles")
+    parser.add_argument("--objective", choices=["accuracy", "precision"], default="accuracy",
+                        help="Maximize accuracy (fallback answers count as right for fallback "
+                             "messages), or answer as much as possible at --min-precision")
+    parser.add_argument("--min-precision", type=float, default=0.9)
+    parser.add_argument("--min-support", type=int, default=20,
+                        help="Intents predicted fewer times than this keep the global threshold")
+    parser.add_argument("--thresholds-out", help="Write the chosen thresholds here (e.g. thresholds.json)")
+    parser.add_argument("--report", help="Write the full report as JSON")
+    return parser.parse_args()
+
+
+# --- Labeled data readers ---------------------------------------------------
+
+def read_docbin(path: str) -> Iterator[Tuple[str, str]]:
+    import spacy
+    from spacy.tokens import DocBin
+
+    vocab = spacy.blank("es").vocab
+    paths = sorted(glob.glob(os.path.join(path, "**", "*.spacy"), recursive=True)) if os.path.isdir(path) else [path]
+    for shard in paths:
+        for doc in DocBin().from_disk(shard).get_docs(vocab):
+            yield doc.text, max(doc.cats, key=doc.cats.get)
+
+
+def read_examples(path: str) -> Iterator[Tuple[str, str]]:
+    """(text, label) pairs of a DocBin, or of the intents JSON and JSONL files
+    create_data.py builds the corpus from, read the same way it reads them"""
+    if os.path.isdir(path) or path.endswith(".spacy"):
+        return read_docbin(path)
+    from data.create_data import read_examples as read_inputs
+    return read_inputs([path])
+
+
+# --- Scoring ----------------------------------------------------------------
+
+def load_model(path: str):
+    from bow_engine import BowEngine, is_bow_export
+    if is_bow_export(path):
+        return BowEngine(path)
+    import spacy
+    return spacy.load(path)
+
+
+def textcat_labels(nlp) -> List[str]:
+    labels = []
+    for name, pipe_labels in nlp.pipe_labels.items():
+        if "textcat" in name:
+            labels.extend(label for label in pipe_labels if label not in labels)
+    return labels
+
+
+def score_texts(nlp, texts: List[str], labels: List[str], batch_size: int) -> np.ndarray:
+    scores = np.empty((len(texts), len(labels)), dtype=np.float32)
+    for row, doc in enumerate(nlp.pipe(texts, batch_size=batch_size)):
+        cats = doc.cats
+        scores[row] = [cats.get(label, 0.0) for label in labels]
+    return scores
+
+
+# Model of a worker process, loaded once by init_scoring_worker
+_worker = {}
+
+
+def init_scoring_worker(model_path: str, batch_size: int):
+    """multiprocessing.Pool initializer: load the model once per worker process"""
+    _worker["nlp"] = load_model(model_path)
+    _worker["labels"] = textcat_labels(_worker["nlp"])
+    _worker["batch_size"] = batch_size
+
+
+def score_chunk(texts: List[str]) -> np.ndarray:
+    """Score a chunk of texts with the model of this worker process"""
+    return score_texts(_worker["nlp"], texts, _worker["labels"], _worker["batch_size"])
+
+
+def score_examples(nlp, model_path: str, examples: Iterator[Tuple[str, str]], labels: List[str],
+                   n_process: int, batch_size: int) -> Tuple[np.ndarray, List[str]]:
+    """Stream examples through nlp.pipe; return the (n, n_labels) score matrix
+    and the gold labels, without holding all docs in memory.
+
+    With several processes each worker loads the model once and sends back
+    only the score block of its chunk, which is far cheaper than shipping
+    Docs back the way nlp.pipe(n_process=...) does.
+    """
+    gold = []
+
+    def chunks():
+        chunk = []
+        for text, label in examples:
+            gold.append(label)
+            chunk.append(text)
+            if len(chunk) == CHUNK_ROWS:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    if n_process > 1:
+        import multiprocessing
+        with multiprocessing.Pool(n_process, initializer=init_scoring_worker, initargs=(model_path, batch_size)) as pool:
+            blocks = list(pool.imap(score_chunk, chunks()))
+    else:
+        blocks = [score_texts(nlp, chunk, labels, batch_size) for chunk in chunks()]
+    if not blocks:
+        return np.empty((0, len(labels)), dtype=np.float32), gold
+    return np.concatenate(blocks), gold
+
+
+# --- Metrics ----------------------------------------------------------------
+
+def apply_thresholds(scores: np.ndarray, thresholds: np.ndarray, fallback_index: int) -> np.ndarray:
+    """Predicted label index per row, `fallback_index` below the intent's threshold"""
+    predicted = scores.argmax(axis=1)
+    confidence = scores[np.arange(len(scores)), predicted]
+    return np.where(confidence >= thresholds[predicted], predicted, fallback_index)
+
+
+def classification_report(y: np.ndarray, predicted: np.ndarray, names: List[str]) -> dict:
+    n = len(names)
+    confusion = np.bincount(y * n + predicted, minlength=n * n).reshape(n, n)
+    true_positives = np.diag(confusion).astype(np.float64)
+    predicted_counts = confusion.sum(axis=0)
+    support = confusion.sum(axis=1)
+    precision = np.divide(true_positives, predicted_counts, out=np.zeros(n), where=predicted_counts > 0)
+    recall = np.divide(true_positives, support, out=np.zeros(n), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(n), where=(precision + recall) > 0)
+    return {
+        "accuracy": float(true_positives.sum() / max(1, len(y))),
+        "macro_f1": float(f1[support > 0].mean()) if (support > 0).any() else 0.0,
+        "per_intent": {
+            name: {"precision": round(float(precision[i]), 4), "recall": round(float(recall[i]), 4),
+                   "f1": round(float(f1[i]), 4), "support": int(support[i])}
+            for i, name in enumerate(names)
+        },
+        "confusion_matrix": {"labels": names, "matrix": confusion.tolist()},
+    }
+
+
+def sweep(confidence: np.ndarray, correct: np.ndarray, gold_fallback: np.ndarray,
+          grid: np.ndarray) -> dict:
+    """Outcome of every threshold in `grid` at once.
+
+    Messages at or above the threshold keep their prediction (right when
+    `correct`); the rest get the fallback answer (right when the gold label
+    is the fallback intent). Sorting once and using cumulative sums makes
+    each threshold a binary search instead of a pass over the data.
+    """
+    order = np.argsort(confidence, kind="stable")
+    ascending = confidence[order]
+    # Prefix sums over messages sorted by descending confidence
+    correct_desc = np.concatenate([[0], np.cumsum(correct[order][::-1])])
+    fallback_desc = np.concatenate([[0], np.cumsum(gold_fallback[order][::-1])])
+
+    answered = len(confidence) - np.searchsorted(ascending, grid, side="left")
+    correct_answered = correct_desc[answered]
+    fallback_rejected = fallback_desc[-1] - fallback_desc[answered]
+    return {
+        "answered": answered,
+        "correct_answered": correct_answered,
+        "right": correct_answered + fallback_rejected,
+    }
+
+
+def choose(result: dict, grid: np.ndarray, objective: str, min_precision: float,
+           prefer: Optional[float] = None) -> Optional[int]:
+    """Index of the best threshold in `grid` for the objective (None: none qualifies).
+
+    Among equally accurate thresholds the one closest to `prefer` wins, so
+    per-intent thresholds only move away from the global one when it helps.
+    """
+    if objective == "accuracy":
+        best = np.flatnonzero(result["right"] == result["right"].max())
+        if prefer is None:
+            return int(best[0])
+        return int(best[np.argmin(np.abs(grid[best] - prefer))])
+    precision = np.divide(result["correct_answered"], result["answered"],
+                          out=np.zeros(len(grid)), where=result["answered"] > 0)
+    ok = np.flatnonzero((precision >= min_precision) & (result["answered"] > 0))
+    # Lowest qualifying threshold answers the most messages
+    return int(ok[0]) if len(ok) else None
+
+
+def threshold_grid(confidence: np.ndarray, size: int) -> np.ndarray:
+    evenly = np.linspace(0.0, 1.0, size)
+    quantiles = np.quantile(confidence, np.linspace(0.0, 1.0, size)) if len(confidence) else []
+    return np.unique(np.concatenate([evenly, quantiles]).astype(np.float32))
+
+
+def sweep_thresholds(scores: np.ndarray, y: np.ndarray, names: List[str], fallback_index: int,
+                     args) -> dict:
+    predicted = scores.argmax(axis=1)
+    confidence = scores[np.arange(len(scores)), predicted]
+    correct = predicted == y
+    gold_fallback = y == fallback_index
+    grid = threshold_grid(confidence, args.grid)
+
+    overall = sweep(confidence, correct, gold_fallback, grid)
+    best = choose(overall, grid, args.objective, args.min_precision)
+    global_threshold = float(grid[best]) if best is not None else 1.0
+
+    # Predictions of different intents don't interact, so each intent's
+    # threshold can be optimized on its own slice of the data
+    per_intent = {}
+    for index, name in enumerate(names[:len(scores[0])]):
+        mask = predicted == index
+        if name == FALLBACK or mask.sum() < args.min_support:
+            continue
+        result = sweep(confidence[mask], correct[mask], gold_fallback[mask], grid)
+        chosen = choose(result, grid, args.objective, args.min_precision, prefer=global_threshold)
+        per_intent[name] = float(grid[chosen]) if chosen is not None else 1.0
+
+    return {
+        "grid_size": int(len(grid)),
+        "global": global_threshold,
+        "per_intent": per_intent,
+        "global_curve": {
+            "threshold": grid[::max(1, len(grid) // 50)].round(4).tolist(),
+            "accuracy": (overall["right"] / max(1, len(y)))[::max(1, len(grid) // 50)].round(4).tolist(),
+            "coverage": (overall["answered"] / max(1, len(y)))[::max(1, len(grid) // 50)].round(4).tolist(),
+        },
+    }
+
+
+def print_report(title: str, report: dict):
+    print(f"\n📊 {title}: accuracy {report['accuracy']:.3f}, macro F1 {report['macro_f1']:.3f}")
+    print(f"   {'intent':<18}{'precision':>10}{'recall':>8}{'f1':>8}{'support':>9}")
+    for name, stats in report["per_intent"].items():
+        if stats["support"] or stats["precision"]:
+            print(f"   {name:<18}{stats['precision']:>10.3f}{stats['recall']:>8.3f}{stats['f1']:>8.3f}{stats['support']:>9}")
+
+
+def main():
+    args = parse_args()
+
+    nlp = load_model(args.model)
+    labels = textcat_labels(nlp)
+    if not labels:
+        print(f"❌ {args.model} has no textcat labels")
+        return 1
+    print(f"✅ Model loaded from {args.model} ({len(labels)} intents)")
+
+    started = time.perf_counter()
+    scores, gold = score_examples(nlp, args.model, read_examples(args.data), labels,
+                                  args.n_process, args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"⚡ Scored {len(gold)} messages in {elapsed:.2f}s ({len(gold) / max(elapsed, 1e-9):.0f} msg/s)")
+    if not gold:
+        print("❌ No labeled messages found")
+        return 1
+
+    # Gold labels the model doesn't know get their own rows; they can never be right
+    names = list(labels)
+    if FALLBACK not in names:
+        names.append(FALLBACK)
+    for label in dict.fromkeys(gold):
+        if label not in names:
+            names.append(label)
+    index = {name: i for i, name in enumerate(names)}
+    y = np.fromiter((index[label] for label in gold), dtype=np.int64, count=len(gold))
+    fallback_index = index[FALLBACK]
+    unknown = int((y >= len(labels) + (FALLBACK not in labels)).sum())
+    if unknown:
+        print(f"⚠️  {unknown} messages have gold labels the model can't predict")
+
+    started = time.perf_counter()
+    no_threshold = np.zeros(len(names), dtype=np.float32)
+    report = {"model": args.model, "data": args.data, "messages": len(gold)}
+    report["argmax"] = classification_report(y, apply_thresholds(scores, no_threshold, fallback_index), names)
+
+    thresholds = sweep_thresholds(scores, y, names, fallback_index, args)
+    global_only = np.full(len(names), thresholds["global"], dtype=np.float32)
+    per_intent = global_only.copy()
+    for name, value in thresholds["per_intent"].items():
+        per_intent[index[name]] = value
+    report["global_threshold"] = classification_report(y, apply_thresholds(scores, global_only, fallback_index), names)
+    report["per_intent_thresholds"] = classification_report(y, apply_thresholds(scores, per_intent, fallback_index), names)
+    report["thresholds"] = thresholds
+    print(f"⚡ Swept {thresholds['grid_size']} thresholds globally and per intent in {time.perf_counter() - started:.2f}s")
+
+    print_report("No threshold (argmax)", report["argmax"])
+    print_report(f"Global threshold {thresholds['global']:.4f}", report["global_threshold"])
+    print_report("Per-intent thresholds", report["per_intent_thresholds"])
+    for name, value in thresholds["per_intent"].items():
+        print(f"   🎚️  {name}: {value:.4f}")
+
+    if args.thresholds_out:
+        with open(args.thresholds_out, "w", encoding="utf-8") as f:
+            json.dump({
+                "global": thresholds["global"],
+                "per_intent": thresholds["per_intent"],
+                "model": args.model,
+                "data": args.data,
+                "objective": args.objective,
+                "accuracy": report["per_intent_thresholds"]["accuracy"],
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }, f, indent=2)
+        print(f"\n💾 Thresholds written to {args.thresholds_out}")
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,39 @@
 # Enhanced main.py for better backend integration
-from fastapi import FastAPI
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import anyio.from_thread
+from fastapi import Depends, FastAPI, Header, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import spacy
 import random
+import hashlib
+import ipaddress
 import json
 import os
-from typing import Optional
+import signal
+import threading
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import List, Optional
 import logging
+import asyncio
+from admission import AdmissionController, Overloaded
+from metrics import (CONTENT_TYPE, Counter, Gauge, Histogram, MetricsRegistry,
+                     RequestTimingMiddleware, StageTimer)
+from micro_batcher import MicroBatcher
+from model_registry import LoadedModel, ModelRegistry
+from normalization import normalize_message
+from pattern_index import PatternIndex
+from profiling import Profiler
+from request_logging import RequestLog
+from response_catalog import CatalogWatcher, ResponseCatalog
+from result_cache import ResultCache
+from retrieval_index import RetrievalIndex
+from shadow import ShadowEvaluator
+from thresholds import default_thresholds, load_thresholds
+from uds_server import UdsServer
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -18,6 +44,8 @@ class ChatRequest(BaseModel):
     message: str
     userId: Optional[str] = None
     isAdmin: Optional[bool] = False
+    # Registry model to answer with ("name" or "name@version"); unset uses the default model
+    model: Optional[str] = None
 
 # Enhanced response model  
 class ChatResponse(BaseModel):
@@ -25,30 +53,577 @@ class ChatResponse(BaseModel):
     intent: str
     confidence: float
 
-# Load training JSON file
-try:
-    with open(os.path.join(os.path.dirname(__file__), 'data', 'training_data.json'), 'r', encoding='utf-8') as f:
-        training_data = json.load(f)
-    logger.info("Training data loaded successfully")
-except FileNotFoundError:
-    logger.error("Training data file not found")
-    training_data = {"intents": []}
-
-# Load your trained Spanish NLP model
-try:
-    nlp = spacy.load("./enhanced_output/model-last")  # Adjust path to your trained model
-    logger.info("Enhanced NLP model loaded successfully")
-except IOError:
-    logger.warning("Enhanced model not found, trying original output")
-    try:
-        nlp = spacy.load("./output/model-best")
+# Batch request model for bulk jobs (re-scoring exports, QA sets)
+class BatchChatRequest(BaseModel):
+    messages: List[ChatRequest]
+    batchSize: Optional[int] = None
+    model: Optional[str] = None
+
+# Admin request model for reloading the response catalog
+class CatalogReloadRequest(BaseModel):
+    source: Optional[str] = None
+
+# Admin request model for hot swapping the model
+class ModelReloadRequest(BaseModel):
+    path: Optional[str] = None
+
+# Admin request model for an on-demand profile: `kind` is "sample",
+# "deterministic" or "memory"; the window ends after `requests` requests or
+# `seconds` seconds, whichever comes first
+class ProfileRequest(BaseModel):
+    kind: str = "sample"
+    requests: Optional[int] = None
+    seconds: Optional[float] = None
+    intervalMs: Optional[float] = None
+    includeIdle: Optional[bool] = False
+    format: Optional[str] = None
+    frames: Optional[int] = None
+    top: Optional[int] = None
+
+# Admin request model for pointing shadow evaluation at another candidate
+class ShadowConfigRequest(BaseModel):
+    model: Optional[str] = None
+    sampleRate: Optional[float] = None
+
+# Default nlp.pipe batch size for /chatbot/batch
+BATCH_SIZE = int(os.getenv("NLP_BATCH_SIZE", "64"))
+
+# Optional micro-batching of concurrent /chatbot requests
+MICROBATCH_ENABLED = os.getenv("NLP_MICROBATCH", "0").lower() in ("1", "true", "yes")
+MICROBATCH_SIZE = int(os.getenv("NLP_MICROBATCH_SIZE", "32"))
+MICROBATCH_WAIT_MS = float(os.getenv("NLP_MICROBATCH_WAIT_MS", "5"))
+
+# Admission control: at most NLP_MAX_CONCURRENCY model calls at once (0
+# disables the limit); a request that can't start within the queue deadline
+# is shed, with a degraded answer or a 503 depending on NLP_SHED_MODE
+MAX_CONCURRENCY = int(os.getenv("NLP_MAX_CONCURRENCY", "0"))
+QUEUE_TIMEOUT_MS = float(os.getenv("NLP_QUEUE_TIMEOUT_MS", "100"))
+MAX_QUEUE = int(os.getenv("NLP_MAX_QUEUE", "256"))
+SHED_MODE = os.getenv("NLP_SHED_MODE", "degrade").lower()
+if SHED_MODE not in ("degrade", "reject"):
+    logger.warning(f"Unknown NLP_SHED_MODE '{SHED_MODE}', using 'degrade'")
+    SHED_MODE = "degrade"
+
+# Cache of textcat scores per normalized message (size 0 disables it)
+CACHE_SIZE = int(os.getenv("NLP_CACHE_SIZE", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("NLP_CACHE_TTL", "3600"))
+
+# Intents JSON files the response catalog can be (re)loaded from
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+CATALOG_SOURCES = {
+    "training": os.path.join(DATA_DIR, 'training_data.json'),
+    "enhanced": os.path.join(DATA_DIR, 'enhanced_training_data.json'),
+}
+CATALOG_SOURCE = os.getenv("NLP_CATALOG_SOURCE", "training")
+# Seconds between checks of the catalog file for changes (0 disables the watcher)
+CATALOG_WATCH_SECONDS = float(os.getenv("NLP_CATALOG_WATCH_SECONDS", "0"))
+
+# Shared secret for the /admin endpoints (unset means they only answer
+# clients on the loopback interface)
+ADMIN_TOKEN = os.getenv("NLP_ADMIN_TOKEN")
+
+# Answer verbatim training patterns without running the model
+FAST_PATH_ENABLED = os.getenv("NLP_FAST_PATH", "1").lower() in ("1", "true", "yes")
+
+# Second opinion for low-confidence messages: the intent of the most similar
+# training pattern (character n-gram TF-IDF cosine), when at least this
+# similar. The index is memory-mapped from NLP_RETRIEVAL_INDEX and only
+# rebuilt when the patterns change
+RETRIEVAL_ENABLED = os.getenv("NLP_RETRIEVAL", "1").lower() in ("1", "true", "yes")
+RETRIEVAL_THRESHOLD = float(os.getenv("NLP_RETRIEVAL_THRESHOLD", "0.5"))
+RETRIEVAL_INDEX_DIR = os.getenv("NLP_RETRIEVAL_INDEX", "./retrieval_index")
+
+# Model directory to serve; unset tries the enhanced model, then the original one
+MODEL_PATH = os.getenv("NLP_MODEL_PATH")
+
+# Extra models served side by side with the default one, loaded on demand by
+# name/version and evicted least recently used first past the memory budget
+MODEL_REGISTRY_PATH = os.getenv("NLP_MODEL_REGISTRY", "./models.json")
+MODEL_MEMORY_MB = float(os.getenv("NLP_MODEL_MEMORY_MB", "0"))
+
+# Shadow evaluation: a sample of /chatbot messages is scored again, in a
+# background thread, by a candidate model (a registry name or a model
+# directory) and its answers are compared with the served ones
+SHADOW_MODEL = os.getenv("NLP_SHADOW_MODEL")
+SHADOW_SAMPLE_RATE = float(os.getenv("NLP_SHADOW_SAMPLE_RATE", "0.1"))
+SHADOW_QUEUE_SIZE = int(os.getenv("NLP_SHADOW_QUEUE_SIZE", "1000"))
+
+# Scoring engine: "spacy" runs the trained pipeline, "numpy" scores the
+# TextCatBOW weights exported with `python bow_engine.py export` without spaCy
+ENGINE = os.getenv("NLP_ENGINE", "spacy").lower()
+BOW_EXPORT_PATH = os.getenv("NLP_BOW_EXPORT", "./bow_export")
+
+# Per-request log records: share of routine predictions kept (fallbacks,
+# errors and shed requests are always logged) and how many records may wait
+# for the writer thread
+LOG_SAMPLE_RATE = float(os.getenv("NLP_LOG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.getenv("NLP_LOG_QUEUE_SIZE", "10000"))
+
+# Optional Unix domain socket listener with length-prefixed msgpack (or
+# json) frames, next to HTTP; see uds_server.py for the protocol
+UDS_PATH = os.getenv("NLP_UDS_PATH")
+UDS_CODEC = os.getenv("NLP_UDS_CODEC", "msgpack").lower()
+
+# Upper bound of an on-demand profiling window (see profiling.py)
+PROFILE_MAX_SECONDS = float(os.getenv("NLP_PROFILE_MAX_SECONDS", "60"))
+
+# Worker identity, set by serve.py in each forked inference worker
+WORKER_ID = None
+# Listening socket for the UDS listener, bound by serve.py before forking
+uds_socket = None
+uds_server = None
+WORKER_STARTED_AT = time.time()
+requests_served = 0
+
+# Global and per-intent thresholds written by `python evaluate.py ... --thresholds-out`
+THRESHOLDS_PATH = os.getenv("NLP_THRESHOLDS", "./thresholds.json")
+
+# Loaded with the model by load_service() and swap_model()
+thresholds = default_thresholds()
+
+def load_catalog(source: str) -> ResponseCatalog:
+    """Build the response catalog from one of CATALOG_SOURCES"""
+    if source not in CATALOG_SOURCES:
+        raise ValueError(f"Unknown catalog source '{source}'")
+    return ResponseCatalog.from_file(CATALOG_SOURCES[source])
+
+def reload_catalog(source: Optional[str] = None) -> ResponseCatalog:
+    """Build a new catalog and swap it in; in-flight requests keep the old one"""
+    global catalog, pattern_index, retrieval_index
+    new_catalog = load_catalog(source or catalog_source())
+    new_index = build_pattern_index(new_catalog)
+    new_retrieval = build_retrieval_index(new_catalog)
+    catalog, pattern_index, retrieval_index = new_catalog, new_index, new_retrieval
+    logger.info(f"Response catalog reloaded (version {new_catalog.version}, {len(new_catalog.responses)} intents)")
+    return new_catalog
+
+async def reload_catalog_in_background():
+    """SIGUSR1 handler: reload the catalog off the event loop"""
+    try:
+        await run_in_threadpool(reload_catalog)
+    except Exception as e:
+        logger.error(f"Catalog reload after SIGUSR1 failed: {str(e)}")
+
+def build_pattern_index(new_catalog: ResponseCatalog) -> PatternIndex:
+    index = PatternIndex(new_catalog.patterns)
+    # Keep the hit-rate counters across catalog reloads
+    if pattern_index is not None:
+        index.hits, index.misses = pattern_index.hits, pattern_index.misses
+    return index
+
+def build_retrieval_index(new_catalog: ResponseCatalog) -> Optional[RetrievalIndex]:
+    """Load (or build, if the patterns changed) the nearest-pattern index;
+    None when disabled or unavailable, which only turns the second opinion off"""
+    if not RETRIEVAL_ENABLED or not new_catalog.patterns:
+        return None
+    try:
+        index = RetrievalIndex.build_or_load(RETRIEVAL_INDEX_DIR, new_catalog.patterns)
+    except (OSError, ValueError) as e:
+        logger.error(f"Retrieval index in {RETRIEVAL_INDEX_DIR} is not usable: {str(e)}")
+        return None
+    # Keep the lookup counters across catalog reloads
+    if retrieval_index is not None:
+        index.lookups, index.lookup_seconds = retrieval_index.lookups, retrieval_index.lookup_seconds
+    return index
+
+def catalog_source() -> str:
+    for name, path in CATALOG_SOURCES.items():
+        if path == catalog.source:
+            return name
+    return CATALOG_SOURCE
+
+# The training data and model are loaded by load_service() once the server
+# has started, so the app binds its port before the slow work happens
+catalog = ResponseCatalog([])
+pattern_index = None
+pattern_index = build_pattern_index(catalog)
+retrieval_index = None
+
+catalog_watcher = (
+    CatalogWatcher(lambda: catalog.source, reload_catalog, interval=CATALOG_WATCH_SECONDS)
+    if CATALOG_WATCH_SECONDS > 0 else None
+)
+
+result_cache = ResultCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL_SECONDS)
+
+admission = AdmissionController(MAX_CONCURRENCY, queue_timeout=QUEUE_TIMEOUT_MS / 1000.0, max_queue=MAX_QUEUE)
+
+request_log = RequestLog(sample_rate=LOG_SAMPLE_RATE, queue_size=LOG_QUEUE_SIZE)
+
+profiler = Profiler(max_seconds=PROFILE_MAX_SECONDS)
+
+# Prometheus metrics served on /metrics
+metrics = MetricsRegistry()
+request_seconds = metrics.register(Histogram(
+    "nlp_request_duration_seconds", "HTTP request latency", ["path"]))
+stage_seconds = metrics.register(Histogram(
+    "nlp_chatbot_stage_duration_seconds", "Time /chatbot requests spend in each stage", ["stage"]))
+intent_predictions = metrics.register(Counter(
+    "nlp_intent_predictions_total", "Answers given per predicted intent", ["intent"]))
+fallbacks = metrics.register(Counter(
+    "nlp_fallbacks_total", "Fallback and error answers per reason", ["reason"]))
+model_predictions = metrics.register(Counter(
+    "nlp_model_predictions_total", "Messages classified per model version", ["version"]))
+model_info_gauge = metrics.register(Gauge(
+    "nlp_model_info", "Model currently served (always 1)", ["version", "path"]))
+shadow_seconds = metrics.register(Histogram(
+    "nlp_shadow_duration_seconds", "Time the shadow candidate model takes per message"))
+shadow_outcomes = metrics.register(Counter(
+    "nlp_shadow_messages_total", "Shadowed messages per outcome (agree, disagree, dropped, error)", ["outcome"]))
+retrieval_lookups = metrics.register(Counter(
+    "nlp_retrieval_lookups_total", "Low-confidence messages looked up in the pattern index per outcome (hit, miss)",
+    ["outcome"]))
+
+def load_model_path(path: str):
+    """Load a spaCy model directory, or a NumPy BOW export"""
+    from bow_engine import BowEngine, is_bow_export
+    if is_bow_export(path):
+        return BowEngine(path, require_parity=True)
+    import spacy
+    return spacy.load(path)
+
+def load_model() -> tuple:
+    """Load the trained Spanish NLP model, returning it with its path"""
+    if ENGINE == "numpy":
+        from bow_engine import BowEngine
+        try:
+            model = BowEngine(BOW_EXPORT_PATH, require_parity=True)
+            logger.info("NumPy BOW engine loaded successfully")
+            return model, BOW_EXPORT_PATH
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"NumPy BOW export not usable ({str(e)}), falling back to spaCy")
+    if MODEL_PATH:
+        model = load_model_path(MODEL_PATH)
+        logger.info(f"NLP model loaded successfully from {MODEL_PATH}")
+        return model, MODEL_PATH
+    import spacy
+    try:
+        model = spacy.load("./enhanced_output/model-last")  # Adjust path to your trained model
+        logger.info("Enhanced NLP model loaded successfully")
+        return model, "./enhanced_output/model-last"
+    except IOError:
+        logger.warning("Enhanced model not found, trying original output")
+    try:
+        model = spacy.load("./output/model-best")
         logger.info("Original NLP model loaded successfully")
+        return model, "./output/model-best"
     except IOError:
         logger.error("No trained model found, using fallback")
-        nlp = spacy.blank("es")
+        return spacy.blank("es"), None
+
+def model_version(model, path: Optional[str]) -> str:
+    """Identify a model by its meta name/version plus a hash of its meta.json"""
+    if path is None:
+        return f"blank-{model.lang}"
+    meta = model.meta
+    version = f"{meta.get('name', 'pipeline')}-{meta.get('version', '0.0.0')}"
+    try:
+        with open(os.path.join(path, "meta.json"), "rb") as f:
+            version += "+" + hashlib.sha1(f.read()).hexdigest()[:8]
+    except OSError:
+        pass
+    return version
+
+def model_labels(model) -> set:
+    labels = set()
+    for name, pipe_labels in model.pipe_labels.items():
+        if "textcat" in name:
+            labels.update(pipe_labels)
+    return labels
+
+def use_model(model, path: Optional[str], load_seconds: float = 0.0):
+    """Serve `model` from now on, dropping results cached from the previous one.
+
+    Requests already scoring with the old model keep their reference to it
+    and finish normally; new requests pick up the new global.
+    """
+    global nlp, model_path, model_info
+    nlp = model
+    model_path = path
+    model_info = {
+        "path": path,
+        "version": model_version(model, path),
+        "loaded_at": time.time(),
+        "load_seconds": round(load_seconds, 3),
+    }
+    publish_model_info()
+    result_cache.clear()
+
+def publish_model_info():
+    model_info_gauge.clear()
+    model_info_gauge.set(model_info["version"], str(model_info["path"]), value=1)
+
+nlp, model_path, model_info = None, None, {}
+
+def warm_up_model(model, batch_size: int = BATCH_SIZE) -> int:
+    """Run every training pattern through `model` so first requests aren't cold"""
+    patterns = [pattern for pattern, _ in catalog.patterns] or ["hola"]
+    for _ in model.pipe(patterns, batch_size=batch_size):
+        pass
+    return len(patterns)
+
+# State of the last background model reload, reported by /health
+model_reload_lock = threading.Lock()
+model_reload_state = {"status": "idle"}
+
+def swap_model(path: str):
+    """Load, validate and warm up a model directory, then swap it in.
+
+    The serving model only changes once the candidate has loaded, its labels
+    match the response catalog and it has been warmed up. If the swapped-in
+    model then fails a smoke test, the previous model is restored.
+    """
+    global nlp, model_path, model_info, model_reload_state, thresholds
+    model_reload_state = {"status": "loading", "path": path, "started_at": time.time()}
+    previous = (nlp, model_path, model_info, thresholds)
+    try:
+        started = time.perf_counter()
+        candidate = load_model_path(path)
+        
+        labels = model_labels(candidate)
+        if not labels:
+            raise ValueError("Model has no textcat labels")
+        unknown = labels - set(catalog.tags)
+        if unknown:
+            raise ValueError(f"Model labels missing from the response catalog: {sorted(unknown)}")
+        missing = set(catalog.tags) - labels
+        if missing:
+            logger.warning(f"Catalog intents the new model can't predict: {sorted(missing)}")
+        
+        warmed = warm_up_model(candidate)
+        use_model(candidate, path, load_seconds=time.perf_counter() - started)
+        # A retrained model usually comes with re-tuned thresholds
+        thresholds = load_thresholds(THRESHOLDS_PATH)
+    except Exception as e:
+        logger.error(f"Model reload from {path} failed, keeping {model_path}: {str(e)}")
+        model_reload_state = {**model_reload_state, "status": "failed", "error": str(e), "finished_at": time.time()}
+        return
+    
+    try:
+        score_message("hola")
+    except Exception as e:
+        logger.error(f"New model failed its smoke test, rolling back to {previous[1]}: {str(e)}")
+        nlp, model_path, model_info, thresholds = previous
+        publish_model_info()
+        result_cache.clear()
+        model_reload_state = {**model_reload_state, "status": "rolled_back", "error": str(e), "finished_at": time.time()}
+        return
+    
+    logger.info(f"Swapped in model {model_info['version']} from {path} (warmed up on {warmed} patterns)")
+    model_reload_state = {**model_reload_state, "status": "ok", "version": model_info["version"], "finished_at": time.time()}
+
+def start_model_reload(path: Optional[str] = None) -> bool:
+    """Reload the model in a background thread; False if a reload is already running"""
+    path = path or model_path
+    if path is None:
+        raise ValueError("No model path given and no trained model is loaded")
+    if not model_reload_lock.acquire(blocking=False):
+        return False
+    
+    def run():
+        try:
+            swap_model(path)
+        finally:
+            model_reload_lock.release()
+    
+    threading.Thread(target=run, name="model-reload", daemon=True).start()
+    return True
+
+def load_registry_model(path: str) -> tuple:
+    """Loader for the model registry: a warmed-up model with its version and
+    the thresholds tuned for it (a thresholds.json next to the model)"""
+    model = load_model_path(path)
+    if not model_labels(model):
+        raise ValueError(f"Model at {path} has no textcat labels")
+    warm_up_model(model)
+    return model, model_version(model, path), load_thresholds(os.path.join(path, "thresholds.json"))
+
+model_registry = ModelRegistry.from_file(MODEL_REGISTRY_PATH, load_registry_model,
+                                         memory_budget_mb=MODEL_MEMORY_MB)
+
+# Candidate for shadow evaluation, and the model loaded for it when it is a
+# directory rather than a registry name
+shadow_model = SHADOW_MODEL
+shadow_candidate_cache = {}
+
+def shadow_candidate() -> LoadedModel:
+    """The shadow candidate, loading it if needed (runs in the shadow thread)"""
+    name = shadow_model
+    if name is None:
+        raise ValueError("No shadow candidate configured")
+    if name in shadow_candidate_cache:
+        return shadow_candidate_cache[name]
+    try:
+        # Registry models come and go with the registry's memory budget
+        return model_registry.get(name)
+    except KeyError:
+        pass
+    started = time.perf_counter()
+    model, version, candidate_thresholds = load_registry_model(name)
+    candidate = LoadedModel(name, name, model, version, candidate_thresholds, 0, time.perf_counter() - started)
+    shadow_candidate_cache.clear()
+    shadow_candidate_cache[name] = candidate
+    logger.info(f"Shadow candidate {version} loaded from {name}")
+    return candidate
+
+def shadow_predict(message: str) -> tuple:
+    """The candidate's intent and confidence for a message, like the served
+    answer but without touching the serving metrics or the result cache"""
+    candidate = shadow_candidate()
+    cats = score_message(message, model=candidate.model)
+    # The same decision rule as the served answer, second opinion included
+    predicted_intent, confidence, reason = pick_intent(cats, candidate.thresholds)
+    if reason is not None:
+        nearest = nearest_pattern(message, record=False)
+        if nearest is not None:
+            return nearest
+    return predicted_intent, confidence
+
+shadow = ShadowEvaluator(shadow_predict, prepare=shadow_candidate,
+                         sample_rate=SHADOW_SAMPLE_RATE if SHADOW_MODEL else 0.0,
+                         queue_size=SHADOW_QUEUE_SIZE, histogram=shadow_seconds, outcomes=shadow_outcomes)
+
+def score_message(message: str, stages: Optional[dict] = None, model=None) -> dict:
+    """Run a single message through the model and return its textcat scores.
+
+    Tokenization and the pipeline components run as separate steps (as in
+    nlp(message)) so their seconds can be added to `stages` when given.
+    """
+    model = nlp if model is None else model
+    started = time.perf_counter()
+    doc = model.make_doc(message)
+    tokenized = time.perf_counter()
+    for _, proc in model.pipeline:
+        doc = proc(doc)
+    if stages is not None:
+        stages["tokenization"] = tokenized - started
+        stages["textcat"] = time.perf_counter() - tokenized
+    return doc.cats
+
+def score_messages(messages: List[str], batch_size: int = BATCH_SIZE,
+                   stages: Optional[dict] = None, model=None) -> List[dict]:
+    """Score many messages in batches, like nlp.pipe, timing stages as score_message does"""
+    model = nlp if model is None else model
+    started = time.perf_counter()
+    docs = [model.make_doc(message) for message in messages]
+    tokenized = time.perf_counter()
+    for _, proc in model.pipeline:
+        if hasattr(proc, "pipe"):
+            docs = list(proc.pipe(docs, batch_size=batch_size))
+        else:
+            docs = [proc(doc) for doc in docs]
+    if stages is not None:
+        stages["tokenization"] = tokenized - started
+        stages["textcat"] = time.perf_counter() - tokenized
+    return [doc.cats for doc in docs]
+
+def score_messages_staged(messages: List[str]) -> List[tuple]:
+    """score_messages for the micro-batcher: every result carries its batch's stage times"""
+    stages = {}
+    return [(cats, stages) for cats in profiler.wrap(score_messages)(messages, stages=stages)]
+
+micro_batcher = (
+    MicroBatcher(score_messages_staged, max_batch_size=MICROBATCH_SIZE, max_wait_ms=MICROBATCH_WAIT_MS)
+    if MICROBATCH_ENABLED else None
+)
+
+# Startup progress: starting -> loading -> warming_up -> ready (or failed)
+startup_state = {"phase": "starting", "error": None}
+startup_timings = {}
+
+def load_service() -> bool:
+    """Load the training data and model, then warm the model up.
+
+    The lifespan runs this in a worker thread right after the server binds.
+    serve.py calls it in the parent process before forking instead, so the
+    workers find everything loaded and are ready immediately.
+    """
+    global catalog, pattern_index, retrieval_index, thresholds
+    if startup_state["phase"] == "ready":
+        return True
+    try:
+        startup_state["phase"] = "loading"
+        started = time.perf_counter()
+        try:
+            new_catalog = load_catalog(CATALOG_SOURCE)
+            logger.info("Training data loaded successfully")
+        except FileNotFoundError:
+            logger.error("Training data file not found")
+            new_catalog = ResponseCatalog([])
+        catalog, pattern_index = new_catalog, build_pattern_index(new_catalog)
+        retrieval_index = build_retrieval_index(new_catalog)
+        startup_timings["catalog_load_seconds"] = round(time.perf_counter() - started, 3)
+        
+        # Load your trained Spanish NLP model
+        started = time.perf_counter()
+        model, path = load_model()
+        load_seconds = time.perf_counter() - started
+        use_model(model, path, load_seconds=load_seconds)
+        thresholds = load_thresholds(THRESHOLDS_PATH)
+        startup_timings["model_load_seconds"] = round(load_seconds, 3)
+        
+        # First calls pay for lazy allocations; do that before taking traffic
+        startup_state["phase"] = "warming_up"
+        started = time.perf_counter()
+        startup_timings["warm_up_patterns"] = warm_up_model(nlp)
+        score_message("hola")
+        startup_timings["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        logger.error(f"Service startup failed: {str(e)}")
+        startup_state.update(phase="failed", error=str(e))
+        return False
+    
+    startup_timings["total_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+    startup_state["phase"] = "ready"
+    logger.info(f"Service ready in {startup_timings['total_seconds']}s "
+                f"(import {startup_timings['import_seconds']}s, "
+                f"model load {startup_timings['model_load_seconds']}s, "
+                f"warm-up {startup_timings['warm_up_seconds']}s)")
+    return True
+
+def is_ready() -> bool:
+    return startup_state["phase"] == "ready"
+
+def startup_info() -> dict:
+    return {**startup_state, **startup_timings}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global uds_server
+    request_log.start()
+    shadow.start()
+    # Load in the background so the port is bound right away; /health/ready
+    # reports 503 until the model is loaded and warmed up
+    startup_task = asyncio.get_running_loop().create_task(run_in_threadpool(load_service))
+    # Background threads are started here rather than at import time so
+    # that each worker forked by serve.py gets its own. The watcher waits
+    # for the catalog to be loaded so it doesn't see that as a change
+    if catalog_watcher is not None:
+        startup_task.add_done_callback(lambda _: catalog_watcher.start())
+    # SIGHUP reloads the current model directory (e.g. after retraining in
+    # place) and SIGUSR1 the response catalog; serve.py forwards both
+    if hasattr(signal, "SIGHUP"):
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGHUP, start_model_reload)
+            loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(reload_catalog_in_background()))
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
+    if UDS_PATH or uds_socket is not None:
+        uds_server = UdsServer(handle_socket_request, path=UDS_PATH, sock=uds_socket, codec=UDS_CODEC)
+        await uds_server.start()
+    yield
+    if uds_server is not None:
+        await uds_server.stop()
+    if catalog_watcher is not None:
+        catalog_watcher.stop()
+    shadow.stop()
+    if not startup_task.done():
+        logger.warning("Shutting down before the service finished starting")
+    request_log.stop()
 
 # Create FastAPI app
-app = FastAPI(title="NutriSaas NLP Chatbot", version="1.0.0")
+app = FastAPI(title="NutriSaas NLP Chatbot", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -57,8 +632,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the browser frontend read the per-stage timings too
+    expose_headers=["Server-Timing"],
 )
 
+@lru_cache(maxsize=1)
+def route_paths() -> set:
+    return {route.path for route in app.routes}
+
+app.add_middleware(RequestTimingMiddleware, histogram=request_seconds, known_paths=route_paths)
+
 @app.get("/")
 def read_root():
     return {
@@ -72,10 +655,48 @@ def health_check():
     """Health check endpoint for backend monitoring"""
     return {
         "status": "healthy",
+        "ready": is_ready(),
+        "startup": startup_info(),
         "model_status": "loaded" if nlp else "not_loaded",
-        "intents_available": len(training_data.get("intents", []))
+        "model": {**model_info, "reload": model_reload_state},
+        "intents_available": len(catalog.responses),
+        "thresholds": thresholds,
+        "catalog": catalog.info(),
+        "fast_path": fast_path_stats(),
+        "retrieval": retrieval_stats(),
+        "cache": result_cache.stats(),
+        "micro_batching": micro_batcher.stats() if micro_batcher else {"enabled": False},
+        "admission": {**admission.stats(), "mode": SHED_MODE},
+        "request_log": request_log.stats(),
+        "profiling": profiler.stats(),
+        "models": model_registry.stats(),
+        "uds": uds_server.stats() if uds_server else {"enabled": False},
+        "worker": {
+            "id": WORKER_ID,
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - WORKER_STARTED_AT, 1),
+            "requests_served": requests_served
+        }
     }
 
+@app.get("/health/live")
+def liveness_check():
+    """Liveness probe: the process is up and answering HTTP"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness_check(response: Response):
+    """Readiness probe: 200 only once the model is loaded and warmed up"""
+    if not is_ready():
+        response.status_code = 503
+    return {"status": "ready" if is_ready() else startup_state["phase"], "startup": startup_info()}
+
+def require_ready():
+    """Guard for model endpoints while the service is still starting"""
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Model is still loading",
+                            headers={"Retry-After": "1"})
+
 def get_intent_response(intent_tag: str, user_id: str = None, is_admin: bool = False) -> str:
     """Get appropriate response for an intent"""
     
@@ -87,79 +708,558 @@ def get_intent_response(intent_tag: str, user_id: str = None, is_admin: bool = F
     if intent_tag == "goals" and user_id:
         return "Entiendo tus objetivos. Para ayudarte mejor, necesito saber más sobre ti. ¿Podrías contarme cuál es tu meta específica?"
     
-    # Find the intent in training data
-    for intent in training_data["intents"]:
-        if intent["tag"] == intent_tag:
-            return random.choice(intent["responses"])
+    # Find the intent in the response catalog
+    responses = catalog.get(intent_tag)
+    if responses:
+        return random.choice(responses)
     
     # Fallback response
     return "Una disculpa, mis habilidades no pueden solucionar esa pregunta por el momento."
 
-@app.post("/chatbot", response_model=ChatResponse)
-def process_message(request: ChatRequest):
-    """Main chatbot endpoint with enhanced functionality"""
+def pick_intent(cats: dict, active: dict) -> tuple:
+    """Predicted intent, confidence and fallback reason (or None) for textcat
+    scores under the `active` thresholds"""
+    
+    if not cats:
+        return "fallback", 0.0, "empty_cats"
+    
+    # Find the intent with highest probability
+    predicted_intent = max(cats, key=cats.get)
+    confidence = cats[predicted_intent]
+    
+    if confidence < active["per_intent"].get(predicted_intent, active["global"]):
+        return "fallback", 0.0, "low_confidence"
+    
+    return predicted_intent, confidence, None
+
+def resolve_intent(cats: dict, active: Optional[dict] = None, message: Optional[str] = None) -> tuple:
+    """Pick the predicted intent and confidence from textcat scores; when the
+    model isn't confident enough, the nearest training pattern of `message`
+    may still answer, with its similarity as the confidence"""
+    predicted_intent, confidence, reason = pick_intent(cats, active or thresholds)
+    if reason is not None:
+        nearest = nearest_pattern(message)
+        if nearest is not None:
+            return nearest
+        fallbacks.inc(reason)
+    return predicted_intent, confidence
+
+def nearest_pattern(message: Optional[str], record: bool = True) -> Optional[tuple]:
+    """(intent, similarity) of the most similar training pattern, if it
+    clears RETRIEVAL_THRESHOLD; `record` counts the lookup in the metrics"""
+    index = retrieval_index
+    if index is None or not message:
+        return None
+    found = index.nearest(message, RETRIEVAL_THRESHOLD)
+    if record:
+        retrieval_lookups.inc("miss" if found is None else "hit")
+    return found[:2] if found is not None else None
+
+def retrieval_stats() -> dict:
+    if retrieval_index is None:
+        return {"enabled": False}
+    return {"enabled": True, "threshold": RETRIEVAL_THRESHOLD, **retrieval_index.stats()}
+
+def build_chat_response(cats: dict, user_id: str = None, is_admin: bool = False,
+                        routed=None, message: Optional[str] = None) -> ChatResponse:
+    """Turn textcat scores into the ChatResponse returned to the backend;
+    `routed` is the registry model that scored them, if any, and `message`
+    the text, for the nearest-pattern second opinion"""
+    
+    if routed is None:
+        model_predictions.inc(model_info.get("version"))
+        predicted_intent, confidence = resolve_intent(cats, message=message)
+    else:
+        model_predictions.inc(routed.version)
+        predicted_intent, confidence = resolve_intent(cats, routed.thresholds, message)
+    return respond_to_intent(predicted_intent, confidence, user_id, is_admin)
+
+def respond_to_intent(predicted_intent: str, confidence: float, user_id: str = None,
+                      is_admin: bool = False) -> ChatResponse:
+    """Build the ChatResponse for an already predicted intent"""
     
+    intent_predictions.inc(predicted_intent)
+    
+    # Get appropriate response
+    response_text = get_intent_response(predicted_intent, user_id, is_admin)
+    
+    # Add personalization for logged-in users
+    if user_id and predicted_intent == "greeting":
+        response_text = "¡Hola de nuevo! " + response_text
+    
+    return ChatResponse(
+        response=response_text,
+        intent=predicted_intent,
+        confidence=float(confidence)
+    )
+
+def empty_message_response() -> ChatResponse:
+    fallbacks.inc("empty_message")
+    return ChatResponse(
+        response="Por favor, escribe un mensaje.",
+        intent="fallback",
+        confidence=0.0
+    )
+
+def degraded_response(message: str, user_id: str = None, is_admin: bool = False) -> ChatResponse:
+    """Cheap answer for a request shed under load: the intent of a verbatim
+    training pattern if there is one, else the fallback answer under its own
+    "degraded" intent so the backend can tell it apart"""
+    # With the fast path on, the pattern lookup already ran and missed
+    intent = pattern_index.lookup(message) if not FAST_PATH_ENABLED else None
+    if intent is not None:
+        return respond_to_intent(intent, 1.0, user_id, is_admin)
+    fallbacks.inc("shed")
+    return ChatResponse(
+        response=get_intent_response("fallback"),
+        intent="degraded",
+        confidence=0.0
+    )
+
+def error_response() -> ChatResponse:
+    fallbacks.inc("exception")
+    return ChatResponse(
+        response="Lo siento, ocurrió un error procesando tu mensaje. Por favor inténtalo de nuevo.",
+        intent="error",
+        confidence=0.0
+    )
+
+# Time spent in actual model calls, to estimate what the fast path saves
+model_calls = 0
+model_seconds = 0.0
+
+def match_known_pattern(message: str) -> Optional[str]:
+    """Intent of a verbatim training pattern, or None when the model must decide"""
+    if not FAST_PATH_ENABLED:
+        return None
+    return pattern_index.lookup(message)
+
+def fast_path_stats() -> dict:
+    stats = pattern_index.stats()
+    avg_model_ms = model_seconds * 1000.0 / model_calls if model_calls else 0.0
+    stats.update({
+        "enabled": FAST_PATH_ENABLED,
+        "avg_model_ms": round(avg_model_ms, 3),
+        "estimated_model_ms_saved": round(stats["hits"] * avg_model_ms, 1),
+    })
+    return stats
+
+async def classify_message(message: str, stages: Optional[dict] = None, routed=None) -> dict:
+    """Score one message, batched with other concurrent requests when micro-batching is enabled"""
+    global model_calls, model_seconds
+    # Raises Overloaded when no slot frees up before the queue deadline
+    await admission.admit()
+    try:
+        started = time.perf_counter()
+        if routed is not None:
+            # The micro-batcher only scores with the default model
+            cats = await run_in_threadpool(profiler.wrap(score_message), message, stages, routed.model)
+        elif micro_batcher is not None:
+            cats, batch_stages = await micro_batcher.submit(message)
+            if stages is not None:
+                stages.update(batch_stages)
+        else:
+            cats = await run_in_threadpool(profiler.wrap(score_message), message, stages)
+    finally:
+        admission.release()
+    model_calls += 1
+    model_seconds += time.perf_counter() - started
+    return cats
+
+def timed_response(chat_response: ChatResponse, timer: StageTimer) -> Response:
+    """Serialize the response here rather than in FastAPI, so serialization is
+    timed too and the stage timings can go out in a Server-Timing header"""
+    body = chat_response.model_dump_json()
+    timer.mark("serialization")
+    timer.observe(stage_seconds)
+    return Response(content=body, media_type="application/json",
+                    headers={"Server-Timing": timer.server_timing()})
+
+def log_chat_request(message: str, user_id: Optional[str], is_admin: bool, response: ChatResponse,
+                     source: str, timer: StageTimer):
+    """One structured record per /chatbot request; fallbacks, errors and shed
+    requests are never sampled out"""
+    request_log.log(
+        "chatbot_request",
+        always=response.intent in ("fallback", "error", "degraded"),
+        message=message,
+        user_id=user_id,
+        is_admin=is_admin,
+        intent=response.intent,
+        confidence=round(response.confidence, 4),
+        source=source,
+        duration_ms=round((timer.last - timer.started) * 1000.0, 3),
+    )
+
+def cache_key(message: str, routed=None) -> str:
+    key = normalize_message(message)
+    return key if routed is None else f"{routed.key}\x00{key}"
+
+def route_model(name: Optional[str]):
+    """Registry model a request asked for, loading it if needed (blocking);
+    None for the default model. KeyError for unknown models"""
+    if not name:
+        return None
+    return model_registry.get(name)
+
+async def route_model_async(name: Optional[str]):
+    if not name:
+        return None
+    # Already loaded models are answered without a thread hop
+    return model_registry.lookup(name) or await run_in_threadpool(model_registry.get, name)
+
+def routing_error(name: str, error: Exception) -> HTTPException:
+    if isinstance(error, KeyError):
+        return HTTPException(status_code=404, detail=f"Unknown model '{name}'")
+    logger.error(f"Loading model '{name}' failed: {str(error)}")
+    return HTTPException(status_code=503, detail=f"Model '{name}' could not be loaded")
+
+def shadow_chat_request(message: str, response: ChatResponse, source: str, routed=None):
+    """Hand an answered message to shadow evaluation (non-blocking, sampled).
+    Only answers of the default model are compared"""
+    if routed is None and source not in ("empty", "error", "shed"):
+        shadow.submit(message, response.intent, response.confidence, source)
+
+async def answer_message(message: str, user_id: Optional[str], is_admin: bool,
+                         timer: StageTimer, routed=None) -> tuple:
+    """Classify one message and build its response; shared by /chatbot and
+    the Unix socket listener. `routed` is the registry model to use, if not
+    the default one. Returns (ChatResponse, source)"""
     try:
-        message = request.message.strip()
-        user_id = request.userId
-        is_admin = request.isAdmin or False
-        
-        logger.info(f"Processing message: '{message}' (User: {user_id}, Admin: {is_admin})")
-        
         if not message:
-            return ChatResponse(
-                response="Por favor, escribe un mensaje.",
-                intent="fallback",
-                confidence=0.0
-            )
-        
-        # Use trained spaCy model for intent classification
-        doc = nlp(message)
-        
-        if doc.cats:
-            # Find the intent with highest probability
-            predicted_intent = max(doc.cats, key=doc.cats.get)
-            confidence = doc.cats[predicted_intent]
-            
-            # Adjusted confidence threshold based on your model performance
-            confidence_threshold = 0.05  # Based on your test results
-            
-            if confidence < confidence_threshold:
-                predicted_intent = "fallback"
-                confidence = 0.0
-            
-            logger.info(f"Predicted intent: {predicted_intent} (confidence: {confidence:.3f})")
-            
+            response, source = empty_message_response(), "empty"
         else:
-            predicted_intent = "fallback"
-            confidence = 0.0
-            logger.warning("No predictions available from model")
-        
-        # Get appropriate response
-        response_text = get_intent_response(predicted_intent, user_id, is_admin)
-        
-        # Add personalization for logged-in users
-        if user_id and predicted_intent == "greeting":
-            response_text = "¡Hola de nuevo! " + response_text
-        
-        return ChatResponse(
-            response=response_text,
-            intent=predicted_intent,
-            confidence=float(confidence)
-        )
+            # Known training patterns skip the model altogether
+            fast_intent = match_known_pattern(message)
+            if fast_intent is not None:
+                timer.mark("lookup")
+                response, source = respond_to_intent(fast_intent, 1.0, user_id, is_admin), "fast_path"
+            else:
+                key = cache_key(message, routed)
+                timer.mark("lookup")
+                
+                # Use trained spaCy model for intent classification. Repeated messages
+                # are answered from the cache, and identical messages arriving together
+                # share one computation; the response itself is still picked per request
+                model_stages = {}
+                cats = await result_cache.get_or_compute(
+                    key, lambda: classify_message(message, model_stages, routed))
+                timer.mark_model(model_stages)
+                
+                response = build_chat_response(cats, user_id, is_admin, routed, message)
+                source = "model" if model_stages else "cache"
+        timer.mark("response")
+        return response, source
+    
+    except Overloaded:
+        timer.mark("queue")
+        if SHED_MODE == "reject":
+            raise
+        return degraded_response(message, user_id, is_admin), "shed"
         
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
-        return ChatResponse(
-            response="Lo siento, ocurrió un error procesando tu mensaje. Por favor inténtalo de nuevo.",
-            intent="error",
-            confidence=0.0
-        )
-
-@app.post("/test")
-def test_model(message: str):
+        request_log.log("chatbot_error", level=logging.ERROR, exc_info=e, message=message,
+                        user_id=user_id, error=str(e))
+        return error_response(), "error"
+
+@app.post("/chatbot", response_model=ChatResponse, dependencies=[Depends(require_ready)])
+async def process_message(request: ChatRequest, raw_request: Request,
+                          x_nlp_model: Optional[str] = Header(default=None)):
+    """Main chatbot endpoint with enhanced functionality"""
+    global requests_served
+    requests_served += 1
+    timer = StageTimer(raw_request.scope.get("state", {}).get("started_at"))
+    message = request.message.strip()
+    user_id = request.userId
+    is_admin = request.isAdmin or False
+    
+    # The body field wins over the X-NLP-Model header
+    model_name = request.model or x_nlp_model
+    try:
+        routed = await route_model_async(model_name)
+    except Exception as e:
+        raise routing_error(model_name, e)
+    
+    try:
+        response, source = await answer_message(message, user_id, is_admin, timer, routed)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=f"Overloaded ({e.reason})", headers={"Retry-After": "1"})
+    
+    http_response = timed_response(response, timer)
+    log_chat_request(message, user_id, is_admin, response, source, timer)
+    shadow_chat_request(message, response, source, routed)
+    profiler.request_done()
+    return http_response
+
+async def handle_socket_request(request: dict) -> dict:
+    """One request from the Unix socket listener: the same fields and
+    answers as /chatbot, without HTTP and pydantic validation"""
+    global requests_served
+    if not is_ready():
+        return {"error": "not_ready"}
+    message = request.get("message")
+    if not isinstance(message, str):
+        return {"error": "message must be a string"}
+    user_id = request.get("userId")
+    if user_id is not None:
+        user_id = str(user_id)
+    is_admin = bool(request.get("isAdmin"))
+    model_name = request.get("model")
+    try:
+        routed = await route_model_async(str(model_name) if model_name else None)
+    except KeyError:
+        return {"error": "unknown_model"}
+    except Exception as e:
+        logger.error(f"Loading model '{model_name}' failed: {str(e)}")
+        return {"error": "model_unavailable"}
+    
+    requests_served += 1
+    timer = StageTimer()
+    message = message.strip()
+    try:
+        response, source = await answer_message(message, user_id, is_admin, timer, routed)
+    except Overloaded:
+        return {"error": "overloaded"}
+    
+    timer.observe(stage_seconds)
+    request_seconds.observe(timer.last - timer.started, "uds")
+    log_chat_request(message, user_id, is_admin, response, source, timer)
+    shadow_chat_request(message, response, source, routed)
+    profiler.request_done()
+    return {"response": response.response, "intent": response.intent, "confidence": response.confidence}
+
+def score_batch_misses(misses: List[int], messages: List[str], keys: dict, cats_by_index: dict,
+                       generation: int, batch_size: int, routed=None):
+    """Score the batch items missing from the cache into `cats_by_index`;
+    an item that fails to score gets its exception instead"""
+    model = routed.model if routed else None
+    try:
+        scored = score_messages([messages[i] for i in misses], batch_size, model=model)
+        for i, cats in zip(misses, scored):
+            cats_by_index[i] = cats
+            result_cache.put(keys[i], cats, generation)
+    except Exception as e:
+        # Fall back to one-by-one scoring so a single bad item doesn't fail the batch
+        request_log.log("chatbot_batch_error", level=logging.ERROR, exc_info=e,
+                        size=len(misses), error=str(e))
+        for i in misses:
+            try:
+                cats_by_index[i] = score_message(messages[i], model=model)
+            except Exception as item_error:
+                cats_by_index[i] = item_error
+
+@app.post("/chatbot/batch", response_model=List[ChatResponse], dependencies=[Depends(require_ready)])
+def process_batch(request: BatchChatRequest, x_nlp_model: Optional[str] = Header(default=None)):
+    """Classify many messages at once, scoring them with nlp.pipe"""
+    
+    batch_size = request.batchSize or BATCH_SIZE
+    if batch_size < 1:
+        batch_size = BATCH_SIZE
+    
+    # One model per batch, chosen like /chatbot does
+    model_name = request.model or x_nlp_model
+    if any(item.model and item.model != model_name for item in request.messages):
+        raise HTTPException(status_code=400, detail="Set the model on the batch, not on its items")
+    try:
+        routed = route_model(model_name)
+    except Exception as e:
+        raise routing_error(model_name, e)
+    
+    # Empty messages never reach the model, same as /chatbot
+    messages = [item.message.strip() for item in request.messages]
+    to_score = [i for i, message in enumerate(messages) if message]
+    to_score_set = set(to_score)
+    
+    # Known training patterns skip the model altogether
+    fast_intents = {}
+    for i in to_score:
+        intent = match_known_pattern(messages[i])
+        if intent is not None:
+            fast_intents[i] = intent
+    to_score = [i for i in to_score if i not in fast_intents]
+    
+    # Answer what we can from the cache and score only the misses. Scores of
+    # a model swapped out meanwhile are not cached
+    generation = result_cache.generation
+    keys = {i: cache_key(messages[i], routed) for i in to_score}
+    cats_by_index = {}
+    for i in to_score:
+        cats = result_cache.get(keys[i])
+        if cats is not None:
+            cats_by_index[i] = cats
+    misses = [i for i in to_score if i not in cats_by_index]
+    
+    # The batch takes one admission slot for all of its model calls, like a
+    # /chatbot request; the controller lives on the event loop
+    shed = False
+    if misses:
+        try:
+            anyio.from_thread.run(admission.admit)
+        except Overloaded as e:
+            if SHED_MODE == "reject":
+                raise HTTPException(status_code=503, detail=f"Overloaded ({e.reason})",
+                                    headers={"Retry-After": "1"})
+            shed = True
+    if misses and not shed:
+        try:
+            score_batch_misses(misses, messages, keys, cats_by_index, generation, batch_size, routed)
+        finally:
+            anyio.from_thread.run_sync(admission.release)
+    
+    results = []
+    for i, item in enumerate(request.messages):
+        if i not in to_score_set:
+            results.append(empty_message_response())
+            continue
+        if i in fast_intents:
+            results.append(respond_to_intent(fast_intents[i], 1.0, item.userId, item.isAdmin or False))
+            continue
+        if i not in cats_by_index:
+            # Shed under load
+            results.append(degraded_response(messages[i], item.userId, item.isAdmin or False))
+            continue
+        try:
+            cats = cats_by_index[i]
+            if isinstance(cats, Exception):
+                raise cats
+            results.append(build_chat_response(cats, item.userId, item.isAdmin or False, routed,
+                                               messages[i]))
+        except Exception as e:
+            request_log.log("chatbot_error", level=logging.ERROR, exc_info=e, message=messages[i],
+                            user_id=item.userId, error=str(e))
+            results.append(error_response())
+    
+    intents = [result.intent for result in results]
+    request_log.log(
+        "chatbot_batch",
+        always=any(intent in ("fallback", "error", "degraded") for intent in intents),
+        size=len(results),
+        batch_size=batch_size,
+        model=routed.key if routed else None,
+        fast_path=len(fast_intents),
+        scored=len(misses),
+        fallbacks=intents.count("fallback"),
+        errors=intents.count("error"),
+        shed=shed,
+    )
+    return results
+
+def is_loopback(host: Optional[str]) -> bool:
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+def require_admin(request: Request, x_admin_token: Optional[str] = Header(default=None)):
+    """Guard for /admin endpoints: the NLP_ADMIN_TOKEN header when one is
+    configured, otherwise only clients on the loopback interface"""
+    if ADMIN_TOKEN:
+        if x_admin_token != ADMIN_TOKEN:
+            raise HTTPException(status_code=403, detail="Admin token required")
+    elif request.client is None or not is_loopback(request.client.host):
+        raise HTTPException(status_code=403, detail="Admin endpoints are local only without NLP_ADMIN_TOKEN")
+
+@app.post("/admin/catalog/reload", dependencies=[Depends(require_admin)])
+def reload_catalog_endpoint(request: Optional[CatalogReloadRequest] = None):
+    """Reload the response catalog from disk without restarting the service"""
+    source = request.source if request else None
+    try:
+        new_catalog = reload_catalog(source)
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Catalog reload failed: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Catalog reload failed: {str(e)}")
+    # Under serve.py this is one worker only; SIGUSR1 to the parent reaches all
+    return {"status": "reloaded", "catalog": new_catalog.info(), "worker": WORKER_ID}
+
+@app.post("/admin/model/reload", status_code=202, dependencies=[Depends(require_admin)])
+def reload_model_endpoint(request: Optional[ModelReloadRequest] = None):
+    """Load a model directory in the background and hot swap it in once warm"""
+    path = request.path if request else None
+    try:
+        started = start_model_reload(path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="A model reload is already in progress")
+    # Under serve.py this is one worker only; SIGHUP to the parent reaches all
+    return {"status": "loading", "path": path or model_path, "worker": WORKER_ID}
+
+@app.get("/admin/shadow", dependencies=[Depends(require_admin)])
+def shadow_endpoint():
+    """Agreement, confidence deltas and latency of the shadow candidate so far"""
+    return {"candidate": shadow_model, **shadow.stats()}
+
+@app.post("/admin/shadow", dependencies=[Depends(require_admin)])
+def configure_shadow_endpoint(request: ShadowConfigRequest):
+    """Shadow another candidate and/or change the sample rate; statistics start over"""
+    global shadow_model
+    if request.sampleRate is not None and not 0.0 <= request.sampleRate <= 1.0:
+        raise HTTPException(status_code=400, detail="sampleRate must be between 0 and 1")
+    if request.model and request.model != shadow_model:
+        shadow_model = request.model
+        shadow_candidate_cache.clear()
+    sample_rate = request.sampleRate
+    if sample_rate is None and not shadow.enabled and shadow_model:
+        sample_rate = SHADOW_SAMPLE_RATE
+    if shadow_model is None and sample_rate:
+        raise HTTPException(status_code=400, detail="No shadow candidate configured")
+    shadow.reset(sample_rate)
+    return {"candidate": shadow_model, **shadow.stats()}
+
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile_endpoint(request: ProfileRequest):
+    """Profile the next N /chatbot requests or T seconds and return the result"""
+    if request.requests is not None and request.requests < 1:
+        raise HTTPException(status_code=400, detail="requests must be at least 1")
+    options = {}
+    if request.kind == "sample":
+        options = {"interval": max(1.0, request.intervalMs or 5.0) / 1000.0,
+                   "include_idle": bool(request.includeIdle)}
+    elif request.kind == "deterministic":
+        if request.format not in (None, "text", "pstats"):
+            raise HTTPException(status_code=400, detail="format must be 'text' or 'pstats'")
+        options = {"output": request.format or "text", "top": request.top or 40}
+    elif request.kind == "memory":
+        options = {"frames": min(max(1, request.frames or 1), 25), "top": request.top or 25}
+    
+    try:
+        result = await profiler.run(request.kind, request.requests, request.seconds, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    body = result.pop("body", None)
+    content_type = result.pop("content_type")
+    if body is None:
+        return result
+    # Collapsed stacks and pstats go out as they are, with the window in headers
+    headers = {f"X-Profile-{key.replace('_', '-').title()}": str(value)
+               for key, value in result.items() if value is not None}
+    return Response(content=body, media_type=content_type, headers=headers)
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics in text exposition format"""
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
+
+def nearest_patterns(message: str, k: int = 5) -> list:
+    """Most similar training patterns, for debugging the second opinion"""
+    if retrieval_index is None:
+        return []
+    return [
+        {"pattern": pattern, "intent": intent, "similarity": round(similarity, 4)}
+        for pattern, intent, similarity in retrieval_index.query(message, k=k)
+    ]
+
+@app.post("/test", dependencies=[Depends(require_ready)])
+def test_model(message: str, model: Optional[str] = None):
     """Test endpoint to check model predictions"""
-    doc = nlp(message)
+    try:
+        routed = route_model(model)
+    except Exception as e:
+        raise routing_error(model, e)
+    doc = (routed.model if routed else nlp)(message)
     
     if doc.cats:
         # Return all predictions for debugging
@@ -170,7 +1270,8 @@ def test_model(message: str):
         return {
             "message": message,
             "predictions": predictions[:5],  # Top 5 predictions
-            "top_intent": max(doc.cats, key=doc.cats.get)
+            "top_intent": max(doc.cats, key=doc.cats.get),
+            "nearest_patterns": nearest_patterns(message)
         }
     else:
         return {
@@ -179,6 +1280,9 @@ def test_model(message: str):
             "error": "No predictions available"
         }
 
+# Everything above runs at import time; keep it cheap, the heavy work is in load_service()
+startup_timings["import_seconds"] = round(time.perf_counter() - IMPORT_STARTED, 3)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,188 @@
+# metrics.py - In-process Prometheus metrics and per-request stage timing
+
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in values
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        lines = self.header()
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """The metrics exposed on /metrics, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Durations of the stages of one request, for histograms and Server-Timing"""
+
+    __slots__ = ("started", "last", "stages")
+
+    def __init__(self, started: Optional[float] = None):
+        now = time.perf_counter()
+        self.started = started or now
+        self.last = now
+        # Time before the handler ran: body parsing and request validation
+        self.stages: Dict[str, float] = {"validation": now - self.started} if started else {}
+
+    def mark(self, stage: str):
+        """Charge the time since the previous mark to `stage`"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def mark_model(self, model_stages: Dict[str, float]):
+        """Charge the time since the previous mark to the model stages it was
+        spent in, and whatever is left to waiting (thread pool, micro-batch,
+        a coalesced identical request)"""
+        now = time.perf_counter()
+        elapsed = now - self.last
+        for stage, seconds in model_stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            elapsed -= seconds
+        self.stages["queue"] = self.stages.get("queue", 0.0) + max(0.0, elapsed)
+        self.last = now
+
+    def observe(self, histogram: Histogram):
+        for stage, seconds in self.stages.items():
+            histogram.observe(seconds, stage)
+
+    def server_timing(self) -> str:
+        parts = [f"{stage};dur={seconds * 1000.0:.3f}" for stage, seconds in self.stages.items()]
+        parts.append(f"total;dur={(self.last - self.started) * 1000.0:.3f}")
+        return ", ".join(parts)
+
+
+class RequestTimingMiddleware:
+    """Plain ASGI middleware timing whole HTTP requests.
+
+    Also stores the start time in the request state, where StageTimer picks
+    it up to measure validation.
+    """
+
+    def __init__(self, app, histogram: Histogram, known_paths: Callable[[], set]):
+        self.app = app
+        self.histogram = histogram
+        self.known_paths = known_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        scope.setdefault("state", {})["started_at"] = started
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            # Unknown paths share one label so 404 scans can't blow up cardinality
+            path = scope["path"] if scope["path"] in self.known_paths() else "other"
+            self.histogram.observe(time.perf_counter() - started, path)
@@ -0,0 +1,127 @@
+# micro_batcher.py - Group concurrent /chatbot requests into nlp.pipe batches
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Callable, List
+
+# Upper bounds (ms) of the queue wait histogram buckets
+WAIT_BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000]
+
+
+class MicroBatcher:
+    """Queue single messages and score them together with one call.
+
+    A batch is flushed as soon as it holds `max_batch_size` messages or the
+    oldest queued message has waited `max_wait_ms`, whichever comes first.
+    The scoring function runs in a worker thread so the event loop keeps
+    accepting requests while a batch is being scored.
+    """
+
+    def __init__(self, score_batch: Callable[[List[str]], List[dict]],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.score_batch = score_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = None
+        self._worker = None
+
+        # Counters
+        self.batches = 0
+        self.messages = 0
+        self.errors = 0
+        self.batch_sizes = {}
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def _ensure_worker(self):
+        # The queue and worker are bound to the running loop, so they are
+        # created lazily on the first request instead of at import time
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, message: str) -> dict:
+        """Queue a message and wait for its textcat scores"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future, time.perf_counter()))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                # Take whatever is already waiting without sleeping
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+
+                # asyncio.wait (unlike wait_for) never drops an item that
+                # arrives right as the timeout fires
+                getter = asyncio.ensure_future(self._queue.get())
+                await asyncio.wait({getter}, timeout=timeout)
+                if not getter.done():
+                    # A cancelled get leaves any pending item in the queue
+                    getter.cancel()
+                    break
+                batch.append(getter.result())
+
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        for _, _, queued_at in batch:
+            self._record_wait((started - queued_at) * 1000.0)
+        self._record_batch(len(batch))
+
+        try:
+            results = await asyncio.to_thread(self.score_batch, [message for message, _, _ in batch])
+        except Exception as e:
+            self.errors += 1
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), cats in zip(batch, results):
+            # The caller may have given up (client disconnect) meanwhile
+            if not future.done():
+                future.set_result(cats)
+
+    def _record_batch(self, size: int):
+        self.batches += 1
+        self.messages += size
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    def _record_wait(self, wait_ms: float):
+        self.wait_buckets[bisect_left(WAIT_BUCKETS_MS, wait_ms)] += 1
+        self.wait_total_ms += wait_ms
+        self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    def stats(self) -> dict:
+        wait_histogram = {f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+        wait_histogram["gt_1000ms"] = self.wait_buckets[-1]
+        return {
+            "enabled": True,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self.batches,
+            "messages": self.messages,
+            "errors": self.errors,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "avg_batch_size": self.messages / self.batches if self.batches else 0.0,
+            "batch_size_distribution": dict(sorted(self.batch_sizes.items())),
+            "queue_wait_avg_ms": self.wait_total_ms / self.messages if self.messages else 0.0,
+            "queue_wait_max_ms": self.wait_max_ms,
+            "queue_wait_histogram": wait_histogram,
+        }
@@ -1,15 +1,16 @@
 # model_diagnosis.py - Diagnose and fix training issues
 
+import argparse
 import json
 import os
 from collections import Counter
 
-def analyze_training_data():
+def analyze_training_data(data_path='./data/training_data.json'):
     """Analyze the training data to identify potential issues"""
-    print("🔍 Analyzing Training Data")
+    print(f"🔍 Analyzing Training Data ({data_path})")
     print("=" * 50)
     
-    with open('./data/training_data.json', 'r', encoding='utf-8') as f:
+    with open(data_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
     
     intent_counts = Counter()
@@ -35,7 +36,15 @@ def analyze_training_data():
     
     if max(intent_counts.values()) / min(intent_counts.values()) > 3:
         issues.append("⚠️  Unbalanced dataset (some intents have 3x more examples)")
-    
+
+    # Repeated patterns, ignoring case, accents and punctuation
+    duplicates = find_duplicates(read_labeled_examples([data_path]), near=False)["counts"]
+    if duplicates["conflicting_texts"]:
+        issues.append(f"⚠️  {duplicates['conflicting_texts']} pattern(s) appear under several intents "
+                      "(details: python model_diagnosis.py duplicates)")
+    if duplicates["exact_duplicates"]:
+        issues.append(f"⚠️  {duplicates['exact_duplicates']} duplicated pattern(s) within an intent")
+
     if issues:
         print("\n🚨 Issues Found:")
         for issue in issues:
@@ -200,8 +209,8 @@ def create_enhanced_training_data():
 def create_improved_config():
     """Create an improved training configuration"""
     config = """[paths]
-train = "data/train.spacy"
-dev = "data/dev.spacy"
+train = "data/train"
+dev = "data/dev"
 
 [system]
 gpu_allocator = null
@@ -263,12 +272,567 @@ vectors = null"""
     print("  - Added dropout (0.2) for regularization")
     print("  - Set max_epochs to 20 with patience")
 
-def main():
+# Textcat model blocks for the sweep; ensemble hidden_size is the tok2vec width.
+# Every config trains for exactly max_epochs (patience = 0): spaCy counts
+# patience in update steps, and stopping on the held-out fold would leak it
+# into training.
+BOW_MODEL = """[components.textcat.model]
+@architectures = "spacy.TextCatBOW.v3"
+exclusive_classes = true
+ngram_size = {ngram_size}
+no_output_layer = false
+length = 262144
+"""
+
+ENSEMBLE_MODEL = """[components.textcat.model]
+@architectures = "spacy.TextCatEnsemble.v2"
+nO = null
+
+[components.textcat.model.linear_model]
+@architectures = "spacy.TextCatBOW.v3"
+exclusive_classes = true
+ngram_size = {ngram_size}
+no_output_layer = false
+length = 262144
+
+[components.textcat.model.tok2vec]
+@architectures = "spacy.Tok2Vec.v2"
+
+[components.textcat.model.tok2vec.embed]
+@architectures = "spacy.MultiHashEmbed.v2"
+width = {hidden_size}
+rows = [5000, 2500, 2500, 2500]
+attrs = ["NORM", "PREFIX", "SUFFIX", "SHAPE"]
+include_static_vectors = false
+
+[components.textcat.model.tok2vec.encode]
+@architectures = "spacy.MaxoutWindowEncoder.v2"
+width = {hidden_size}
+window_size = 1
+maxout_pieces = 3
+depth = 2
+"""
+
+SWEEP_CONFIG = """[paths]
+train = null
+dev = null
+
+[system]
+gpu_allocator = null
+seed = {seed}
+
+[nlp]
+lang = "es"
+pipeline = ["textcat"]
+batch_size = 1000
+
+[components]
+
+[components.textcat]
+factory = "textcat"
+
+{model}
+[corpora]
+
+[corpora.dev]
+@readers = "spacy.Corpus.v1"
+path = ${{paths.dev}}
+
+[corpora.train]
+@readers = "spacy.Corpus.v1"
+path = ${{paths.train}}
+
+[training]
+seed = ${{system.seed}}
+gpu_allocator = ${{system.gpu_allocator}}
+dev_corpus = "corpora.dev"
+train_corpus = "corpora.train"
+max_epochs = {max_epochs}
+patience = 0
+dropout = {dropout}
+
+[training.optimizer]
+@optimizers = "Adam.v1"
+learn_rate = 0.001
+
+[training.score_weights]
+cats_score = 1.0
+
+[initialize]
+vectors = null"""
+
+ARCHITECTURES = {"bow": "spacy.TextCatBOW.v3", "ensemble": "spacy.TextCatEnsemble.v2"}
+
+
+def sweep_grid(args):
+    """Every (architecture, ngram_size, hidden_size, dropout) combination;
+    hidden_size only applies to the ensemble"""
+    grid = []
+    for architecture in args.architectures:
+        hidden_sizes = args.hidden_sizes if architecture == "ensemble" else [None]
+        for ngram_size in args.ngram_sizes:
+            for hidden_size in hidden_sizes:
+                for dropout in args.dropouts:
+                    grid.append({"architecture": architecture, "ngram_size": ngram_size,
+                                 "hidden_size": hidden_size, "dropout": dropout})
+    return grid
+
+
+def sweep_config(params, args):
+    """spaCy training config text for one grid point"""
+    template = ENSEMBLE_MODEL if params["architecture"] == "ensemble" else BOW_MODEL
+    model = template.format(ngram_size=params["ngram_size"], hidden_size=params["hidden_size"])
+    return SWEEP_CONFIG.format(model=model, seed=args.seed, max_epochs=args.max_epochs,
+                               dropout=params["dropout"])
+
+
+def write_folds(data_path, k, seed, directory):
+    """Split the intents into k stratified folds and serialize every fold's
+    train and dev DocBins once, for all sweep jobs to read"""
+    import random
+    import spacy
+    from spacy.tokens import DocBin
+
+    with open(data_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    labels = sorted(intent['tag'] for intent in data['intents'])
+    nlp = spacy.blank("es")
+    rng = random.Random(seed)
+    folds = [[] for _ in range(k)]
+    for intent in data['intents']:
+        patterns = list(intent['patterns'])
+        rng.shuffle(patterns)
+        for i, pattern in enumerate(patterns):
+            doc = nlp.make_doc(pattern)
+            doc.cats = {label: float(label == intent['tag']) for label in labels}
+            folds[i % k].append(doc)
+
+    paths = []
+    for fold in range(k):
+        train_path = os.path.join(directory, f"fold{fold}-train.spacy")
+        dev_path = os.path.join(directory, f"fold{fold}-dev.spacy")
+        DocBin(docs=[doc for other in range(k) if other != fold for doc in folds[other]]).to_disk(train_path)
+        DocBin(docs=folds[fold]).to_disk(dev_path)
+        paths.append((train_path, dev_path))
+    return paths, labels
+
+
+def train_fold(job):
+    """Train one config on one fold and measure it (runs in a worker process)"""
+    import io
+    import time
+    import spacy
+    from spacy.tokens import DocBin
+    from spacy.training import Example
+    from spacy.training.initialize import init_nlp
+    from spacy.training.loop import train
+    from thinc.api import Config
+
+    config_text, train_path, dev_path = job
+    config = Config().from_str(config_text, overrides={"paths.train": train_path, "paths.dev": dev_path})
+
+    started = time.perf_counter()
+    quiet = io.StringIO()
+    nlp = init_nlp(config)
+    nlp, _ = train(nlp, None, stdout=quiet, stderr=quiet)
+    train_seconds = time.perf_counter() - started
+
+    dev_docs = list(DocBin().from_disk(dev_path).get_docs(nlp.vocab))
+    scores = nlp.evaluate([Example(nlp.make_doc(doc.text), doc) for doc in dev_docs])
+
+    # Per-message latency, the way the service calls the model
+    texts = [doc.text for doc in dev_docs]
+    timings = []
+    for text in texts * max(1, 200 // max(1, len(texts))):
+        started = time.perf_counter()
+        nlp(text)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+
+    return {
+        "cats_score": scores["cats_score"],
+        "latency_ms": timings[len(timings) // 2],
+        "size_bytes": len(nlp.to_bytes()),
+        "train_seconds": train_seconds,
+    }
+
+
+def run_sweep(args):
+    """Train every grid config on every fold on a process pool and report
+    mean/stdev cats_score, latency and model size per config"""
+    import shutil
+    import statistics
+    import tempfile
+    import time
+    from concurrent.futures import ProcessPoolExecutor
+
+    grid = sweep_grid(args)
+    print(f"🧪 Sweeping {len(grid)} configs × {args.folds} folds on {args.jobs} process(es)")
+    print("=" * 50)
+
+    started = time.perf_counter()
+    fold_dir = tempfile.mkdtemp(prefix="nlp_sweep_")
+    try:
+        folds, labels = write_folds(args.data, args.folds, args.seed, fold_dir)
+        jobs = [(sweep_config(params, args), train_path, dev_path)
+                for params in grid for train_path, dev_path in folds]
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            runs = list(pool.map(train_fold, jobs))
+    finally:
+        shutil.rmtree(fold_dir, ignore_errors=True)
+
+    results = []
+    for index, params in enumerate(grid):
+        fold_runs = runs[index * args.folds:(index + 1) * args.folds]
+        scores = [run["cats_score"] for run in fold_runs]
+        latency = statistics.mean(run["latency_ms"] for run in fold_runs)
+        mean_score = statistics.mean(scores)
+        results.append(dict(
+            params,
+            cats_score_mean=round(mean_score, 4),
+            cats_score_stdev=round(statistics.stdev(scores), 4) if len(scores) > 1 else 0.0,
+            latency_ms=round(latency, 4),
+            size_mb=round(statistics.mean(run["size_bytes"] for run in fold_runs) / 1e6, 2),
+            train_seconds=round(statistics.mean(run["train_seconds"] for run in fold_runs), 2),
+            score_per_ms=round(mean_score / latency, 2) if latency > 0 else None,
+        ))
+    results.sort(key=lambda result: result["cats_score_mean"], reverse=True)
+
+    print(f"{'architecture':12} {'ngram':>5} {'hidden':>6} {'dropout':>7} {'cats_score':>16} "
+          f"{'latency ms':>10} {'size MB':>8} {'score/ms':>9}")
+    for result in results:
+        score = f"{result['cats_score_mean']:.3f} ± {result['cats_score_stdev']:.3f}"
+        print(f"{result['architecture']:12} {result['ngram_size']:>5} {str(result['hidden_size'] or '-'):>6} "
+              f"{result['dropout']:>7} {score:>16} {result['latency_ms']:>10.3f} "
+              f"{result['size_mb']:>8} {result['score_per_ms'] or '-':>9}")
+
+    best = results[0]
+    # Fastest config whose score is within one stdev of the best
+    tradeoff = min((result for result in results
+                    if result["cats_score_mean"] >= best["cats_score_mean"] - best["cats_score_stdev"]),
+                   key=lambda result: result["latency_ms"])
+    print(f"\n🏆 Best cats_score: {describe_config(best)}")
+    print(f"⚡ Fastest within one stdev of it: {describe_config(tradeoff)}")
+    print(f"⏱️  Sweep took {time.perf_counter() - started:.1f}s")
+
+    if args.output:
+        report = {"data": args.data, "folds": args.folds, "seed": args.seed, "labels": labels,
+                  "results": results, "best": best, "tradeoff": tradeoff}
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Sweep results written to {args.output}")
+
+    if args.write_config:
+        with open(args.write_config, 'w') as f:
+            f.write(sweep_config(tradeoff, args).replace("train = null", 'train = "data/train"')
+                    .replace("dev = null", 'dev = "data/dev"'))
+        print(f"✅ Config of the fastest near-best model saved to '{args.write_config}'")
+    return results
+
+
+def describe_config(result):
+    hidden = f", hidden_size={result['hidden_size']}" if result["hidden_size"] else ""
+    return (f"{ARCHITECTURES[result['architecture']]} ngram_size={result['ngram_size']}{hidden}, "
+            f"dropout={result['dropout']}: cats_score {result['cats_score_mean']:.3f} "
+            f"± {result['cats_score_stdev']:.3f}, {result['latency_ms']:.3f} ms/message, {result['size_mb']} MB")
+
+
+# Prime modulus of the MinHash permutations: hash values stay below 2**31,
+# so a * x + b fits in 64 bits
+MINHASH_PRIME = (1 << 31) - 1
+
+
+def read_labeled_examples(paths):
+    """Examples from intents JSON / JSONL files, in input order, with the
+    split create_data.py will put them in"""
+    from data.create_data import read_examples
+    examples = []
+    for path in paths:
+        for text, label in read_examples([path]):
+            examples.append({"index": len(examples), "text": text, "label": label, "source": path})
+    return examples
+
+
+def lsh_bands(num_perm, threshold):
+    """(bands, rows) whose LSH threshold (1/bands)**(1/rows) sits just below
+    `threshold`: favour recall, candidate pairs are verified anyway"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        estimate = (1.0 / bands) ** (1.0 / rows)
+        if estimate <= threshold * 0.9 and (best is None or estimate > best[2]):
+            best = (bands, rows, estimate)
+    return best[:2] if best else (num_perm, 1)
+
+
+def shingles(text, size):
+    """Character n-grams of a normalized text (the text itself if shorter)"""
+    return {text[i:i + size] for i in range(max(1, len(text) - size + 1))}
+
+
+def minhash_signatures(shingle_sets, num_perm, seed):
+    """One row of `num_perm` MinHash values per shingle set"""
+    import zlib
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, MINHASH_PRIME, num_perm, dtype=np.uint64)
+    signatures = np.empty((len(shingle_sets), num_perm), dtype=np.uint64)
+    for row, grams in enumerate(shingle_sets):
+        hashes = np.fromiter((zlib.crc32(gram.encode('utf-8')) for gram in grams),
+                             dtype=np.uint64, count=len(grams)) % MINHASH_PRIME
+        signatures[row] = ((np.outer(a, hashes) + b[:, None]) % MINHASH_PRIME).min(axis=1)
+    return signatures
+
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def near_duplicate_clusters(texts, threshold, num_perm, shingle_size, seed, max_bucket=50):
+    """Cluster texts whose character n-gram Jaccard similarity reaches
+    `threshold`, using MinHash LSH instead of comparing all pairs.
+
+    Only texts sharing a band bucket are compared. In buckets larger than
+    `max_bucket` each text is compared with the bucket's first text only,
+    so a very common phrasing can't make the pass quadratic.
+    """
+    shingle_sets = [shingles(text, shingle_size) for text in texts]
+    signatures = minhash_signatures(shingle_sets, num_perm, seed)
+    bands, rows = lsh_bands(num_perm, threshold)
+
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    compared, verified = set(), 0
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(map(bytes, signatures[:, band * rows:(band + 1) * rows])):
+            buckets.setdefault(key, []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            if len(members) <= max_bucket:
+                pairs = ((x, y) for n, x in enumerate(members) for y in members[n + 1:])
+            else:
+                pairs = ((members[0], y) for y in members[1:])
+            for x, y in pairs:
+                root_x, root_y = find(x), find(y)
+                if root_x == root_y or (x, y) in compared:
+                    continue
+                compared.add((x, y))
+                if jaccard(shingle_sets[x], shingle_sets[y]) >= threshold:
+                    parent[root_y] = root_x
+                    verified += 1
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(find(i), []).append(i)
+    stats = {"bands": bands, "rows": rows, "compared_pairs": len(compared), "similar_pairs": verified}
+    return [members for members in clusters.values() if len(members) > 1], shingle_sets, stats
+
+
+def find_duplicates(examples, threshold=0.8, num_perm=128, shingle_size=3, seed=0,
+                    dev_ratio=0.2, split_seed="0", near=True):
+    """Exact duplicates, cross-intent conflicts, near-duplicates and
+    train/dev leakage, with the examples to remove before create_data.py.
+
+    Texts are compared after folding case, accents, punctuation and
+    whitespace. Exact groups share a hash key; near-duplicates are found
+    among one text per group with MinHash LSH. The split is the one
+    create_data.py assigns with the same --seed and --dev-ratio.
+    """
+    from data.create_data import split_of
+    from normalization import normalize_message
+
+    groups = {}
+    for example in examples:
+        example["split"] = split_of(example["text"], split_seed, dev_ratio)
+        key = normalize_message(example["text"], fold_punctuation=True)
+        groups.setdefault(key, []).append(example)
+
+    def brief(example, **extra):
+        return dict({field: example[field] for field in ("index", "text", "label", "split", "source")}, **extra)
+
+    remove, conflicts, exact_leaks = {}, [], 0
+    kept = {}
+    for key, members in groups.items():
+        labels = Counter(example["label"] for example in members)
+        if len({example["split"] for example in members}) > 1:
+            exact_leaks += 1
+        if len(labels) > 1:
+            top_label, top_count = labels.most_common(1)[0]
+            majority = top_label if top_count * 2 > len(members) else None
+            conflicts.append({"text": key, "labels": dict(labels), "keep_label": majority,
+                              "examples": [brief(example) for example in members]})
+            for example in members:
+                if example["label"] != majority:
+                    remove[example["index"]] = brief(example, reason="conflict")
+            members = [example for example in members if example["label"] == majority]
+        if members:
+            # The first occurrence stays
+            kept[key] = members[0]
+            for example in members[1:]:
+                remove[example["index"]] = brief(example, reason="duplicate", duplicate_of=members[0]["index"])
+
+    near_clusters, near_conflicts, near_leaks, lsh_stats = [], [], 0, {}
+    if near and len(kept) > 1:
+        keys = list(kept)
+        clusters, shingle_sets, lsh_stats = near_duplicate_clusters(
+            keys, threshold, num_perm, shingle_size, seed)
+        for members in clusters:
+            cluster = [kept[keys[i]] for i in members]
+            labels = Counter(example["label"] for example in cluster)
+            if len(labels) > 1:
+                # Similar texts under different intents: a person has to decide
+                near_conflicts.append({"labels": dict(labels), "examples": [brief(example) for example in cluster]})
+                continue
+            near_clusters.append([brief(example) for example in cluster])
+            train = [i for i in members if kept[keys[i]]["split"] == "train"]
+            if train:
+                for i in members:
+                    example = kept[keys[i]]
+                    if example["split"] == "dev":
+                        # Its near-twin is in train, so it would inflate the dev score
+                        near_leaks += 1
+                        remove[example["index"]] = brief(
+                            example, reason="leakage", similar_to=kept[keys[train[0]]]["index"],
+                            similarity=round(jaccard(shingle_sets[i], shingle_sets[train[0]]), 3))
+
+    removals = sorted(remove.values(), key=lambda entry: entry["index"])
+    return {
+        "examples": len(examples),
+        "unique_texts": len(groups),
+        "options": {"threshold": threshold, "num_perm": num_perm, "shingle_size": shingle_size,
+                    "seed": seed, "dev_ratio": dev_ratio, "split_seed": split_seed, **lsh_stats},
+        "counts": {
+            "exact_duplicates": sum(1 for entry in removals if entry["reason"] == "duplicate"),
+            "conflicting_texts": len(conflicts),
+            "exact_leaking_texts": exact_leaks,
+            "near_duplicate_clusters": len(near_clusters),
+            "near_conflict_clusters": len(near_conflicts),
+            "near_leaking_examples": near_leaks,
+            "removals": len(removals),
+            "removals_by_reason": dict(Counter(entry["reason"] for entry in removals)),
+        },
+        "remove": removals,
+        "conflicts": conflicts,
+        "near_conflicts": near_conflicts,
+        "near_duplicates": near_clusters,
+    }
+
+
+def run_duplicates(args):
+    """Report duplicates, conflicts and leakage in the training inputs and
+    optionally write the cleaned examples for create_data.py"""
+    import time
+
+    print("🔁 Checking for duplicate, conflicting and leaking examples")
+    print("=" * 50)
+    started = time.perf_counter()
+    inputs = args.inputs or [default_training_data()]
+    examples = read_labeled_examples(inputs)
+    report = find_duplicates(examples, threshold=args.threshold, num_perm=args.num_perm,
+                             shingle_size=args.shingle_size, seed=args.minhash_seed,
+                             dev_ratio=args.dev_ratio, split_seed=args.seed, near=not args.exact_only)
+    report["inputs"] = inputs
+    counts = report["counts"]
+
+    print(f"Examples: {report['examples']} ({report['unique_texts']} distinct after normalization)")
+    print(f"  Exact duplicates within an intent: {counts['exact_duplicates']}")
+    print(f"  Texts labeled with several intents: {counts['conflicting_texts']}")
+    for conflict in report["conflicts"][:args.show]:
+        keep = f", keep as {conflict['keep_label']}" if conflict["keep_label"] else ", remove everywhere"
+        print(f"    ⚔️  '{conflict['text']}' → {conflict['labels']}{keep}")
+    if not args.exact_only:
+        print(f"  Near-duplicate clusters (Jaccard ≥ {args.threshold}): {counts['near_duplicate_clusters']}")
+        print(f"  Near-duplicate clusters spanning intents: {counts['near_conflict_clusters']}")
+        for cluster in report["near_conflicts"][:args.show]:
+            texts = " | ".join(f"{example['text']} ({example['label']})" for example in cluster["examples"][:4])
+            print(f"    🔀 {texts}")
+    print(f"  Texts in both train and dev: {counts['exact_leaking_texts']} exact"
+          + ("" if args.exact_only else f", {counts['near_leaking_examples']} dev examples with a near-twin in train"))
+
+    if counts["removals"]:
+        reasons = ", ".join(f"{count} {reason}" for reason, count in counts["removals_by_reason"].items())
+        print(f"\n🗑️  Remove {counts['removals']} example(s) before running create_data.py ({reasons})")
+    else:
+        print("\n✅ No duplicates, conflicts or leakage found")
+    print(f"⏱️  Took {time.perf_counter() - started:.2f}s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Report written to {args.output}")
+
+    if args.write_clean:
+        removed = {entry["index"] for entry in report["remove"]}
+        with open(args.write_clean, 'w', encoding='utf-8') as f:
+            for example in examples:
+                if example["index"] not in removed:
+                    f.write(json.dumps({"text": example["text"], "label": example["label"]}, ensure_ascii=False) + "\n")
+        print(f"✅ {len(examples) - len(removed)} examples kept in {args.write_clean}; "
+              f"build the corpus with: python data/create_data.py {args.write_clean}")
+    return report
+
+
+def default_training_data():
+    default_data = './data/enhanced_training_data.json'
+    if not os.path.exists(default_data):
+        default_data = './data/training_data.json'
+    return default_data
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Diagnose the training data and compare textcat configs")
+    parser.add_argument("--data", default=default_training_data(), help="Intents JSON to diagnose")
+    commands = parser.add_subparsers(dest="command")
+
+    sweep = commands.add_parser("sweep", help="k-fold cross-validate a grid of textcat configs")
+    sweep.add_argument("--data", default=default_training_data(), help="Intents JSON to cross-validate on")
+    sweep.add_argument("--folds", type=int, default=5)
+    sweep.add_argument("--architectures", nargs="+", choices=sorted(ARCHITECTURES), default=["bow", "ensemble"])
+    sweep.add_argument("--ngram-sizes", type=int, nargs="+", default=[1, 2, 3])
+    sweep.add_argument("--hidden-sizes", type=int, nargs="+", default=[64, 128])
+    sweep.add_argument("--dropouts", type=float, nargs="+", default=[0.1, 0.2])
+    sweep.add_argument("--max-epochs", type=int, default=20)
+    sweep.add_argument("--seed", type=int, default=0)
+    sweep.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Training processes")
+    sweep.add_argument("--output", help="Write the sweep results to this JSON file")
+    sweep.add_argument("--write-config", help="Write the config of the fastest near-best model here")
+
+    duplicates = commands.add_parser("duplicates", help="find duplicate, conflicting and train/dev leaking examples")
+    duplicates.add_argument("inputs", nargs="*",
+                            help="Intents JSON or JSONL files, as for create_data.py (default: the training data)")
+    duplicates.add_argument("--threshold", type=float, default=0.8,
+                            help="Character n-gram Jaccard similarity of near-duplicates")
+    duplicates.add_argument("--num-perm", type=int, default=128, help="MinHash permutations")
+    duplicates.add_argument("--shingle-size", type=int, default=3, help="Characters per n-gram")
+    duplicates.add_argument("--minhash-seed", type=int, default=0)
+    duplicates.add_argument("--dev-ratio", type=float, default=0.2, help="As passed to create_data.py")
+    duplicates.add_argument("--seed", default="0", help="Split salt, as passed to create_data.py")
+    duplicates.add_argument("--exact-only", action="store_true", help="Skip the near-duplicate pass")
+    duplicates.add_argument("--show", type=int, default=10, help="Conflicts to print")
+    duplicates.add_argument("--output", help="Write the full report to this JSON file")
+    duplicates.add_argument("--write-clean", help="Write the examples to keep to this JSONL file")
+    return parser.parse_args()
+
+
+def main(data_path):
     print("🔬 NLP Model Diagnosis and Fix")
     print("=" * 50)
     
     # Analyze current data
-    analyze_training_data()
+    analyze_training_data(data_path)
     
     print("\n" + "="*50)
     print("📝 RECOMMENDATIONS:")
@@ -295,10 +859,16 @@ def main():
         print("\n🚀 NEXT STEPS:")
         print("1. Update create_data.py to use enhanced_training_data.json")
         print("2. Run: python data/create_data.py")
-        print("3. Train with: python -m spacy train improved_config.cfg --output ./output --paths.train ./data/train.spacy --paths.dev ./data/dev.spacy")
+        print("3. Train with: python -m spacy train improved_config.cfg --output ./output --paths.train ./data/train --paths.dev ./data/dev")
         print("4. Test again with the new model")
         print("\n💡 QUICK FIX for current model:")
         print("   Set confidence_threshold = 0.05 in main.py")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.command == "sweep":
+        run_sweep(args)
+    elif args.command == "duplicates":
+        run_duplicates(args)
+    else:
+        main(args.data)
@@ -0,0 +1,236 @@
+# model_registry.py - Named, versioned models loaded on demand under a memory budget
+#
+# The registry file maps a model name to its versions, or straight to a path
+# for a single version:
+#
+#   {
+#     "bow": {"1": "./archive/bow-1/model-best", "2": "./output_bow/model-best"},
+#     "ensemble": "./output/model-best",
+#     "en": {"1": "./en_output/model-best"}
+#   }
+#
+# Requests ask for "name@version" or just "name" (its highest version).
+# Models are loaded the first time they are asked for and the least recently
+# used ones are dropped once their combined size exceeds the memory budget.
+
+import gc
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, None where /proc is missing"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def version_key(version: str) -> list:
+    # Natural order, so "10" comes after "9"
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+
+class LoadedModel:
+    """A registry model held in memory"""
+
+    def __init__(self, key: str, path: str, model, version: str, thresholds: dict,
+                 rss_bytes: int, load_seconds: float):
+        self.key = key
+        self.path = path
+        self.model = model
+        self.version = version
+        self.thresholds = thresholds
+        self.rss_bytes = rss_bytes
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+
+
+class ModelRegistry:
+    """Load registry models by name/version and keep the recently used ones.
+
+    `loader(path)` returns `(model, version, thresholds)` for a model
+    directory. Loads run one at a time, so the RSS growth measured around a
+    load can be attributed to that model; it is taken as at least the size of
+    the model on disk, since memory freed by an evicted model is often reused
+    without the RSS growing. Evicted models are freed once the requests still
+    scoring with them finish.
+    """
+
+    def __init__(self, models: Dict[str, Dict[str, str]], loader: Callable[[str], tuple],
+                 memory_budget_mb: float = 0.0, source: Optional[str] = None):
+        self.models = models
+        self.loader = loader
+        self.memory_budget = int(memory_budget_mb * MB)
+        self.source = source
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        # Per name@version, kept across evictions
+        self._counters = {}
+        self._last_rss = {}
+
+    @classmethod
+    def from_file(cls, path: str, loader: Callable[[str], tuple], memory_budget_mb: float = 0.0) -> "ModelRegistry":
+        """Registry described by `path`; a missing file gives an empty registry"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls({}, loader, memory_budget_mb)
+        models = {}
+        for name, versions in data.items():
+            if isinstance(versions, str):
+                versions = {"1": versions}
+            if not isinstance(versions, dict) or not versions:
+                raise ValueError(f"Model '{name}' in {path} needs a path or a version -> path map")
+            models[name] = {str(version): str(model_path) for version, model_path in versions.items()}
+        logger.info(f"Model registry loaded from {path} ({len(models)} models)")
+        return cls(models, loader, memory_budget_mb, source=path)
+
+    def resolve(self, spec: str) -> Tuple[str, str]:
+        """"name@version" or "name" -> (key, path); KeyError for unknown models"""
+        name, _, version = spec.partition("@")
+        versions = self.models.get(name)
+        if not versions:
+            raise KeyError(spec)
+        if not version:
+            version = max(versions, key=version_key)
+        if version not in versions:
+            raise KeyError(spec)
+        return f"{name}@{version}", versions[version]
+
+    def lookup(self, spec: str) -> Optional[LoadedModel]:
+        """The model if it is already in memory, without loading it"""
+        key, _ = self.resolve(spec)
+        with self._lock:
+            return self._use(key)
+
+    def get(self, spec: str) -> LoadedModel:
+        """The model, loading it first if needed (blocking)"""
+        key, path = self.resolve(spec)
+        with self._lock:
+            entry = self._use(key)
+        if entry is not None:
+            return entry
+
+        with self._load_lock:
+            # Another request may have loaded it while we waited
+            with self._lock:
+                entry = self._use(key)
+            if entry is not None:
+                return entry
+
+            # Make room first, using the size measured last time it was loaded
+            self._evict(reserve=self._last_rss.get(key, 0))
+            rss_before = current_rss()
+            started = time.perf_counter()
+            model, version, thresholds = self.loader(path)
+            load_seconds = time.perf_counter() - started
+            rss_after = current_rss()
+            growth = rss_after - rss_before if rss_before is not None and rss_after is not None else 0
+            rss_bytes = max(growth, directory_size(path))
+
+            entry = LoadedModel(key, path, model, version, thresholds, rss_bytes, load_seconds)
+            with self._lock:
+                self._loaded[key] = entry
+                self._last_rss[key] = rss_bytes
+                self._counter(key)["loads"] += 1
+                self._use(key)
+            logger.info(f"Loaded registry model {key} from {path} in {load_seconds:.2f}s "
+                        f"({rss_bytes / MB:.1f} MB)")
+            self._evict()
+            return entry
+
+    def _use(self, key: str) -> Optional[LoadedModel]:
+        # Caller holds self._lock
+        entry = self._loaded.get(key)
+        if entry is not None:
+            self._loaded.move_to_end(key)
+            entry.last_used = time.time()
+            self._counter(key)["hits"] += 1
+        return entry
+
+    def _counter(self, key: str) -> dict:
+        return self._counters.setdefault(key, {"hits": 0, "loads": 0, "evictions": 0})
+
+    def resident_bytes(self) -> int:
+        return sum(entry.rss_bytes for entry in list(self._loaded.values()))
+
+    def _evict(self, reserve: int = 0):
+        """Drop least recently used models until the rest (plus `reserve`
+        bytes about to be loaded) fits the budget; the most recently used
+        model is always kept"""
+        if self.memory_budget <= 0:
+            return
+        evicted = []
+        with self._lock:
+            keep = 0 if reserve else 1
+            while len(self._loaded) > keep and self.resident_bytes() + reserve > self.memory_budget:
+                key, entry = self._loaded.popitem(last=False)
+                self._counter(key)["evictions"] += 1
+                evicted.append(entry)
+        for entry in evicted:
+            logger.info(f"Evicted registry model {entry.key} ({entry.rss_bytes / MB:.1f} MB, "
+                        f"idle {time.time() - entry.last_used:.0f}s)")
+        if evicted:
+            del evicted, entry
+            gc.collect()
+        elif not reserve and self.resident_bytes() > self.memory_budget:
+            logger.warning(f"Registry model {next(reversed(self._loaded))} alone exceeds "
+                           f"the {self.memory_budget / MB:.0f} MB model memory budget")
+
+    def stats(self) -> dict:
+        rss = current_rss()
+        with self._lock:
+            loaded = dict(self._loaded)
+            counters = {key: dict(counter) for key, counter in self._counters.items()}
+        models = {}
+        for name, versions in self.models.items():
+            for version, path in sorted(versions.items(), key=lambda item: version_key(item[0])):
+                key = f"{name}@{version}"
+                entry = loaded.get(key)
+                info = {"path": path, "loaded": entry is not None,
+                        **counters.get(key, {"hits": 0, "loads": 0, "evictions": 0})}
+                if entry is not None:
+                    info.update({
+                        "version": entry.version,
+                        "rss_mb": round(entry.rss_bytes / MB, 1),
+                        "load_seconds": round(entry.load_seconds, 3),
+                        "loaded_at": entry.loaded_at,
+                        "last_used": entry.last_used,
+                    })
+                elif key in self._last_rss:
+                    info["last_rss_mb"] = round(self._last_rss[key] / MB, 1)
+                models[key] = info
+        return {
+            "source": self.source,
+            "memory_budget_mb": self.memory_budget / MB if self.memory_budget > 0 else None,
+            "resident_mb": round(sum(entry.rss_bytes for entry in loaded.values()) / MB, 1),
+            "process_rss_mb": round(rss / MB, 1) if rss is not None else None,
+            "loaded": list(loaded),
+            "models": models,
+        }
@@ -0,0 +1,23 @@
+# normalization.py - Text folding shared by the caches and lookup indexes
+
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(text: str, fold_punctuation: bool = False) -> str:
+    """Fold case, accents and whitespace so trivially different messages match.
+
+    With `fold_punctuation`, punctuation ("¿", "?", ",", ...) is treated as
+    whitespace as well.
+    """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    if fold_punctuation:
+        text = "".join(
+            " " if unicodedata.category(ch).startswith("P") else ch
+            for ch in text if not unicodedata.combining(ch)
+        )
+    else:
+        text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _WHITESPACE.sub(" ", text).strip()
@@ -0,0 +1,62 @@
+# pattern_index.py - Exact-match lookup of known training patterns
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from normalization import normalize_message
+
+logger = logging.getLogger(__name__)
+
+
+def pattern_key(text: str) -> str:
+    return normalize_message(text, fold_punctuation=True)
+
+
+class PatternIndex:
+    """Map normalized training patterns straight to their intent.
+
+    Messages that match a pattern verbatim (up to case, accents and
+    punctuation) can skip the model entirely. Patterns listed under more than
+    one intent are ambiguous, so they are left out of the index and reported
+    in `conflicts` instead.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        tags_by_key: Dict[str, set] = {}
+        for pattern, tag in patterns:
+            key = pattern_key(pattern)
+            if key:
+                tags_by_key.setdefault(key, set()).add(tag)
+
+        self.index: Dict[str, str] = {}
+        self.conflicts: Dict[str, List[str]] = {}
+        for key, tags in tags_by_key.items():
+            if len(tags) == 1:
+                self.index[key] = next(iter(tags))
+            else:
+                self.conflicts[key] = sorted(tags)
+
+        for key, tags in self.conflicts.items():
+            logger.warning(f"Pattern '{key}' appears under several intents {tags}, excluded from the fast path")
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Return the intent of a known pattern, or None"""
+        tag = self.index.get(pattern_key(text))
+        if tag is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return tag
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "patterns": len(self.index),
+            "conflicts": len(self.conflicts),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,328 @@
+# profiling.py - On-demand profiles of the live service over a bounded window
+#
+# A session covers the next N requests or T seconds, whichever ends first:
+#
+#   sample         a background thread samples every thread's Python stack
+#                  every few ms; the result is collapsed stacks
+#                  ("frame;frame;frame count"), ready for flamegraph.pl or
+#                  speedscope
+#   deterministic  cProfile on the event loop thread and around the model
+#                  calls made in worker threads, merged into one pstats
+#   memory         tracemalloc snapshots at both ends of the window; the diff
+#                  per allocation site, also divided by the number of requests
+#
+# Nothing is installed while no session is running; handlers only check
+# whether `profiler.session` is set.
+
+import asyncio
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Callable, Optional
+
+KINDS = ("sample", "deterministic", "memory")
+
+# Leaf frames of threads that are only waiting (event loop select, idle
+# thread pool workers, queue consumers); left out of samples by default
+IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+}
+
+
+class ProfileSession(ABC):
+    """One profiling window; `done` resolves to the collected result"""
+
+    kind = None
+
+    def __init__(self, requests: Optional[int], seconds: float, on_finish: Callable[[], None]):
+        self.target_requests = requests
+        self.seconds = seconds
+        self.requests = 0
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.finished = False
+        self._on_finish = on_finish
+        loop = asyncio.get_running_loop()
+        self.done = loop.create_future()
+        self._deadline = loop.call_later(seconds, self.finish)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        """Stop collecting; runs on the event loop thread"""
+
+    @abstractmethod
+    def collect(self) -> dict:
+        """Build the result; runs in a worker thread"""
+
+    def request_done(self):
+        self.requests += 1
+        if self.target_requests and self.requests >= self.target_requests:
+            self.finish()
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        self._deadline.cancel()
+        self.elapsed = time.perf_counter() - self.started
+        self.stop()
+        self._on_finish()
+        asyncio.get_running_loop().create_task(self._collect())
+
+    async def _collect(self):
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(None, self.collect)
+        except Exception as e:
+            self.done.set_exception(e)
+        else:
+            self.done.set_result(result)
+
+    def info(self) -> dict:
+        return {
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "requests": self.requests,
+            "target_requests": self.target_requests,
+            "seconds": round(self.elapsed or time.perf_counter() - self.started, 3),
+            "max_seconds": self.seconds,
+        }
+
+
+class SamplingSession(ProfileSession):
+    kind = "sample"
+
+    def __init__(self, requests, seconds, on_finish, interval: float = 0.005, include_idle: bool = False):
+        super().__init__(requests, seconds, on_finish)
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                code = frame.f_code
+                if not self.include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    self.idle_samples += 1
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)).replace(";", ":"))
+                self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+
+    def collect(self) -> dict:
+        self._thread.join()
+        lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return {
+            **self.info(),
+            "content_type": "text/plain",
+            "body": "\n".join(lines) + "\n",
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "interval_ms": self.interval * 1000.0,
+        }
+
+
+class DeterministicSession(ProfileSession):
+    kind = "deterministic"
+
+    def __init__(self, requests, seconds, on_finish, output: str = "text", top: int = 40):
+        super().__init__(requests, seconds, on_finish)
+        self.output = output
+        self.top = top
+        self._loop_profile = cProfile.Profile()
+        self._thread_profiles = {}
+        self._in_flight = 0
+        self._closed = False
+        self._idle = threading.Condition()
+
+    def start(self):
+        # Called on the event loop thread
+        self._loop_profile.enable()
+
+    def stop(self):
+        self._loop_profile.disable()
+        with self._idle:
+            self._closed = True
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn under this thread's profile (worker threads)"""
+        with self._idle:
+            if self._closed:
+                profile = None
+            else:
+                profile = self._thread_profiles.get(threading.get_ident())
+                if profile is None:
+                    profile = self._thread_profiles[threading.get_ident()] = cProfile.Profile()
+                self._in_flight += 1
+        if profile is None:
+            return fn(*args, **kwargs)
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self._idle:
+                self._in_flight -= 1
+                self._idle.notify_all()
+
+    def collect(self) -> dict:
+        # Profiles still running a call can't be read yet
+        with self._idle:
+            self._idle.wait_for(lambda: self._in_flight == 0, timeout=5)
+            profiles = list(self._thread_profiles.values())
+        stats = pstats.Stats(self._loop_profile)
+        for profile in profiles:
+            stats.add(profile)
+        if self.output == "pstats":
+            # The format of pstats.Stats.dump_stats(), readable by pstats and snakeviz
+            body, content_type = marshal.dumps(stats.stats), "application/octet-stream"
+        else:
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats("cumulative").print_stats(self.top)
+            body, content_type = stream.getvalue(), "text/plain"
+        return {**self.info(), "content_type": content_type, "body": body,
+                "threads": len(profiles) + 1}
+
+
+class MemorySession(ProfileSession):
+    kind = "memory"
+
+    def __init__(self, requests, seconds, on_finish, frames: int = 1, top: int = 25):
+        super().__init__(requests, seconds, on_finish)
+        self.frames = frames
+        self.top = top
+        self._started_tracing = False
+        self._before = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        self._before = tracemalloc.take_snapshot()
+
+    def collect(self) -> dict:
+        after = tracemalloc.take_snapshot()
+        traced, peak = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+        ignore = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ]
+        group_by = "traceback" if self.frames > 1 else "lineno"
+        diff = after.filter_traces(ignore).compare_to(self._before.filter_traces(ignore), group_by)
+        requests = max(1, self.requests)
+        return {
+            **self.info(),
+            "content_type": "application/json",
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "size_diff_bytes": sum(stat.size_diff for stat in diff),
+            "top": [
+                {
+                    "where": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size": stat.size,
+                    "count": stat.count,
+                    "bytes_per_request": round(stat.size_diff / requests, 1),
+                }
+                for stat in diff[:self.top]
+            ],
+        }
+
+
+class Profiler:
+    """Runs at most one profiling session at a time"""
+
+    def __init__(self, max_seconds: float = 60.0):
+        self.max_seconds = max_seconds
+        self.session: Optional[ProfileSession] = None
+        self.sessions = 0
+
+    async def run(self, kind: str, requests: Optional[int] = None, seconds: Optional[float] = None,
+                  **options) -> dict:
+        """Profile the next `requests` requests or `seconds` seconds and
+        return the result; must be awaited on the event loop"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown profile kind '{kind}' (use {', '.join(KINDS)})")
+        if self.session is not None:
+            raise RuntimeError(f"A {self.session.kind} profile is already running")
+        seconds = min(seconds or self.max_seconds, self.max_seconds)
+        session_class = {"sample": SamplingSession, "deterministic": DeterministicSession,
+                         "memory": MemorySession}[kind]
+        session = session_class(requests, seconds, self._clear, **options)
+        self.session = session
+        self.sessions += 1
+        try:
+            session.start()
+        except Exception:
+            session._deadline.cancel()
+            self._clear()
+            raise
+        return await asyncio.shield(session.done)
+
+    def _clear(self):
+        self.session = None
+
+    def request_done(self):
+        session = self.session
+        if session is not None:
+            session.request_done()
+
+    def wrap(self, fn: Callable) -> Callable:
+        """`fn`, or `fn` under the running deterministic profile, for calls
+        made in worker threads"""
+        session = self.session
+        if session is None or session.kind != "deterministic":
+            return fn
+        return lambda *args, **kwargs: session.call(fn, *args, **kwargs)
+
+    def stats(self) -> dict:
+        return {
+            "active": self.session.info() if self.session is not None else None,
+            "sessions": self.sessions,
+            "max_seconds": self.max_seconds,
+        }
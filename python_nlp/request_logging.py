@@ -0,0 +1,99 @@
+# request_logging.py - Sampled, queue-backed structured request logging
+
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, event and the record's fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks: records are dropped (and counted)
+    when the queue is full, and left unformatted until the listener writes
+    them"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The default prepare() formats the message in the calling thread;
+        # the listener's formatter does that instead
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RequestLog:
+    """Per-request log records, written by a background thread.
+
+    Routine records are sampled at `sample_rate`; warnings, errors and
+    records logged with `always=True` (e.g. fallbacks) are always kept.
+    """
+
+    def __init__(self, name: str = "nlp.requests", sample_rate: float = 1.0,
+                 queue_size: int = 10000, stream=None):
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.sampled_out = 0
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.handler = DroppingQueueHandler(self.queue)
+
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+
+        sink = logging.StreamHandler(stream or sys.stderr)
+        sink.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, sink)
+        self._running = False
+
+    def log(self, event: str, level: int = logging.INFO, always: bool = False,
+            exc_info=None, **fields):
+        if level < logging.WARNING and not always and self.sample_rate < 1.0:
+            if random.random() >= self.sample_rate:
+                self.sampled_out += 1
+                return
+        self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def start(self):
+        """Start the writer thread (per process: call it after forking)"""
+        if not self._running:
+            self.listener.start()
+            self._running = True
+
+    def stop(self):
+        """Write out whatever is still queued and stop the writer thread"""
+        if self._running:
+            self.listener.stop()
+            self._running = False
+
+    def stats(self) -> dict:
+        return {
+            "sample_rate": self.sample_rate,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampled_out,
+        }
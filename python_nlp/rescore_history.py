@@ -0,0 +1,363 @@
+# rescore_history.py - Re-score historical chatbot conversations with the current model
+#
+# Streams the questions of the backend's Postgres `chatbot_data` table
+# (through a server-side cursor) or of a local SQLite/CSV export of it,
+# classifies them in chunks on a pool of worker processes and aggregates as
+# it goes, so memory stays bounded however many rows there are. It writes:
+#   * a JSON report: intent distribution, and per day the number of
+#     messages, the low-confidence rate (top score under its threshold) and
+#     the fallback rate (low confidence or the fallback intent)
+#   * a JSONL sample of the most uncertain distinct messages (smallest gap
+#     between the two top intents), ready for labeling
+#
+# Postgres needs psycopg2 (pip install psycopg2-binary) and uses the
+# backend's DB_USER, DB_HOST, DB_DATABASE, DB_PASSWORD and DB_PORT variables.
+#
+# Usage:
+#   python rescore_history.py --n-process 4
+#   python rescore_history.py chatbot_data.csv --since 2025-01-01 --model ./output/model-best
+
+import argparse
+import csv
+import heapq
+import json
+import os
+import sys
+import time
+from collections import deque
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from evaluate import FALLBACK, init_scoring_worker, load_model, score_chunk, score_texts, textcat_labels
+from thresholds import load_thresholds
+
+QUERY = "SELECT id, question, created_at FROM chatbot_data"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-score historical chatbot_data questions")
+    parser.add_argument("source", nargs="?",
+                        help="SQLite database (.db/.sqlite/.sqlite3) or CSV export; default: Postgres")
+    parser.add_argument("--dsn", help="Postgres connection string (default: the backend's DB_* variables)")
+    parser.add_argument("--model", default=os.getenv("NLP_MODEL_PATH") or "./enhanced_output/model-last",
+                        help="spaCy model directory or bow_engine export")
+    parser.add_argument("--thresholds", default=os.getenv("NLP_THRESHOLDS", "./thresholds.json"),
+                        help="Thresholds file written by evaluate.py (as main.py loads it)")
+    parser.add_argument("--since", help="First day to include (YYYY-MM-DD)")
+    parser.add_argument("--until", help="First day to exclude (YYYY-MM-DD)")
+    parser.add_argument("--limit", type=int, help="Stop after this many rows")
+    parser.add_argument("--n-process", type=int, default=1, help="Worker processes running nlp.pipe")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--chunk-size", type=int, default=8192, help="Rows per database fetch and per worker task")
+    parser.add_argument("--sample-size", type=int, default=500, help="Uncertain messages to write for labeling")
+    parser.add_argument("--output", default="./rescore_report.json")
+    parser.add_argument("--uncertain-out", default="./uncertain_sample.jsonl")
+    return parser.parse_args()
+
+
+# --- Row sources: (id, question, created_at) --------------------------------
+
+def sql_filters(args, placeholder: str) -> Tuple[str, list]:
+    clauses, params = [], []
+    if args.since:
+        clauses.append(f"created_at >= {placeholder}")
+        params.append(args.since)
+    if args.until:
+        clauses.append(f"created_at < {placeholder}")
+        params.append(args.until)
+    query = QUERY + (" WHERE " + " AND ".join(clauses) if clauses else "") + " ORDER BY id"
+    if args.limit:
+        query += f" LIMIT {int(args.limit)}"
+    return query, params
+
+
+def read_postgres(args) -> Iterator[tuple]:
+    try:
+        import psycopg2
+    except ImportError:
+        raise RuntimeError("psycopg2 is not installed (pip install psycopg2-binary); "
+                           "or pass a SQLite/CSV export of chatbot_data")
+
+    if args.dsn:
+        connection = psycopg2.connect(args.dsn)
+    else:
+        connection = psycopg2.connect(
+            user=os.getenv("DB_USER"),
+            host=os.getenv("DB_HOST", "localhost"),
+            dbname=os.getenv("DB_DATABASE"),
+            password=os.getenv("DB_PASSWORD"),
+            port=os.getenv("DB_PORT", "5432"),
+        )
+    try:
+        connection.set_session(readonly=True)
+        query, params = sql_filters(args, "%s")
+        with connection:
+            # A named cursor is server-side: rows arrive `itersize` at a time
+            with connection.cursor(name="rescore_history") as cursor:
+                cursor.itersize = args.chunk_size
+                cursor.execute(query, params)
+                yield from cursor
+    finally:
+        connection.close()
+
+
+def read_sqlite(args) -> Iterator[tuple]:
+    import sqlite3
+
+    connection = sqlite3.connect(f"file:{args.source}?mode=ro", uri=True)
+    try:
+        query, params = sql_filters(args, "?")
+        cursor = connection.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(args.chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        connection.close()
+
+
+def read_csv(args) -> Iterator[tuple]:
+    with open(args.source, "r", encoding="utf-8", newline="") as f:
+        count = 0
+        for row in csv.DictReader(f):
+            day = day_of(row.get("created_at"))
+            if (args.since and day < args.since) or (args.until and day >= args.until):
+                continue
+            yield row.get("id"), row.get("question") or "", row.get("created_at")
+            count += 1
+            if args.limit and count >= args.limit:
+                break
+
+
+def read_rows(args) -> Iterator[tuple]:
+    if not args.source:
+        return read_postgres(args)
+    if args.source.endswith((".db", ".sqlite", ".sqlite3")):
+        return read_sqlite(args)
+    return read_csv(args)
+
+
+def day_of(created_at) -> str:
+    if created_at is None or created_at == "":
+        return "unknown"
+    if hasattr(created_at, "date"):
+        return created_at.date().isoformat()
+    return str(created_at)[:10]
+
+
+# --- Aggregation --------------------------------------------------------------
+
+class Aggregate:
+    """Running totals over scored chunks: intent counts per day, low-confidence
+    and fallback counts, and the most uncertain distinct messages"""
+
+    def __init__(self, labels, thresholds: dict, sample_size: int):
+        self.labels = labels
+        # Answers are labels plus fallback, which may not be a model label
+        self.names = labels + ([] if FALLBACK in labels else [FALLBACK])
+        self.fallback_index = self.names.index(FALLBACK)
+        self.thresholds = np.array([thresholds["per_intent"].get(label, thresholds["global"])
+                                    for label in labels], dtype=np.float32)
+        self.rows = 0
+        self.empty = 0
+        self.reported = 0
+        self.days = {}
+        self.sample_size = sample_size
+        self.uncertain = []  # min-heap of (-margin, rows seen, text key, record)
+        self.uncertain_texts = set()
+
+    def day(self, day: str) -> dict:
+        if day not in self.days:
+            self.days[day] = {"counts": np.zeros(len(self.names), dtype=np.int64),
+                              "low_confidence": 0}
+        return self.days[day]
+
+    def add(self, ids, texts, created, scores: np.ndarray):
+        if not len(texts):
+            return
+        rows = np.arange(len(texts))
+        predicted = scores.argmax(axis=1)
+        confidence = scores[rows, predicted]
+        low = confidence < self.thresholds[predicted]
+        answered = np.where(low, self.fallback_index, predicted)
+
+        days = np.array([day_of(value) for value in created])
+        unique_days, day_index = np.unique(days, return_inverse=True)
+        for i, day in enumerate(unique_days):
+            in_day = day_index == i
+            stats = self.day(str(day))
+            stats["counts"] += np.bincount(answered[in_day], minlength=len(self.names))
+            stats["low_confidence"] += int(low[in_day].sum())
+
+        # Gap between the two best intents: small means the model is unsure
+        if scores.shape[1] > 1:
+            top_two = np.partition(scores, -2, axis=1)[:, -2:]
+            margin = top_two[:, 1] - top_two[:, 0]
+        else:
+            margin = 1.0 - confidence
+        if self.sample_size > 0:
+            candidates = np.argsort(margin)[:self.sample_size]
+            for row in candidates:
+                self.offer(float(margin[row]), ids[row], texts[row], days[row], scores[row])
+        self.rows += len(texts)
+
+    def progress(self, every: int = 100000):
+        if self.rows - self.reported >= every:
+            self.reported = self.rows
+            print(f"   ... {self.rows} messages scored")
+
+    def offer(self, margin: float, message_id, text: str, day: str, scores: np.ndarray):
+        key = text.strip().lower()
+        if key in self.uncertain_texts:
+            return
+        if len(self.uncertain) >= self.sample_size and -self.uncertain[0][0] <= margin:
+            return
+        top = np.argsort(scores)[::-1][:3]
+        record = {
+            "id": message_id,
+            "day": day,
+            "text": text,
+            "margin": round(margin, 4),
+            "candidates": {self.labels[i]: round(float(scores[i]), 4) for i in top},
+            "label": None,
+        }
+        entry = (-margin, self.rows, key, record)
+        if len(self.uncertain) < self.sample_size:
+            heapq.heappush(self.uncertain, entry)
+        else:
+            evicted = heapq.heapreplace(self.uncertain, entry)
+            self.uncertain_texts.discard(evicted[2])
+        self.uncertain_texts.add(key)
+
+    def report(self) -> dict:
+        totals = np.zeros(len(self.names), dtype=np.int64)
+        daily = []
+        low_total = 0
+        for day in sorted(self.days):
+            stats = self.days[day]
+            count = int(stats["counts"].sum())
+            totals += stats["counts"]
+            low_total += stats["low_confidence"]
+            fallback = int(stats["counts"][self.fallback_index])
+            daily.append({
+                "day": day,
+                "messages": count,
+                "low_confidence_rate": round(stats["low_confidence"] / count, 4),
+                "fallback_rate": round(fallback / count, 4),
+                "intents": {name: int(n) for name, n in zip(self.names, stats["counts"]) if n},
+            })
+        rows = max(self.rows, 1)
+        return {
+            "messages": self.rows,
+            "empty_messages": self.empty,
+            "low_confidence_rate": round(low_total / rows, 4),
+            "fallback_rate": round(int(totals[self.fallback_index]) / rows, 4),
+            "intents": {name: {"count": int(n), "share": round(int(n) / rows, 4)}
+                        for name, n in sorted(zip(self.names, totals), key=lambda item: -item[1])},
+            "daily": daily,
+        }
+
+    def uncertain_sample(self):
+        return [entry[3] for entry in sorted(self.uncertain, key=lambda entry: -entry[0])]
+
+
+# --- Scoring ----------------------------------------------------------------
+
+def chunks(rows: Iterator[tuple], size: int, aggregate: Aggregate) -> Iterator[tuple]:
+    """Rows in chunks of `size`; empty questions are counted and left out,
+    as /chatbot answers them without the model"""
+    ids, texts, created = [], [], []
+    for message_id, question, created_at in rows:
+        question = (question or "").strip()
+        if not question:
+            aggregate.empty += 1
+            continue
+        ids.append(message_id)
+        texts.append(question)
+        created.append(created_at)
+        if len(texts) == size:
+            yield ids, texts, created
+            ids, texts, created = [], [], []
+    if texts:
+        yield ids, texts, created
+
+
+def rescore(args, nlp, labels, aggregate: Aggregate):
+    """Score every chunk and fold it into `aggregate`; with several processes
+    at most two chunks per worker are in flight, which bounds memory while
+    the database keeps streaming"""
+    if args.n_process <= 1:
+        for ids, texts, created in chunks(read_rows(args), args.chunk_size, aggregate):
+            aggregate.add(ids, texts, created, score_texts(nlp, texts, labels, args.batch_size))
+            aggregate.progress()
+        return
+
+    import multiprocessing
+    in_flight = deque()
+    with multiprocessing.Pool(args.n_process, initializer=init_scoring_worker,
+                              initargs=(args.model, args.batch_size)) as pool:
+        for ids, texts, created in chunks(read_rows(args), args.chunk_size, aggregate):
+            in_flight.append((ids, texts, created, pool.apply_async(score_chunk, (texts,))))
+            if len(in_flight) >= 2 * args.n_process:
+                ids, texts, created, result = in_flight.popleft()
+                aggregate.add(ids, texts, created, result.get())
+                aggregate.progress()
+        while in_flight:
+            ids, texts, created, result = in_flight.popleft()
+            aggregate.add(ids, texts, created, result.get())
+            aggregate.progress()
+
+
+def main():
+    args = parse_args()
+
+    nlp = load_model(args.model)
+    labels = textcat_labels(nlp)
+    thresholds = load_thresholds(args.thresholds)
+    aggregate = Aggregate(labels, thresholds, args.sample_size)
+
+    source = args.source or "postgres:chatbot_data"
+    print(f"🔁 Re-scoring {source} with {args.model} on {args.n_process} process(es)")
+    started = time.perf_counter()
+    try:
+        rescore(args, nlp, labels, aggregate)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    elapsed = time.perf_counter() - started
+
+    report = aggregate.report()
+    report.update(
+        source=source,
+        model=args.model,
+        thresholds={"global": thresholds["global"], "per_intent": thresholds["per_intent"],
+                    "source": thresholds["source"]},
+        since=args.since,
+        until=args.until,
+        seconds=round(elapsed, 2),
+        messages_per_second=round(aggregate.rows / elapsed, 1) if elapsed > 0 else None,
+        created_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+
+    print(f"⚡ Scored {aggregate.rows} messages in {elapsed:.2f}s ({report['messages_per_second']} msg/s), "
+          f"skipped {aggregate.empty} empty ones")
+    print(f"   Fallback rate {report['fallback_rate']:.1%}, low confidence {report['low_confidence_rate']:.1%}")
+    for name, stats in report["intents"].items():
+        print(f"   {name:15} → {stats['count']:>8} ({stats['share']:.1%})")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+    print(f"💾 Report written to {args.output}")
+
+    sample = aggregate.uncertain_sample()
+    with open(args.uncertain_out, "w", encoding="utf-8") as f:
+        for record in sample:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+    print(f"🏷️  {len(sample)} uncertain messages written to {args.uncertain_out} for labeling")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+# response_catalog.py - Indexed, reloadable intent -> responses catalog
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCatalog:
+    """Immutable tag -> responses index built once from an intents JSON file.
+
+    A reload builds a brand new catalog and the caller swaps its reference, so
+    requests that already picked up the old catalog finish with it untouched.
+    """
+
+    def __init__(self, intents: List[dict], source: Optional[str] = None, version: str = "empty"):
+        self.intents = intents
+        self.source = source
+        self.version = version
+        self.loaded_at = time.time()
+        self.responses: Dict[str, Tuple[str, ...]] = {}
+        self.patterns: List[Tuple[str, str]] = []
+
+        for intent in intents:
+            tag = intent["tag"]
+            responses = intent.get("responses") or []
+            if not responses:
+                raise ValueError(f"Intent '{tag}' has no responses")
+            # Keep the first definition of a duplicated tag, like the old linear scan did
+            self.responses.setdefault(tag, tuple(responses))
+            for pattern in intent.get("patterns", []):
+                self.patterns.append((pattern, tag))
+
+    @classmethod
+    def from_file(cls, path: str) -> "ResponseCatalog":
+        with open(path, "rb") as f:
+            raw = f.read()
+        data = json.loads(raw.decode("utf-8"))
+        version = hashlib.sha256(raw).hexdigest()[:12]
+        return cls(data.get("intents", []), source=path, version=version)
+
+    @property
+    def tags(self) -> List[str]:
+        return list(self.responses)
+
+    def get(self, tag: str) -> Optional[Tuple[str, ...]]:
+        return self.responses.get(tag)
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "loaded_at": self.loaded_at,
+            "intents": len(self.responses),
+            "patterns": len(self.patterns),
+        }
+
+
+class CatalogWatcher:
+    """Poll a catalog file's mtime and call `on_change` when it changes"""
+
+    def __init__(self, get_path: Callable[[], Optional[str]], on_change: Callable[[], None],
+                 interval: float = 2.0):
+        self.get_path = get_path
+        self.on_change = on_change
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _mtime(self) -> Optional[float]:
+        path = self.get_path()
+        try:
+            return os.stat(path).st_mtime if path else None
+        except OSError:
+            return None
+
+    def _run(self):
+        last = self._mtime()
+        while not self._stop.wait(self.interval):
+            current = self._mtime()
+            if current is not None and current != last:
+                last = current
+                try:
+                    self.on_change()
+                except Exception as e:
+                    logger.error(f"Catalog reload after file change failed: {str(e)}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,121 @@
+# result_cache.py - Bounded LRU/TTL cache of textcat scores per normalized message
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+
+class ResultCache:
+    """Map a normalized message to its `doc.cats` result.
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted once `maxsize` is reached. Concurrent lookups of the same key that
+    miss share one in-flight computation instead of each scoring the message.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # Bumped on clear() so computations started against an old model
+        # don't repopulate the cache after it was flushed
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            cats, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cats
+
+    @property
+    def generation(self) -> int:
+        """Bumped by clear(); scores computed before that are not put()"""
+        return self._generation
+
+    def put(self, key: str, cats: dict, generation: int = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (cats, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        """Return the cached scores for `key`, computing them at most once"""
+        cats = self.get(key)
+        if cats is not None:
+            return cats
+        if not self.enabled:
+            return await compute()
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        # Run the computation as its own task so that a caller going away
+        # (client disconnect) doesn't cancel it for the others sharing it
+        generation = self._generation
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+
+        def _done(task):
+            if self._inflight.get(key) is task:
+                del self._inflight[key]
+            if not task.cancelled() and task.exception() is None:
+                self.put(key, task.result(), generation)
+
+        task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def clear(self):
+        """Drop every entry, e.g. because the model changed"""
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+        self._inflight.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
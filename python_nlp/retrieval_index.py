@@ -0,0 +1,266 @@
+# retrieval_index.py - Nearest training pattern by hashed character n-gram TF-IDF
+#
+# Every pattern becomes an L2-normalized TF-IDF vector over character n-grams
+# of its folded text, hashed into `n_features` buckets. The pattern x bucket
+# matrix is stored twice as .npy files, column by column (an inverted index:
+# the patterns containing each n-gram) and row by row, and memory-mapped, so
+# forked workers share the pages and startup doesn't parse anything.
+#
+# A lookup is a sparse matrix-vector product in two phases. The postings of
+# the query's rarest n-grams, up to `max_postings` of them, give partial
+# scores; common n-grams (" de", "que") have the longest postings but the
+# least weight. As pattern vectors are unit length, the skipped n-grams can
+# add at most the norm of their query weights, which bounds the patterns that
+# may still reach the top k; up to `max_candidates` of those are then scored
+# exactly from their rows. Small catalogs fit the budget and are scanned in
+# full.
+#
+# The files live in <directory>/<digest>/, where the digest covers the
+# patterns and the options; an index is only rebuilt when that changes.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import time
+import zlib
+from collections import Counter
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from normalization import normalize_message
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+# Names of the index directories, so that only those are ever removed
+DIGEST_NAME = re.compile(r"[0-9a-f]{16}")
+ARRAYS = ("indptr", "indices", "data", "row_indptr", "row_buckets", "row_data", "idf", "labels")
+
+# Postings read in the first phase of a lookup, and patterns rescored exactly
+MAX_POSTINGS = 20000
+MAX_CANDIDATES = 256
+
+
+def char_ngrams(text: str, sizes: Sequence[int]) -> List[str]:
+    # Padding marks word boundaries at both ends of the message
+    text = f" {normalize_message(text, fold_punctuation=True)} "
+    return [text[i:i + size] for size in sizes for i in range(len(text) - size + 1)]
+
+
+def hashed_counts(text: str, sizes: Sequence[int], n_features: int) -> Counter:
+    return Counter(zlib.crc32(gram.encode("utf-8")) % n_features for gram in char_ngrams(text, sizes))
+
+
+def tfidf_vector(counts: Counter, idf: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Buckets and L2-normalized weights (sublinear tf times idf)"""
+    buckets = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    weights = (1.0 + np.log(tf)) * idf[buckets]
+    norm = float(np.sqrt(np.dot(weights, weights)))
+    return buckets, (weights / norm if norm > 0 else weights).astype(np.float32)
+
+
+def index_digest(patterns: List[Tuple[str, str]], n_features: int, sizes: Sequence[int]) -> str:
+    digest = hashlib.sha256(json.dumps(
+        {"version": INDEX_VERSION, "n_features": n_features, "ngram_sizes": list(sizes), "patterns": patterns},
+        ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class RetrievalIndex:
+    """Memory-mapped nearest-pattern index; build_or_load() to get one"""
+
+    def __init__(self, path: str, meta: dict, arrays: dict, patterns: List[str]):
+        self.path = path
+        self.meta = meta
+        self.n_features = meta["n_features"]
+        self.ngram_sizes = tuple(meta["ngram_sizes"])
+        self.intents = meta["intents"]
+        self.patterns = patterns
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.data = arrays["data"]
+        self.row_indptr = arrays["row_indptr"]
+        self.row_buckets = arrays["row_buckets"]
+        self.row_data = arrays["row_data"]
+        self.idf = arrays["idf"]
+        self.labels = arrays["labels"]
+        self.lookups = 0
+        self.lookup_seconds = 0.0
+
+    @classmethod
+    def build_or_load(cls, directory: str, patterns: List[Tuple[str, str]], n_features: int = 1 << 18,
+                      ngram_sizes: Sequence[int] = (3, 4)) -> "RetrievalIndex":
+        """The index of these (pattern, intent) pairs, built only if no index
+        of the same patterns and options is on disk yet"""
+        patterns = [[pattern, tag] for pattern, tag in patterns]
+        digest = index_digest(patterns, n_features, ngram_sizes)
+        path = os.path.join(directory, digest)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            started = time.perf_counter()
+            cls._build(path, patterns, n_features, ngram_sizes)
+            logger.info(f"Retrieval index of {len(patterns)} patterns built in "
+                        f"{time.perf_counter() - started:.2f}s at {path}")
+        index = cls.load(path)
+        cls._remove_stale(directory, keep=digest)
+        return index
+
+    @classmethod
+    def load(cls, path: str) -> "RetrievalIndex":
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "patterns.json"), "r", encoding="utf-8") as f:
+            patterns = json.load(f)
+        # Plain ndarray views of the mappings: slicing an np.memmap is slower
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r").view(np.ndarray)
+                  for name in ARRAYS}
+        return cls(path, meta, arrays, patterns)
+
+    @staticmethod
+    def _build(path: str, patterns: List[List[str]], n_features: int, sizes: Sequence[int]):
+        intents = sorted({tag for _, tag in patterns})
+        intent_ids = {tag: i for i, tag in enumerate(intents)}
+        counts = [hashed_counts(pattern, sizes, n_features) for pattern, _ in patterns]
+
+        # Smoothed idf, as in scikit-learn
+        df = np.zeros(n_features, dtype=np.int64)
+        for pattern_counts in counts:
+            df[list(pattern_counts)] += 1
+        idf = (np.log((1.0 + len(patterns)) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        columns, weights = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.float32)]
+        for pattern_counts in counts:
+            buckets, values = tfidf_vector(pattern_counts, idf)
+            columns.append(buckets)
+            weights.append(values)
+        row_indptr = np.zeros(len(patterns) + 1, dtype=np.int64)
+        np.cumsum([len(buckets) for buckets in columns[1:]], out=row_indptr[1:])
+        rows = np.repeat(np.arange(len(patterns), dtype=np.int32), np.diff(row_indptr))
+        columns = np.concatenate(columns)
+        weights = np.concatenate(weights)
+
+        # The column-major copy reads one contiguous run per query n-gram
+        order = np.argsort(columns, kind="stable")
+        indptr = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(columns, minlength=n_features), out=indptr[1:])
+        arrays = {
+            "indptr": indptr,
+            "indices": rows[order],
+            "data": weights[order],
+            "row_indptr": row_indptr,
+            "row_buckets": columns.astype(np.int32),
+            "row_data": weights,
+            "idf": idf,
+            "labels": np.array([intent_ids[tag] for _, tag in patterns], dtype=np.int32),
+        }
+        meta = {"version": INDEX_VERSION, "n_features": n_features, "ngram_sizes": list(sizes),
+                "intents": intents, "patterns": len(patterns), "nonzeros": int(len(weights)),
+                "built_at": time.time()}
+
+        # Written to a temporary directory and renamed, so readers never see
+        # a half-written index
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+        with open(os.path.join(tmp_path, "patterns.json"), "w", encoding="utf-8") as f:
+            json.dump([pattern for pattern, _ in patterns], f, ensure_ascii=False)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process built the same index meanwhile
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @staticmethod
+    def _remove_stale(directory: str, keep: str):
+        # The directory may be shared with other data: only older indexes go
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if (name != keep and DIGEST_NAME.fullmatch(name)
+                    and os.path.isfile(os.path.join(path, "meta.json"))):
+                # Still mapped by old requests on Windows; retried next build
+                shutil.rmtree(path, ignore_errors=True)
+
+    def query(self, text: str, k: int = 1, threshold: float = 0.0, max_postings: int = MAX_POSTINGS,
+              max_candidates: int = MAX_CANDIDATES) -> List[Tuple[str, str, float]]:
+        """The `k` patterns most similar to `text`: (pattern, intent, cosine).
+        Patterns that can't reach `threshold` may be left out"""
+        started = time.perf_counter()
+        try:
+            return self._query(text, k, threshold, max_postings, max(k, max_candidates))
+        finally:
+            self.lookups += 1
+            self.lookup_seconds += time.perf_counter() - started
+
+    def _query(self, text, k, threshold, max_postings, max_candidates):
+        buckets, weights = tfidf_vector(hashed_counts(text, self.ngram_sizes, self.n_features), self.idf)
+        starts = self.indptr[buckets]
+        lengths = self.indptr[buckets + 1] - starts
+
+        # Rarest n-grams first, as many as fit the postings budget
+        order = np.argsort(lengths, kind="stable")
+        read = max(1, int(np.searchsorted(np.cumsum(lengths[order]), max_postings, side="right")))
+        skipped = weights[order[read:]]
+        rest = float(np.sqrt(np.dot(skipped, skipped)))
+        spans = [(start, start + length, weight) for start, length, weight
+                 in zip(starts[order[:read]].tolist(), lengths[order[:read]].tolist(),
+                        weights[order[:read]].tolist()) if length]
+        if not spans:
+            return []
+        rows = np.concatenate([self.indices[start:end] for start, end, _ in spans])
+        values = np.concatenate([self.data[start:end] * weight for start, end, weight in spans])
+        partial = np.bincount(rows, weights=values, minlength=len(self.patterns))
+
+        if k == 1:
+            kth = float(partial.max())
+        else:
+            touched = partial[np.flatnonzero(partial)]
+            kth = float(np.partition(touched, -min(k, len(touched)))[-min(k, len(touched))])
+        candidates = np.flatnonzero(partial >= max(max(kth, threshold) - rest, 1e-9))
+        if len(candidates) > max_candidates:
+            candidates = candidates[np.argpartition(-partial[candidates], max_candidates - 1)[:max_candidates]]
+
+        if rest == 0.0:
+            scores = partial[candidates]
+        else:
+            # Exact cosines from the candidates' rows, against the query as a
+            # dense vector (np.zeros is lazily zeroed, so this is cheap)
+            row_starts = self.row_indptr[candidates]
+            row_lengths = self.row_indptr[candidates + 1] - row_starts
+            offsets = (np.repeat(row_starts - np.cumsum(row_lengths) + row_lengths, row_lengths)
+                       + np.arange(int(row_lengths.sum())))
+            query = np.zeros(self.n_features, dtype=np.float32)
+            query[buckets] = weights
+            products = self.row_data[offsets] * query[self.row_buckets[offsets]]
+            scores = np.bincount(np.repeat(np.arange(len(candidates)), row_lengths), weights=products,
+                                 minlength=len(candidates))
+
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(self.patterns[row], self.intents[self.labels[row]], float(score))
+                for row, score in zip(candidates[top].tolist(), scores[top].tolist()) if score > 0]
+
+    def nearest(self, text: str, threshold: float) -> Optional[Tuple[str, float, str]]:
+        """(intent, similarity, pattern) of the nearest pattern if it clears `threshold`"""
+        results = self.query(text, k=1, threshold=threshold)
+        if results and results[0][2] >= threshold:
+            pattern, intent, similarity = results[0]
+            return intent, similarity, pattern
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "patterns": len(self.patterns),
+            "nonzeros": self.meta.get("nonzeros"),
+            "n_features": self.n_features,
+            "ngram_sizes": list(self.ngram_sizes),
+            "built_at": self.meta.get("built_at"),
+            "lookups": self.lookups,
+            "avg_lookup_us": round(self.lookup_seconds * 1e6 / self.lookups, 1) if self.lookups else 0.0,
+        }
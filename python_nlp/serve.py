@@ -0,0 +1,168 @@
+# serve.py - Production serving mode with pre-forked inference workers
+#
+# The parent process imports main.py and loads the spaCy model and the
+# training data once, opens the listening socket and then forks N workers. The
+# workers share the model pages copy-on-write and the kernel load-balances
+# incoming connections across them because they all accept() on the same
+# socket. With --uds the same applies to the Unix domain socket listener.
+#
+# SIGHUP and SIGUSR1 sent to the parent are forwarded to every worker, so
+# they all reload the model or the response catalog respectively;
+# /admin/model/reload and /admin/catalog/reload only reach the worker that
+# accepts the request.
+#
+# Usage: python serve.py --workers 4 --port 8000
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+logger = logging.getLogger("serve")
+
+# Signals the parent passes on to every worker (see main.py's lifespan)
+RELOAD_SIGNALS = [signal.SIGHUP, signal.SIGUSR1] if hasattr(signal, "SIGHUP") else []
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the NutriSaas NLP API with pre-forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Number of inference worker processes (default: CPU count)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--uds", default=os.getenv("NLP_UDS_PATH"),
+                        help="Also serve the Unix domain socket protocol at this path (see uds_server.py)")
+    parser.add_argument("--log-level", default="info")
+    return parser.parse_args()
+
+
+def create_socket(host: str, port: int, backlog: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(worker_id: int, sock: socket.socket, service, log_level: str):
+    """Entry point of a forked worker: serve the shared app on the shared socket"""
+    # Drop the parent's supervisor handlers, uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    # Reload signals are handled by the app's lifespan once it runs; until
+    # then they must not kill the worker
+    for signum in RELOAD_SIGNALS:
+        signal.signal(signum, signal.SIG_IGN)
+
+    service.WORKER_ID = worker_id
+    service.WORKER_STARTED_AT = time.time()
+
+    config = uvicorn.Config(service.app, log_level=log_level, lifespan="on")
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if not hasattr(os, "fork") or args.workers <= 1:
+        # Windows (no fork) or a single worker: plain uvicorn
+        logger.info("Running a single worker process")
+        if args.uds:
+            os.environ["NLP_UDS_PATH"] = args.uds
+        uvicorn.run("main:app", host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    # Load and warm up the model and training data once, in the parent, so
+    # lazily-built state also lands in the shared pages
+    started = time.perf_counter()
+    import main as service
+    if not service.load_service():
+        logger.error("Model failed to load, not starting workers")
+        return 1
+    logger.info(f"Model loaded in parent in {time.perf_counter() - started:.2f}s")
+
+    sock = create_socket(args.host, args.port, args.backlog)
+    if args.uds:
+        # Shared by all workers like the TCP socket
+        from uds_server import bind_unix_socket
+        service.uds_socket = bind_unix_socket(args.uds, args.backlog)
+
+    # Move everything allocated so far out of the GC's reach, so collections
+    # in the workers don't touch (and therefore copy) the shared model pages
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    shutting_down = False
+
+    def spawn(worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(worker_id, sock, service, args.log_level)
+            finally:
+                os._exit(0)
+        workers[pid] = worker_id
+        logger.info(f"Started worker {worker_id} (pid {pid})")
+
+    def shutdown(signum, frame):
+        nonlocal shutting_down
+        shutting_down = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def forward(signum, frame):
+        logger.info(f"Forwarding signal {signum} to {len(workers)} workers")
+        for pid in list(workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    for signum in RELOAD_SIGNALS:
+        signal.signal(signum, forward)
+
+    for worker_id in range(args.workers):
+        spawn(worker_id)
+
+    logger.info(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    # Supervise: restart workers that die unexpectedly
+    while workers:
+        try:
+            pid, status = os.waitpid(-1, 0)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker_id = workers.pop(pid, None)
+        if worker_id is None:
+            continue
+        if not shutting_down:
+            logger.warning(f"Worker {worker_id} (pid {pid}) exited with status {status}, restarting")
+            spawn(worker_id)
+
+    sock.close()
+    if service.uds_socket is not None:
+        service.uds_socket.close()
+        os.unlink(args.uds)
+    logger.info("All workers stopped")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# shadow.py - Compare a candidate model with the serving one on live traffic
+
+import logging
+import queue
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+class ShadowEvaluator:
+    """Replay a sample of answered messages against a candidate model.
+
+    `submit()` is called once the primary answer is ready and never blocks:
+    sampled messages go to a bounded queue and are dropped (and counted) when
+    it is full. A single background thread runs `predict(message) ->
+    (intent, confidence)` on them and compares the answers. `prepare()`, if
+    given, runs before the first message of every configuration (e.g. to
+    load the candidate) so that its cost isn't counted as latency.
+    """
+
+    def __init__(self, predict: Callable[[str], Tuple[str, float]], prepare: Optional[Callable[[], None]] = None,
+                 sample_rate: float = 0.1, queue_size: int = 1000, latency_window: int = 10000,
+                 histogram=None, outcomes=None):
+        self.predict = predict
+        self.prepare = prepare
+        self.sample_rate = min(1.0, max(0.0, sample_rate))
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.latency_window = latency_window
+        # Optional Prometheus metrics: candidate latency and outcome counts
+        self.histogram = histogram
+        self.outcomes = outcomes
+        self._lock = threading.Lock()
+        self._thread = None
+        self._generation = 0
+        self._prepared = None
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self.started_at = time.time()
+        self.sampled = 0
+        self.dropped = 0
+        self.errors = 0
+        self.processed = 0
+        self.by_source = {}
+        self.latencies = deque(maxlen=self.latency_window)
+        self.disagreements = Counter()
+        self.recent_disagreements = deque(maxlen=20)
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def submit(self, message: str, intent: str, confidence: float, source: str) -> bool:
+        """Queue a copy of an answered message for the candidate, if sampled"""
+        if not self.enabled or self._thread is None:
+            return False
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return False
+        try:
+            self.queue.put_nowait((self._generation, message, intent, confidence, source))
+        except queue.Full:
+            self.dropped += 1
+            if self.outcomes is not None:
+                self.outcomes.inc("dropped")
+            return False
+        self.sampled += 1
+        return True
+
+    def reset(self, sample_rate: Optional[float] = None):
+        """Start over, e.g. with another candidate; queued messages are discarded"""
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = min(1.0, max(0.0, sample_rate))
+            self._generation += 1
+            self._reset_counters()
+
+    def start(self):
+        """Start the worker thread (per process: call it after forking)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="shadow-eval", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the worker; shadow work still queued is dropped"""
+        if self._thread is None:
+            return
+        thread, self._thread = self._thread, None
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put(None)
+        thread.join(timeout=5)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            generation, message, intent, confidence, source = item
+            if generation != self._generation:
+                continue
+            try:
+                if self.prepare is not None and self._prepared != generation:
+                    self.prepare()
+                    self._prepared = generation
+                started = time.perf_counter()
+                candidate_intent, candidate_confidence = self.predict(message)
+                seconds = time.perf_counter() - started
+            except Exception as e:
+                with self._lock:
+                    if generation == self._generation:
+                        self.errors += 1
+                        if self.errors == 1:
+                            logger.error(f"Shadow candidate failed: {str(e)}")
+                if self.outcomes is not None:
+                    self.outcomes.inc("error")
+                continue
+            self._record(generation, message, source, intent, confidence,
+                         candidate_intent, candidate_confidence, seconds)
+
+    def _record(self, generation: int, message: str, source: str, intent: str, confidence: float,
+                candidate_intent: str, candidate_confidence: float, seconds: float):
+        agreed = candidate_intent == intent
+        delta = candidate_confidence - confidence
+        with self._lock:
+            # Scored for a configuration that was reset meanwhile
+            if generation != self._generation:
+                return
+            self.processed += 1
+            stats = self.by_source.setdefault(source, {"processed": 0, "agreed": 0, "delta": 0.0, "abs_delta": 0.0})
+            stats["processed"] += 1
+            stats["agreed"] += agreed
+            stats["delta"] += delta
+            stats["abs_delta"] += abs(delta)
+            self.latencies.append(seconds)
+            if not agreed:
+                self.disagreements[(intent, candidate_intent)] += 1
+                self.recent_disagreements.append({
+                    "message": message,
+                    "source": source,
+                    "primary": {"intent": intent, "confidence": round(confidence, 4)},
+                    "candidate": {"intent": candidate_intent, "confidence": round(candidate_confidence, 4)},
+                })
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+        if self.outcomes is not None:
+            self.outcomes.inc("agree" if agreed else "disagree")
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_source = {source: dict(stats) for source, stats in self.by_source.items()}
+            latencies = sorted(self.latencies)
+            top = self.disagreements.most_common(10)
+            recent = list(self.recent_disagreements)
+            processed = self.processed
+
+        def summarize(stats: dict) -> dict:
+            n = stats["processed"]
+            return {
+                "processed": n,
+                "agreement": stats["agreed"] / n if n else None,
+                "mean_confidence_delta": round(stats["delta"] / n, 4) if n else None,
+                "mean_abs_confidence_delta": round(stats["abs_delta"] / n, 4) if n else None,
+            }
+
+        totals = {"processed": 0, "agreed": 0, "delta": 0.0, "abs_delta": 0.0}
+        for stats in by_source.values():
+            for field in totals:
+                totals[field] += stats[field]
+        overall = summarize(totals)
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None,
+            "since": self.started_at,
+            "sample_rate": self.sample_rate,
+            "queue_size": self.queue.maxsize,
+            "queued": self.queue.qsize(),
+            "sampled": self.sampled,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "processed": processed,
+            "agreement": overall["agreement"],
+            "mean_confidence_delta": overall["mean_confidence_delta"],
+            "mean_abs_confidence_delta": overall["mean_abs_confidence_delta"],
+            "by_source": {source: summarize(stats) for source, stats in by_source.items()},
+            "candidate_latency_ms": {
+                "window": len(latencies),
+                "p50": round(percentile(latencies, 0.50) * 1000.0, 3),
+                "p90": round(percentile(latencies, 0.90) * 1000.0, 3),
+                "p99": round(percentile(latencies, 0.99) * 1000.0, 3),
+                "max": round(latencies[-1] * 1000.0, 3) if latencies else 0.0,
+                "mean": round(sum(latencies) * 1000.0 / len(latencies), 3) if latencies else 0.0,
+            },
+            "top_disagreements": [
+                {"primary": primary, "candidate": candidate, "count": count}
+                for (primary, candidate), count in top
+            ],
+            "recent_disagreements": recent,
+        }
@@ -0,0 +1,36 @@
+# thresholds.py - Confidence thresholds written by evaluate.py
+#
+# Shared by the service (main.py) and the offline CLIs, which must not import
+# main.py: that builds the FastAPI app and reads the service configuration.
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Adjusted confidence threshold based on your model performance
+CONFIDENCE_THRESHOLD = 0.05  # Used when there is no thresholds file
+
+
+def default_thresholds() -> dict:
+    return {"global": CONFIDENCE_THRESHOLD, "per_intent": {}, "source": None}
+
+
+def load_thresholds(path: str) -> dict:
+    """Read a thresholds file written by evaluate.py, falling back to CONFIDENCE_THRESHOLD"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        loaded = {
+            "global": float(data.get("global", CONFIDENCE_THRESHOLD)),
+            "per_intent": {tag: float(value) for tag, value in data.get("per_intent", {}).items()},
+            "source": path,
+        }
+    except FileNotFoundError:
+        return default_thresholds()
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Thresholds file {path} is not usable, using {CONFIDENCE_THRESHOLD}: {str(e)}")
+        return default_thresholds()
+    logger.info(f"Thresholds loaded from {path} (global {loaded['global']:.4f}, "
+                f"{len(loaded['per_intent'])} per intent)")
+    return loaded
@@ -0,0 +1,244 @@
+# uds_server.py - Length-prefixed request/response transport over a Unix domain socket
+#
+# A lower-overhead alternative to HTTP/JSON for local callers (the Node
+# backend on the same host). Every frame is a 4-byte big-endian body length
+# followed by the body, encoded with msgpack (default) or JSON:
+#
+#   request:  {"message": "...", "userId": ..., "isAdmin": false, "id": ...}
+#   response: {"response": "...", "intent": "...", "confidence": 0.93, "id": ...}
+#             or {"error": "...", "id": ...}
+#
+# Connections are persistent and requests may be pipelined: the server reads
+# ahead (up to `max_in_flight` requests per connection), handles them
+# concurrently and writes the responses back in request order. "id" is
+# optional and echoed back unchanged.
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import stat
+import struct
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_BYTES = 1 << 20
+
+
+class JsonCodec:
+    name = "json"
+
+    @staticmethod
+    def dumps(value) -> bytes:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def loads(data: bytes):
+        return json.loads(data)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def __init__(self):
+        import msgpack
+        self._packb = msgpack.packb
+        self._unpackb = msgpack.unpackb
+
+    def dumps(self, value) -> bytes:
+        return self._packb(value, use_bin_type=True)
+
+    def loads(self, data: bytes):
+        return self._unpackb(data, raw=False)
+
+
+def get_codec(name: str):
+    if name == "json":
+        return JsonCodec()
+    if name == "msgpack":
+        return MsgpackCodec()
+    raise ValueError(f"Unknown codec '{name}' (use msgpack or json)")
+
+
+def bind_unix_socket(path: str, backlog: int = 2048) -> socket.socket:
+    """Listening socket at `path`, replacing a stale socket file left by a
+    previous run (but never a regular file)"""
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class UdsServer:
+    """Serve `handler(request) -> response` over length-prefixed frames"""
+
+    def __init__(self, handler: Callable[[dict], Awaitable[dict]], path: Optional[str] = None,
+                 sock: Optional[socket.socket] = None, codec: str = "msgpack", max_in_flight: int = 64):
+        if path is None and sock is None:
+            raise ValueError("UdsServer needs a path or a listening socket")
+        self.handler = handler
+        self.path = path or sock.getsockname()
+        self.sock = sock
+        self.codec = get_codec(codec)
+        self.max_in_flight = max(1, max_in_flight)
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self._server = None
+        self._owns_socket = sock is None
+
+    async def start(self):
+        if self.sock is None:
+            self.sock = bind_unix_socket(self.path)
+        self._server = await asyncio.start_unix_server(self._serve_connection, sock=self.sock)
+        logger.info(f"Unix socket listener on {self.path} ({self.codec.name})")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        # A socket passed in (serve.py) belongs to the parent process
+        if self._owns_socket:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "codec": self.codec.name,
+            "connections": self.connections,
+            "requests": self.requests,
+            "errors": self.errors,
+        }
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        # Handled requests, in arrival order; bounded so a client that never
+        # reads its responses can't make the server buffer without limit
+        pending = asyncio.Queue(maxsize=self.max_in_flight)
+        responder = asyncio.get_running_loop().create_task(self._write_responses(pending, writer))
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                (length,) = FRAME_HEADER.unpack(header)
+                if length > MAX_FRAME_BYTES:
+                    self.errors += 1
+                    await pending.put(self._error_frame(f"frame of {length} bytes exceeds {MAX_FRAME_BYTES}"))
+                    break
+                body = await reader.readexactly(length)
+                await pending.put(asyncio.get_running_loop().create_task(self._handle(body)))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await pending.put(None)
+            await responder
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.connections -= 1
+
+    async def _write_responses(self, pending: asyncio.Queue, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                body = await item if isinstance(item, asyncio.Task) else item
+                writer.write(FRAME_HEADER.pack(len(body)) + body)
+                # Pipelined responses that are already done go out in one write
+                if pending.empty():
+                    await writer.drain()
+        except ConnectionError:
+            # The client went away; drop what is still pending
+            while not pending.empty():
+                item = pending.get_nowait()
+                if isinstance(item, asyncio.Task):
+                    item.cancel()
+
+    async def _handle(self, body: bytes) -> bytes:
+        self.requests += 1
+        try:
+            request = self.codec.loads(body)
+        except Exception as e:
+            self.errors += 1
+            return self._error_frame(f"undecodable request: {e}")
+        if not isinstance(request, dict):
+            self.errors += 1
+            return self._error_frame("request must be a map")
+
+        try:
+            response = await self.handler(request)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Unix socket request failed: {str(e)}")
+            response = {"error": "internal error"}
+        if "id" in request:
+            response["id"] = request["id"]
+        return self.codec.dumps(response)
+
+    def _error_frame(self, message: str) -> bytes:
+        return self.codec.dumps({"error": message})
+
+
+class UdsClient:
+    """Blocking client for scripts, tests and benchmarks"""
+
+    def __init__(self, path: str, codec: str = "msgpack", timeout: Optional[float] = 10.0):
+        self.codec = get_codec(codec)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self._buffer = b""
+
+    def request(self, message: str, user_id=None, is_admin: bool = False) -> dict:
+        return self.request_many([{"message": message, "userId": user_id, "isAdmin": is_admin}])[0]
+
+    def request_many(self, requests: List[dict], window: int = 32) -> List[dict]:
+        """Pipeline the requests, `window` at a time: each window is sent
+        before any of its responses is read"""
+        responses = []
+        for start in range(0, len(requests), window):
+            batch = requests[start:start + window]
+            frames = []
+            for request in batch:
+                body = self.codec.dumps(request)
+                frames.append(FRAME_HEADER.pack(len(body)) + body)
+            self.sock.sendall(b"".join(frames))
+            responses.extend(self._read_frame() for _ in batch)
+        return responses
+
+    def _read_exactly(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(max(65536, size - len(self._buffer)))
+            if not chunk:
+                raise ConnectionError("connection closed by the server")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_frame(self):
+        (length,) = FRAME_HEADER.unpack(self._read_exactly(FRAME_HEADER.size))
+        return self.codec.loads(self._read_exactly(length))
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()